@@ -0,0 +1,33 @@
+# statements are written in the order first seen, parents before the rows referencing them
+class BatchWriter():
+    def __init__(self, conn, chunk_size=1000, statements=()):
+        self.conn = conn
+        self.chunk_size = max(1, int(chunk_size))
+        self._rows = {sql: [] for sql in statements}
+        self._pending = 0
+        self.rows = 0
+        self.calls = 0
+
+    def add(self, sql, row):
+        self._rows.setdefault(sql, []).append(row)
+        self._pending += 1
+        if self.chunk_size <= self._pending:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+
+        for sql, rows in self._rows.items():
+            if rows:
+                self.conn.executemany(sql, rows)
+                self.rows += len(rows)
+                self.calls += 1
+                rows.clear()
+
+        self._pending = 0
+
+    def discard(self):
+        for rows in self._rows.values():
+            rows.clear()
+        self._pending = 0
@@ -0,0 +1,90 @@
+#!python3
+import argparse
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from manager.converter_to_sqlite import ConverterToSqlite
+from manager.synthetic_data_src import SyntheticDataSrc, CODES_PER_ECU
+
+class QuietLogger():
+
+    def log(self, text):
+        pass
+
+def run(work_dir: Path, scale: float, codes_per_ecu=CODES_PER_ECU, jobs=1, cache=False, seed=0, profile="bulk", atomic=False):
+    """
+    Time a full conversion of the synthetic tree of the given scale, generated
+    under work_dir on first use. With cache, a cold and a warm build are timed.
+    """
+    data_src = work_dir / f"data-src-{scale:g}x-{codes_per_ecu}c-{seed}"
+    counts_file = data_src.with_name(data_src.name + ".json")
+    sqlite_db = work_dir / f"ad_database-{scale:g}x.sqlite"
+    cache_dir = work_dir / "cache"
+    result = {"scale": scale}
+
+    if not data_src.exists():
+        start = time.perf_counter()
+        tmp = data_src.with_name(data_src.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        counts = SyntheticDataSrc(tmp, scale, codes_per_ecu, seed).generate()
+        tmp.rename(data_src)
+        result["generate"] = time.perf_counter() - start
+        counts_file.write_text(json.dumps(counts))
+
+    result.update(json.loads(counts_file.read_text()))
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    for run_name in ("cold", "warm") if cache else ("build",):
+        sqlite_db.unlink(missing_ok=True)
+        converter = ConverterToSqlite(
+            plain_text_db=data_src,
+            sqlite_db=sqlite_db,
+            logger=QuietLogger(),
+            jobs=jobs,
+            cache_dir=cache_dir if cache else None,
+            profile=profile,
+            atomic=atomic,
+        )
+        start = time.perf_counter()
+        if not converter.to_sqlite(progress_callback=lambda current, total: None):
+            raise RuntimeError(f"conversion of {data_src} failed")
+        result[run_name] = time.perf_counter() - start
+
+    result["db_bytes"] = sqlite_db.stat().st_size
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the sqlite conversion of synthetic data-src trees")
+    parser.add_argument("--scales", default="1,10,100", help="comma separated scale factors (default: %(default)s)")
+    parser.add_argument("--work-dir", type=Path, default=Path("output") / "benchmark")
+    parser.add_argument("--codes-per-ecu", type=int, default=CODES_PER_ECU)
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--cache", action="store_true", help="time a cold and a warm YAML cache build")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--profile", choices=("bulk", "durable"), default="bulk", help="sqlite settings of the load")
+    parser.add_argument("--atomic", action="store_true", help="build into a new file swapped over the old one")
+    parser.add_argument("--json", type=Path, help="also write the results to this file")
+    args = parser.parse_args()
+
+    args.work_dir.mkdir(parents=True, exist_ok=True)
+    runs = ("cold", "warm") if args.cache else ("build",)
+    print(f"{'scale':>6} {'files':>9} {'dtc':>9} " + " ".join(f"{name + ' s':>9}" for name in runs) + f" {'files/s':>9}")
+
+    results = []
+    for scale in (float(s) for s in args.scales.split(",")):
+        result = run(args.work_dir, scale, args.codes_per_ecu, args.jobs, args.cache, args.seed, args.profile, args.atomic)
+        results.append(result)
+        print(
+            f"{scale:>6g} {result['files']:>9} {result['dtc']:>9} "
+            + " ".join(f"{result[name]:>9.2f}" for name in runs)
+            + f" {result['files'] / result[runs[0]]:>9.0f}"
+        )
+
+    if args.json:
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        args.json.write_text(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!python3
+import argparse
+import datetime
+import random
+import re
+import time
+from zoneinfo import ZoneInfo
+from manager.converter_to_sqlite import TIMEZONE_ALIASES, _parse_timestamp, timestamp
+
+# shapes met in data-src besides "YYYY-MM-DD HH:MM:SS TZ"
+OTHER_SHAPES = [
+    "1784322875000",
+    "2026-07-17T23:08:21+02:00",
+    "2026-07-17 23:08:21",
+    " 2026-07-17 23:08:21 cest ",
+    "2026-07-17 23:08:21.250 CET",
+    "2026-03-29 02:30:00 CEST",
+    "2026-10-25 02:30:00 CEST",
+    "2026-02-30 10:00:00 CEST",
+    "2026-07-17 23:08:21 XYZ",
+    "2026-07-17 23:08:21\tCEST",
+    "2026-07-17 23:08:21  CEST",
+    "2026-07-17 23:08:21 CE\u017fT",
+]
+
+def legacy_timestamp(ts):
+    """
+    timestamp() of a string before the cache and the fast path, the reference results.
+    """
+    if ts.isdigit():
+        return int(ts)
+
+    match = re.fullmatch(r"(.*)\s+([A-Za-z]{2,5})", ts.strip())
+    if match:
+        value, timezone = match.groups()
+        zone = TIMEZONE_ALIASES.get(timezone.upper())
+        if zone:
+            dt = datetime.datetime.fromisoformat(value)
+            dt = dt.replace(tzinfo=ZoneInfo(zone))
+            return int(dt.timestamp() * 1000)
+
+    return int(datetime.datetime.fromisoformat(ts).timestamp() * 1000)
+
+def _outcome(parse, ts):
+    try:
+        return parse(ts)
+    except ValueError:
+        return ValueError
+
+def workload(count, distinct, seed=0):
+    """
+    count created/updated strings drawn from distinct values, like the files of data-src.
+    """
+    rng = random.Random(seed)
+    zones = sorted(TIMEZONE_ALIASES)
+    values = [
+        f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} "
+        f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d} "
+        f"{rng.choice(['CEST', 'CET'] * 8 + zones)}"
+        for _ in range(distinct)
+    ]
+    return [rng.choice(values) for _ in range(count)]
+
+def _time(parse, values, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for ts in values:
+            parse(ts)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the parsing of created/updated strings by timestamp()")
+    parser.add_argument("--count", type=int, default=200000, help="strings parsed per run (default: %(default)s)")
+    parser.add_argument("--distinct", type=int, default=3000, help="distinct strings among them (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs, the best one is kept (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    values = workload(args.count, args.distinct, args.seed)
+
+    checked = sorted(set(values)) + OTHER_SHAPES
+    mismatches = [ts for ts in checked if _outcome(legacy_timestamp, ts) != _outcome(timestamp, ts)]
+    print(f"{len(checked)} distinct strings compared with the previous parser, {len(mismatches)} mismatches")
+    for ts in mismatches[:10]:
+        print(f"  {ts!r}: {_outcome(legacy_timestamp, ts)} != {_outcome(timestamp, ts)}")
+
+    def uncached(ts):
+        return _parse_timestamp.__wrapped__(ts)
+
+    def cold(ts):
+        return timestamp(ts)
+
+    runs = (
+        ("previous parser", legacy_timestamp),
+        ("fast path, no cache", uncached),
+        ("timestamp()", cold),
+    )
+    print(f"{'parser':<20} {'total ms':>10} {'ns/call':>10}")
+    for name, parse in runs:
+        _parse_timestamp.cache_clear()
+        elapsed = _time(parse, values, args.repeat)
+        print(f"{name:<20} {elapsed * 1000:>10.1f} {elapsed / len(values) * 1e9:>10.0f}")
+
+    if mismatches:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
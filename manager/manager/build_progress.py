@@ -0,0 +1,83 @@
+import time
+
+def count_files(files):
+    """
+    Files loaded by a full build in a manifest scan: everything but the
+    manufacturer def.yml files directly below mcu/, ecu/, engine/ and vehicle/.
+    """
+    return sum(1 for path in files if 2 < path.count("/"))
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+def describe(info):
+    """
+    Short text for the information given to an info callback.
+    """
+    if not info:
+        return ""
+    return f"{info['stage']} {info['files_per_s']:.0f} files/s {info['rows_per_s']:.0f} rows/s ETA {format_eta(info['eta'])}"
+
+class BuildProgress():
+    """
+    Counts the files loaded by a build and calls callback(current, total) at most
+    once per interval seconds, so a GUI is not flooded with updates. info_callback,
+    when given, is called just before with info: the stage name, files/s, rows/s
+    (rows changed on conn) and the ETA in seconds.
+    """
+
+    def __init__(self, callback, total, info_callback=None, interval=0.25):
+        self.callback = callback
+        self.info_callback = info_callback
+        self.total = max(1, total)
+        self.interval = interval
+        self.current = 0
+        self.stage_name = ""
+        self._conn = None
+        self._changes_start = 0
+        self._rows = 0
+        self._started = time.perf_counter()
+        self._reported = 0
+
+    def stage(self, name, conn=None):
+        if conn is not self._conn:
+            self._rows += self._changes()
+            self._conn = conn
+            self._changes_start = conn.total_changes if conn is not None else 0
+        self.stage_name = name
+        self.report()
+
+    def _changes(self):
+        if self._conn is None:
+            return 0
+        return self._conn.total_changes - self._changes_start
+
+    def advance(self, n=1):
+        self.current += n
+        if self.interval <= time.perf_counter() - self._reported:
+            self.report()
+
+    def report(self):
+        now = time.perf_counter()
+        self._reported = now
+        elapsed = max(now - self._started, 1e-9)
+        current = min(self.current, self.total)
+        files_per_s = current / elapsed
+
+        if self.info_callback is not None:
+            self.info_callback({
+                "stage": self.stage_name,
+                "files_per_s": files_per_s,
+                "rows_per_s": (self._rows + self._changes()) / elapsed,
+                "eta": (self.total - current) / files_per_s if files_per_s else None,
+            })
+        self.callback(current, self.total)
+
+    def finish(self):
+        self.current = self.total
+        self.stage_name = "done"
+        self.report()
@@ -0,0 +1,505 @@
+#!python3
+import argparse
+import gzip
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from manager.converter_to_sqlite import refresh_dtc_flat
+
+FORMAT = "ad_changeset"
+VERSION = 1
+
+# Tables compared by natural key, referenced tables first.
+# (key columns, value columns), "column:table" holds the id of a row of table and
+# is written as the natural key of that row. Tables with an id column get new ids
+# when a changeset inserts rows, so ids differ between a patched and a built database.
+TABLES = {
+    "ad_manufacturer": (("name",), ("name_key",)),
+    "ad_evidence": (("text",), ()),
+    "ad_dtc_standard": (("name",), ()),
+    "ad_diag_protocol": (("name",), ()),
+    "ad_dtc_system": (("name",), ()),
+    "ad_dtc_subsystem": (("name",), ()),
+    "ad_dtc_category": (("name",), ()),
+    "ad_dtc_severity": (("name",), ()),
+    "ad_mcu": (("manufacturer_id:ad_manufacturer", "model"), ("model_key", "created", "updated")),
+    "ad_ecu": (
+        ("manufacturer_id:ad_manufacturer", "model"),
+        ("mcu_id:ad_mcu", "model_key", "type", "created", "updated"),
+    ),
+    "ad_engine": (("manufacturer_id:ad_manufacturer", "code"), ("code_key", "fuel", "created", "updated")),
+    "ad_engine_name": (("engine_id:ad_engine", "name"), ("name_key",)),
+    "ad_vehicle": (("manufacturer_id:ad_manufacturer", "model"), ("model_key", "type", "created", "updated")),
+    "ad_vehicle_version": (("vehicle_id:ad_vehicle", "version"), ("year", "created", "updated")),
+    "ad_vehicle_version_config": (
+        ("vehicle_version_id:ad_vehicle_version", "engine_id:ad_engine", "power_kw"),
+        (),
+    ),
+    "ad_vehicle_version_config_ecu": (("config_id:ad_vehicle_version_config", "ecu_id:ad_ecu"), ()),
+    "ad_vehicle_version_config_ecu_protocol": (
+        ("vehicle_version_config_ecu_id:ad_vehicle_version_config_ecu", "protocol"),
+        (),
+    ),
+    "ad_vehicle_version_config_ecu_protocol_param": (
+        ("protocol_id:ad_vehicle_version_config_ecu_protocol", "name"),
+        ("value_text", "value_integer", "value_real"),
+    ),
+    "ad_manufacturer_evidence": (("manufacturer_id:ad_manufacturer", "evidence_id:ad_evidence"), ()),
+    "ad_mcu_evidence": (("mcu_id:ad_mcu", "evidence_id:ad_evidence"), ()),
+    "ad_ecu_evidence": (("ecu_id:ad_ecu", "evidence_id:ad_evidence"), ()),
+    "ad_engine_evidence": (("engine_id:ad_engine", "evidence_id:ad_evidence"), ()),
+    "ad_vehicle_evidence": (("vehicle_id:ad_vehicle", "evidence_id:ad_evidence"), ()),
+    "ad_vehicle_version_evidence": (("vehicle_version_id:ad_vehicle_version", "evidence_id:ad_evidence"), ()),
+    "ad_vehicle_version_config_evidence": (
+        ("config_id:ad_vehicle_version_config", "evidence_id:ad_evidence"),
+        (),
+    ),
+    "ad_dtc": (
+        ("ecu_id:ad_ecu", "code"),
+        ("definition", "description", "mil", "created", "updated", "detection_condition", "causes", "repairs"),
+    ),
+    "ad_dtc_evidence": (("dtc_id:ad_dtc", "evidence_id:ad_evidence"), ()),
+    "ad_dtc_standard_link": (("dtc_id:ad_dtc", "standard_id:ad_dtc_standard"), ()),
+    "ad_dtc_protocol_link": (("dtc_id:ad_dtc", "protocol_id:ad_diag_protocol"), ()),
+    "ad_dtc_system_link": (("dtc_id:ad_dtc", "system_id:ad_dtc_system"), ()),
+    "ad_dtc_subsystem_link": (("dtc_id:ad_dtc", "subsystem_id:ad_dtc_subsystem"), ()),
+    "ad_dtc_category_link": (("dtc_id:ad_dtc", "category_id:ad_dtc_category"), ()),
+    "ad_dtc_severity_link": (("dtc_id:ad_dtc", "severity_id:ad_dtc_severity"), ()),
+    "ad_dtc_related": (("dtc_id:ad_dtc", "related_dtc_id:ad_dtc"), ()),
+}
+
+# ad_conflict.entity_type is the table of entity_id without the ad_ prefix.
+# An entity can have several conflicts on the same field, so the conflicts of an
+# entity are compared and replaced as a whole.
+CONFLICT_TABLES = ("ad_mcu", "ad_ecu", "ad_engine", "ad_vehicle", "ad_vehicle_version")
+
+class ChangesetError(Exception):
+    pass
+
+def _column(spec):
+    column, _, table = spec.partition(":")
+    return column, table or None
+
+def _dumps(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+def _checksum(states):
+    """
+    states: {(table, key json): state} where state is the values of the row, or None when it is absent.
+    """
+    digest = hashlib.sha256()
+    for (table, key), state in sorted(states.items()):
+        digest.update(_dumps([table, key, state]).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+def _has_id(conn, table):
+    return any(row[1] == "id" for row in conn.execute(f"pragma table_info({table})"))
+
+class _Keys():
+    """
+    Natural key of a row from its id and back, for the rows a changeset touches.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._keys = {}
+        self._ids = {}
+
+    def key(self, table, row_id):
+        if row_id is None:
+            return None
+        if (table, row_id) not in self._keys:
+            columns = [_column(spec) for spec in TABLES[table][0]]
+            row = self.conn.execute(
+                f"select {', '.join(c for c, _ in columns)} from {table} where id = ?", (row_id,)
+            ).fetchone()
+            key = None if row is None else [
+                self.key(ref, value) if ref else value for (_, ref), value in zip(columns, row)
+            ]
+            self._keys[(table, row_id)] = key
+        return self._keys[(table, row_id)]
+
+    def where(self, table, key):
+        """
+        Where clause and parameters matching the row of this natural key, None if a referenced row is missing.
+        """
+        columns, params = [], []
+        for spec, value in zip(TABLES[table][0], key):
+            column, ref = _column(spec)
+            if ref and value is not None:
+                value = self.id(ref, value)
+                if value is None:
+                    return None
+            columns.append(f"{column} is ?")
+            params.append(value)
+        return " and ".join(columns), params
+
+    def id(self, table, key):
+        cache_key = (table, _dumps(key))
+        if cache_key not in self._ids:
+            where = self.where(table, key)
+            row = None if where is None else self.conn.execute(
+                f"select id from {table} where {where[0]}", where[1]
+            ).fetchone()
+            self._ids[cache_key] = row[0] if row else None
+        return self._ids[cache_key]
+
+    def forget(self, table, key):
+        self._ids.pop((table, _dumps(key)), None)
+
+    def state(self, table, key):
+        """
+        Values of the row of this natural key, None if there is none.
+        """
+        where = self.where(table, key)
+        if where is None:
+            return None
+        columns = [_column(spec) for spec in TABLES[table][1]]
+        row = self.conn.execute(
+            f"select 1{''.join(', ' + c for c, _ in columns)} from {table} where {where[0]}", where[1]
+        ).fetchone()
+        if row is None:
+            return None
+        return [self.key(ref, value) if ref else value for (_, ref), value in zip(columns, row[1:])]
+
+    def conflicts(self, entity_table, key):
+        entity_id = self.id(entity_table, key)
+        if entity_id is None:
+            return None
+        return _conflict_groups(self.conn, self, entity_table, [entity_id]).get(entity_id)
+
+def _conflict_groups(conn, keys, entity_table, entity_ids=None):
+    """
+    {entity id: sorted conflicts} of an entity table, conflicts being [field, created, values]
+    and values [value_text, ref table, ref key, sorted evidence].
+    """
+    entity_type = entity_table[3:]
+    sql = """
+        select c.id, c.entity_id, c.field, c.created, v.id, v.value_text, v.ref_entity_type, v.ref_entity_id
+        from ad_conflict c
+        left join ad_conflict_value v on v.conflict_id = c.id
+        where c.entity_type = ?
+    """
+    params = [entity_type]
+    if entity_ids is not None:
+        sql += f" and c.entity_id in ({', '.join('?' * len(entity_ids))})"
+        params += entity_ids
+
+    evidence = {}
+    conflicts = {}
+    rows = conn.execute(sql, params).fetchall()
+    value_ids = [row[4] for row in rows if row[4] is not None]
+    for start in range(0, len(value_ids), 500):
+        chunk = value_ids[start:start + 500]
+        for value_id, text in conn.execute(f"""
+            select l.conflict_value_id, e.text
+            from ad_conflict_value_evidence l
+            join ad_evidence e on e.id = l.evidence_id
+            where l.conflict_value_id in ({', '.join('?' * len(chunk))})
+        """, chunk):
+            evidence.setdefault(value_id, []).append(text)
+
+    for conflict_id, entity_id, field, created, value_id, value_text, ref_type, ref_id in rows:
+        conflict = conflicts.setdefault(conflict_id, (entity_id, [field, created, []]))[1]
+        if value_id is not None:
+            ref_table = f"ad_{ref_type}" if ref_type else None
+            conflict[2].append([
+                value_text,
+                ref_table,
+                keys.key(ref_table, ref_id) if ref_table else None,
+                sorted(evidence.get(value_id, [])),
+            ])
+
+    groups = {}
+    for entity_id, conflict in conflicts.values():
+        conflict[2].sort(key=_dumps)
+        groups.setdefault(entity_id, []).append(conflict)
+    return {entity_id: sorted(group, key=_dumps) for entity_id, group in groups.items()}
+
+def _dump_table(conn, table, keys_by_id):
+    """
+    {key json: (key, values)} of every row of table, keys_by_id holds the id -> key
+    maps of the tables dumped before and gets the one of this table.
+    """
+    key_columns = [_column(spec) for spec in TABLES[table][0]]
+    value_columns = [_column(spec) for spec in TABLES[table][1]]
+    has_id = _has_id(conn, table)
+    columns = (["id"] if has_id else []) + [c for c, _ in key_columns + value_columns]
+    ids = keys_by_id.setdefault(table, {})
+    rows = {}
+
+    for row in conn.execute(f"select {', '.join(columns)} from {table}"):
+        row_id, row = (row[0], row[1:]) if has_id else (None, row)
+        values = [
+            keys_by_id[ref].get(value) if ref and value is not None else value
+            for (_, ref), value in zip(key_columns + value_columns, row)
+        ]
+        key = values[:len(key_columns)]
+        key_json = _dumps(key)
+        if key_json in rows:
+            raise ChangesetError(f"{table} has several rows with the key {key_json}")
+        rows[key_json] = (key, values[len(key_columns):])
+        if has_id:
+            ids[row_id] = key
+    return rows
+
+class _DumpKeys():
+    def __init__(self, keys_by_id):
+        self.keys_by_id = keys_by_id
+
+    def key(self, table, row_id):
+        return self.keys_by_id[table].get(row_id)
+
+def _dump(conn):
+    keys_by_id = {}
+    tables = {table: _dump_table(conn, table, keys_by_id) for table in TABLES}
+    keys = _DumpKeys(keys_by_id)
+    conflicts = {}
+    for entity_table in CONFLICT_TABLES:
+        conflicts[entity_table] = {
+            _dumps(keys_by_id[entity_table][entity_id]): (keys_by_id[entity_table][entity_id], group)
+            for entity_id, group in _conflict_groups(conn, keys, entity_table).items()
+        }
+    return tables, conflicts
+
+def diff(old_db: Path, new_db: Path):
+    """
+    Changeset turning the content of old_db into the one of new_db, rows being matched by natural key.
+    ops are applied in order: inserts and updates from the referenced tables down,
+    then the conflicts of the entities that changed, then deletes from the referencing tables up.
+    """
+    old_conn = sqlite3.connect(old_db)
+    new_conn = sqlite3.connect(new_db)
+    try:
+        old_tables, old_conflicts = _dump(old_conn)
+        new_tables, new_conflicts = _dump(new_conn)
+    finally:
+        old_conn.close()
+        new_conn.close()
+
+    upserts, conflict_ops, deletes = [], [], []
+    before, after = {}, {}
+
+    for table in TABLES:
+        old, new = old_tables[table], new_tables[table]
+        for key_json, (key, values) in new.items():
+            if key_json not in old:
+                upserts.append(["insert", table, key, values])
+            elif old[key_json][1] != values:
+                upserts.append(["update", table, key, values])
+            else:
+                continue
+            before[(table, key_json)] = old[key_json][1] if key_json in old else None
+            after[(table, key_json)] = values
+        for key_json, (key, values) in old.items():
+            if key_json not in new:
+                deletes.append(["delete", table, key])
+                before[(table, key_json)] = values
+                after[(table, key_json)] = None
+
+    for entity_table in CONFLICT_TABLES:
+        old, new = old_conflicts[entity_table], new_conflicts[entity_table]
+        for key_json in sorted(old.keys() | new.keys()):
+            old_group = old[key_json][1] if key_json in old else None
+            new_group = new[key_json][1] if key_json in new else None
+            if old_group == new_group:
+                continue
+            key = (new.get(key_json) or old.get(key_json))[0]
+            conflict_ops.append(["conflicts", entity_table, key, new_group])
+            before[("ad_conflict:" + entity_table, key_json)] = old_group
+            after[("ad_conflict:" + entity_table, key_json)] = new_group
+
+    deletes.reverse()
+    return {
+        "format": FORMAT,
+        "version": VERSION,
+        "from": _checksum(before),
+        "to": _checksum(after),
+        "ops": upserts + conflict_ops + deletes,
+    }
+
+def write(changeset, path: Path):
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write(_dumps(changeset))
+
+def read(path: Path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        changeset = json.load(f)
+    if changeset.get("format") != FORMAT or changeset.get("version") != VERSION:
+        raise ChangesetError(f"{path} is not a version {VERSION} changeset")
+    return changeset
+
+def _states(keys, ops):
+    states = {}
+    for op, table, key, *_ in ops:
+        if op == "conflicts":
+            states[("ad_conflict:" + table, _dumps(key))] = keys.conflicts(table, key)
+        else:
+            states[(table, _dumps(key))] = keys.state(table, key)
+    return states
+
+def _params(keys, table, specs, values):
+    params = []
+    for spec, value in zip(specs, values):
+        column, ref = _column(spec)
+        if ref and value is not None:
+            value = keys.id(ref, value)
+            if value is None:
+                raise ChangesetError(f"{table}.{column} references a missing row of {ref}")
+        params.append(value)
+    return params
+
+def _dtc_ids(conn, keys, table, key):
+    """
+    Ids of the DTCs whose ad_dtc_flat row depends on this row.
+    """
+    if table == "ad_dtc":
+        return [keys.id(table, key)]
+    if table == "ad_ecu":
+        ecu_id = keys.id(table, key)
+        return [row[0] for row in conn.execute("select id from ad_dtc where ecu_id = ?", (ecu_id,))]
+    if table.startswith("ad_dtc_") and TABLES[table][0][0] == "dtc_id:ad_dtc":
+        return [keys.id("ad_dtc", key[0])]
+    return []
+
+def _apply_op(conn, keys, op, table, key, values=None):
+    key_specs, value_specs = TABLES.get(table, ((), ()))
+
+    if op == "insert":
+        columns = [_column(spec)[0] for spec in key_specs + value_specs]
+        params = _params(keys, table, key_specs, key) + _params(keys, table, value_specs, values)
+        conn.execute(
+            f"insert into {table}({', '.join(columns)}) values ({', '.join('?' * len(columns))})",
+            params,
+        )
+        keys.forget(table, key)
+    elif op == "update":
+        where, where_params = keys.where(table, key)
+        columns = [_column(spec)[0] for spec in value_specs]
+        conn.execute(
+            f"update {table} set {', '.join(c + ' = ?' for c in columns)} where {where}",
+            _params(keys, table, value_specs, values) + where_params,
+        )
+    elif op == "delete":
+        where, where_params = keys.where(table, key)
+        conn.execute(f"delete from {table} where {where}", where_params)
+        keys.forget(table, key)
+    elif op == "conflicts":
+        _replace_conflicts(conn, keys, table, key, values)
+    else:
+        raise ChangesetError(f"unknown operation {op}")
+
+def _replace_conflicts(conn, keys, entity_table, key, group):
+    entity_type = entity_table[3:]
+    entity_id = keys.id(entity_table, key)
+    if entity_id is None:
+        raise ChangesetError(f"conflicts of a missing row of {entity_table}")
+
+    conflict_ids = "select id from ad_conflict where entity_type = ? and entity_id = ?"
+    conn.execute(f"""
+        delete from ad_conflict_value_evidence
+        where conflict_value_id in (select id from ad_conflict_value where conflict_id in ({conflict_ids}))
+    """, (entity_type, entity_id))
+    conn.execute(f"delete from ad_conflict_value where conflict_id in ({conflict_ids})", (entity_type, entity_id))
+    conn.execute("delete from ad_conflict where entity_type = ? and entity_id = ?", (entity_type, entity_id))
+
+    for field, created, values in group or []:
+        conflict_id = conn.execute(
+            "insert into ad_conflict(entity_type, entity_id, field, created) values (?, ?, ?, ?)",
+            (entity_type, entity_id, field, created),
+        ).lastrowid
+        for value_text, ref_table, ref_key, evidence in values:
+            ref_id = keys.id(ref_table, ref_key) if ref_table else None
+            if ref_table and ref_id is None:
+                raise ChangesetError(f"conflict value references a missing row of {ref_table}")
+            value_id = conn.execute(
+                "insert into ad_conflict_value(conflict_id, value_text, ref_entity_type, ref_entity_id) values (?, ?, ?, ?)",
+                (conflict_id, value_text, ref_table[3:] if ref_table else None, ref_id),
+            ).lastrowid
+            for text in evidence:
+                evidence_id = keys.id("ad_evidence", [text])
+                if evidence_id is None:
+                    raise ChangesetError("conflict value evidence is missing from ad_evidence")
+                conn.execute(
+                    "insert or ignore into ad_conflict_value_evidence(conflict_value_id, evidence_id) values (?, ?)",
+                    (value_id, evidence_id),
+                )
+
+def apply(db: Path, changeset):
+    """
+    Patch db in place in one transaction. The rows the changeset touches must match
+    its "from" checksum before and its "to" checksum after, else nothing is changed.
+    ad_dtc_flat and ad_dtc_fts are refreshed for the DTCs involved, the build manifest
+    is emptied since the files it describes are not the ones of the patched content.
+    """
+    ops = changeset["ops"]
+    conn = sqlite3.connect(db, isolation_level=None)
+    try:
+        conn.execute("pragma foreign_keys = on")
+        conn.execute("begin immediate")
+
+        if _checksum(_states(_Keys(conn), ops)) != changeset["from"]:
+            raise ChangesetError(f"{db} does not hold the content this changeset was made from")
+
+        keys = _Keys(conn)
+        dtc_ids = set()
+        for op, table, key, *values in ops:
+            if op == "delete":
+                dtc_ids.update(_dtc_ids(conn, keys, table, key))
+            _apply_op(conn, keys, op, table, key, *values)
+            if op != "delete" and op != "conflicts":
+                dtc_ids.update(_dtc_ids(conn, keys, table, key))
+
+        if conn.execute("select 1 from sqlite_master where name = 'ad_dtc_flat'").fetchone():
+            refresh_dtc_flat(conn, dtc_ids - {None})
+        # the manifest kept next to the database no longer describes it
+        if conn.execute("select 1 from sqlite_master where name = 'ad_build'").fetchone():
+            conn.execute("delete from ad_build")
+
+        if _checksum(_states(_Keys(conn), ops)) != changeset["to"]:
+            raise ChangesetError(f"{db} does not match the changeset once patched")
+
+        conn.execute("commit")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("rollback")
+        raise
+    finally:
+        conn.close()
+
+    return len(ops)
+
+def main():
+    parser = argparse.ArgumentParser(description="Diff two sqlite builds into a changeset, or patch a database with one")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    diff_parser = commands.add_parser("diff", help="write the changes from old to new")
+    diff_parser.add_argument("old", type=Path)
+    diff_parser.add_argument("new", type=Path)
+    diff_parser.add_argument("changeset", type=Path)
+
+    apply_parser = commands.add_parser("apply", help="patch db in place")
+    apply_parser.add_argument("db", type=Path)
+    apply_parser.add_argument("changeset", type=Path)
+
+    args = parser.parse_args()
+    start = time.perf_counter()
+
+    try:
+        if args.command == "diff":
+            changeset = diff(args.old, args.new)
+            write(changeset, args.changeset)
+            print(f"{len(changeset['ops'])} changes, {args.changeset.stat().st_size} bytes, {time.perf_counter() - start:.2f}s")
+        else:
+            count = apply(args.db, read(args.changeset))
+            print(f"{count} changes applied to {args.db}, {time.perf_counter() - start:.2f}s")
+    except ChangesetError as e:
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,34 @@
 #!python3
-import sys
+import argparse
 import sqlite3
-import yaml
 from pathlib import Path
 import json
 import datetime
 from tqdm import tqdm
 from manager.vpic_sqlite_loader import VpicToSqliteLoader
 from manager.tab.import_vehicle import slug
+from manager import yaml_io
+from manager import manifest
+from manager.identity_map import IdentityMap, like_key
+from manager.batch_writer import BatchWriter
+from manager import sqlite_profile
+from manager import yaml_cache
+from manager import lite_database
+from manager.yaml_cache import YamlCache
+from manager.stage_profiler import StageProfiler
+from manager.build_progress import BuildProgress, count_files, describe
 import datetime
 import re
 import time
+import os
+import posixpath
+import shutil
+import pickle
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
 from zoneinfo import ZoneInfo
 
 TIMEZONE_ALIASES = {
@@ -31,6 +49,52 @@ TIMEZONE_ALIASES = {
     "HST": "Pacific/Honolulu",
 }
 
+# distinct strings kept parsed, data-src repeats a few thousand created/updated values
+TIMESTAMP_CACHE_SIZE = 1 << 16
+
+@lru_cache(maxsize=64)
+def _zone(alias):
+    zone = TIMEZONE_ALIASES.get(alias)
+    return ZoneInfo(zone) if zone else None
+
+def _fast_timestamp(ts):
+    # "<date time> TZ" without the regex, None for any other shape
+    value, _, alias = ts.rpartition(" ")
+    if not value or value[-1].isspace() or not (2 <= len(alias) <= 5 and alias.isascii() and alias.isalpha()):
+        return None
+    zone = _zone(alias.upper())
+    if zone is None:
+        return None
+    return int(datetime.datetime.fromisoformat(value).replace(tzinfo=zone).timestamp() * 1000)
+
+@lru_cache(maxsize=TIMESTAMP_CACHE_SIZE)
+def _parse_timestamp(ts):
+    if ts.isdigit():
+        return int(ts)
+
+    stripped = ts.strip()
+    fast = _fast_timestamp(stripped)
+    if fast is not None:
+        return fast
+
+    match = re.fullmatch(
+        r"(.*)\s+([A-Za-z]{2,5})",
+        stripped,
+    )
+
+    if match:
+        value, timezone = match.groups()
+        zone = _zone(timezone.upper())
+
+        if zone:
+            dt = datetime.datetime.fromisoformat(value)
+            dt = dt.replace(tzinfo=zone)
+            return int(dt.timestamp() * 1000)
+
+    return int(
+        datetime.datetime.fromisoformat(ts).timestamp() * 1000
+    )
+
 def timestamp(ts=None):
     if ts is None:
         return time.time_ns() // 1_000_000
@@ -39,55 +103,664 @@ def timestamp(ts=None):
         return ts
 
     if isinstance(ts, str):
-        if ts.isdigit():
-            return int(ts)
+        return _parse_timestamp(ts)
 
-        match = re.fullmatch(
-            r"(.*)\s+([A-Za-z]{2,5})",
-            ts.strip(),
-        )
+    raise TypeError(f"unsupported timestamp: {ts!r}")
 
-        if match:
-            value, timezone = match.groups()
-            timezone = timezone.upper()
+class FullRebuildRequired(Exception):
+    pass
 
-            zone = TIMEZONE_ALIASES.get(timezone)
+def read_yaml_file(path):
+    return yaml_io.read_yaml(path)
 
-            if zone:
-                dt = datetime.datetime.fromisoformat(value)
-                dt = dt.replace(tzinfo=ZoneInfo(zone))
-                return int(dt.timestamp() * 1000)
+def key_filter(column, value):
+    # lower(field) LIKE lower(slug(value)) as an index range on the literal prefix of the pattern
+    pattern = slug(value).lower()
+    prefix = pattern.split("_", 1)[0]
 
-        return int(
-            datetime.datetime.fromisoformat(ts).timestamp() * 1000
-        )
+    if prefix == pattern:
+        return f"{column} = ?", (pattern,)
+    if not prefix:
+        return f"{column} LIKE ?", (pattern,)
 
-    raise TypeError(f"unsupported timestamp: {ts!r}")
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return f"{column} >= ? and {column} < ? and {column} LIKE ?", (prefix, upper, pattern)
+
+def read_yaml_files(paths):
+    return [read_yaml_file(path) for path in paths]
+
+DTC_SHARD_SCHEMA = """
+    create table dtc(
+        seq integer primary key,
+        part integer not null,
+        name text not null,
+        code,
+        definition,
+        description,
+        mil,
+        created,
+        updated,
+        detection_condition,
+        causes,
+        repairs
+    );
+    create table dtc_evidence(seq integer not null, text);
+    create table dtc_taxonomy(seq integer not null, kind text not null, name);
+    create table dtc_related(seq integer not null, code);
+"""
+
+# rows of ad_dtc_flat, links and dtcs are where clauses restricting them to some DTCs
+DTC_FLAT_SELECT = """
+    with
+    standards as (
+        select l.dtc_id, group_concat(distinct x.name) as names
+        from ad_dtc_standard_link l
+        join ad_dtc_standard x on x.id = l.standard_id
+        {links}
+        group by l.dtc_id
+    ),
+    protocols as (
+        select l.dtc_id, group_concat(distinct x.name) as names
+        from ad_dtc_protocol_link l
+        join ad_diag_protocol x on x.id = l.protocol_id
+        {links}
+        group by l.dtc_id
+    ),
+    systems as (
+        select l.dtc_id, group_concat(distinct x.name) as names
+        from ad_dtc_system_link l
+        join ad_dtc_system x on x.id = l.system_id
+        {links}
+        group by l.dtc_id
+    ),
+    subsystems as (
+        select l.dtc_id, group_concat(distinct x.name) as names
+        from ad_dtc_subsystem_link l
+        join ad_dtc_subsystem x on x.id = l.subsystem_id
+        {links}
+        group by l.dtc_id
+    ),
+    categories as (
+        select l.dtc_id, group_concat(distinct x.name) as names
+        from ad_dtc_category_link l
+        join ad_dtc_category x on x.id = l.category_id
+        {links}
+        group by l.dtc_id
+    ),
+    severities as (
+        select l.dtc_id, group_concat(distinct x.name) as names
+        from ad_dtc_severity_link l
+        join ad_dtc_severity x on x.id = l.severity_id
+        {links}
+        group by l.dtc_id
+    ),
+    related as (
+        select l.dtc_id, group_concat(distinct x.code) as codes
+        from ad_dtc_related l
+        join ad_dtc x on x.id = l.related_dtc_id
+        {links}
+        group by l.dtc_id
+    ),
+    evidence as (
+        select l.dtc_id, group_concat(x.text, char(10)) as texts
+        from ad_dtc_evidence l
+        join ad_evidence x on x.id = l.evidence_id
+        {links}
+        group by l.dtc_id
+    )
+    select
+        d.id as dtc_id,
+        d.code,
+        upper(d.code) as code_key,
+        d.ecu_id,
+        m.name as manufacturer,
+        e.model as ecu_model,
+        e.type as ecu_type,
+        d.definition,
+        d.description,
+        d.mil,
+        d.created,
+        d.updated,
+        d.detection_condition,
+        d.causes,
+        d.repairs,
+        standards.names as standards,
+        protocols.names as protocols,
+        systems.names as systems,
+        subsystems.names as subsystems,
+        categories.names as categories,
+        severities.names as severities,
+        related.codes as related_codes,
+        evidence.texts as evidence
+    from ad_dtc d
+    left join ad_ecu e on e.id = d.ecu_id
+    left join ad_manufacturer m on m.id = e.manufacturer_id
+    left join standards on standards.dtc_id = d.id
+    left join protocols on protocols.dtc_id = d.id
+    left join systems on systems.dtc_id = d.id
+    left join subsystems on subsystems.dtc_id = d.id
+    left join categories on categories.dtc_id = d.id
+    left join severities on severities.dtc_id = d.id
+    left join related on related.dtc_id = d.id
+    left join evidence on evidence.dtc_id = d.id
+    {dtcs}
+    order by d.id
+"""
+
+def refresh_dtc_flat(conn, dtc_ids):
+    conn.execute("create temp table if not exists dtc_flat_ids(id integer primary key)")
+    conn.execute("delete from temp.dtc_flat_ids")
+    conn.executemany("insert or ignore into temp.dtc_flat_ids(id) values (?)", ((dtc_id,) for dtc_id in dtc_ids))
+    fts = conn.execute("select 1 from sqlite_master where name = 'ad_dtc_fts'").fetchone()
+    columns = "definition, description, causes, repairs, manufacturer, ecu_model"
+
+    if fts:
+        conn.execute(f"""
+            insert into ad_dtc_fts(ad_dtc_fts, rowid, {columns})
+            select 'delete', dtc_id, {columns}
+            from ad_dtc_flat
+            where dtc_id in (select id from temp.dtc_flat_ids)
+        """)
+    conn.execute("delete from ad_dtc_flat where dtc_id in (select id from temp.dtc_flat_ids)")
+    conn.execute("insert into ad_dtc_flat " + DTC_FLAT_SELECT.format(
+        links="where l.dtc_id in (select id from temp.dtc_flat_ids)",
+        dtcs="where d.id in (select id from temp.dtc_flat_ids)",
+    ))
+    if fts:
+        conn.execute(f"""
+            insert into ad_dtc_fts(rowid, {columns})
+            select dtc_id, {columns}
+            from ad_dtc_flat
+            where dtc_id in (select id from temp.dtc_flat_ids)
+        """)
+
+def build_dtc_shard(shard_path, codes_files):
+    # worker of a sharded build, part is the index of a codes directory in codes_files
+    converter = ConverterToSqlite()
+    conn = sqlite3.connect(shard_path)
+    sqlite_profile.apply(conn, "scratch")
+    conn.executescript(DTC_SHARD_SCHEMA)
+
+    for part, files in enumerate(codes_files):
+        for path in map(Path, files):
+            file = read_yaml_file(path)
+            seq = conn.execute(
+                "insert into dtc values(null,?,?,?,?,?,?,?,?,?,?,?)",
+                (part, path.name) + converter._dtc_values(file),
+            ).lastrowid
+
+            conn.executemany(
+                "insert into dtc_evidence(seq, text) values(?,?)",
+                [(seq, text) for text in converter._ensure_list(file.get("evidence", []) or [])],
+            )
+            conn.executemany(
+                "insert into dtc_taxonomy(seq, kind, name) values(?,?,?)",
+                [
+                    (seq, key, name)
+                    for key, *_ in ConverterToSqlite.DTC_TAXONOMIES
+                    for name in converter._ensure_list(file.get(key))
+                ],
+            )
+            conn.executemany(
+                "insert into dtc_related(seq, code) values(?,?)",
+                [(seq, code) for code in converter._ensure_list(file.get("related_code"))],
+            )
+
+    conn.commit()
+    conn.close()
+
+def _is_scalar(value):
+    return value is None or isinstance(value, (str, int, float))
+
+def _check_scalars(data, fields, problems):
+    for field in fields:
+        value = data.get(field)
+        if not _is_scalar(value):
+            problems.append(f"{field}: expected a text or a number, got {type(value).__name__}")
+
+def _check_names(data, fields, problems):
+    # matched by slug(), which only takes text
+    for field in fields:
+        value = data.get(field)
+        if value and not isinstance(value, str):
+            problems.append(f"{field}: expected a text, got {value!r}")
+
+def _check_timestamps(data, problems):
+    for field in ("created", "updated"):
+        value = data.get(field)
+        if value is None:
+            continue
+        try:
+            timestamp(value)
+        except (TypeError, ValueError):
+            problems.append(f"{field}: not a timestamp: {value!r}")
+
+def _check_texts(field, value, problems, nested=False):
+    for item in value if isinstance(value, list) else [value]:
+        if nested and isinstance(item, list):
+            _check_texts(field, item, problems)
+        elif not _is_scalar(item):
+            problems.append(f"{field}: expected texts, got {type(item).__name__}")
+            return
+
+def _check_evidence(data, problems, nested):
+    # nested: the build iterates the evidence itself, a text or a list, of texts or lists of texts
+    evidence = data.get("evidence")
+    if nested and evidence and not isinstance(evidence, (list, str)):
+        problems.append(f"evidence: expected a list, got {type(evidence).__name__}")
+    else:
+        _check_texts("evidence", evidence, problems, nested)
+
+def _check_conflicts(data, problems):
+    conflicts = data.get("conflicts", {})
+    if not isinstance(conflicts, dict):
+        problems.append(f"conflicts: expected a mapping, got {type(conflicts).__name__}")
+        return
+
+    for field, values in conflicts.items():
+        for value in ConverterToSqlite._ensure_list(values):
+            if not isinstance(value, dict) or "value" not in value:
+                problems.append(f"conflicts.{field}: expected a mapping with a value, got {value!r}")
+            elif not _is_scalar(value["value"]):
+                problems.append(f"conflicts.{field}.value: expected a text or a number")
+            else:
+                _check_texts(f"conflicts.{field}.evidence", value.get("evidence"), problems)
+
+def _check_configs(data, problems, references):
+    # configs of a version with the same engine and power are one row, their ECU protocols must differ
+    protocols = set()
+
+    for config_entry in ConverterToSqlite._ensure_list(data.get("config")):
+        if not isinstance(config_entry, dict):
+            continue
+
+        for name, config in config_entry.items():
+            if not isinstance(config, dict):
+                continue
+
+            if config.get("engine"):
+                references.append(("engine", config["engine"], f"config.{name}.engine"))
+            _check_scalars(config, ("power_kw",), problems)
+
+            ecus = config.get("ecu", {}) or {}
+            if not isinstance(ecus, dict):
+                problems.append(f"config.{name}.ecu: expected a mapping, got {type(ecus).__name__}")
+                continue
+
+            for ecu_type, ecu in ecus.items():
+                if not isinstance(ecu, dict) or not ecu.get("model"):
+                    continue
+                references.append(("ecu", ecu["model"], f"config.{name}.ecu.{ecu_type}.model"))
+
+                protocol = ecu.get("protocol", {})
+                if not isinstance(protocol, dict):
+                    continue
+                for protocol_name, params in protocol.items():
+                    if not isinstance(params, dict):
+                        continue
+                    key = (str(config.get("engine")), config.get("power_kw"), str(ecu["model"]), str(protocol_name))
+                    if key in protocols:
+                        problems.append(f"config.{name}.ecu.{ecu_type}.protocol.{protocol_name}: given twice for {ecu['model']}")
+                    protocols.add(key)
+
+def check_source_data(kind, data):
+    # returns (problems, references, code), references being (kind, "Manufacturer/dir", field)
+    if not isinstance(data, dict):
+        return [f"expected a mapping, got {type(data).__name__}"], [], None
+
+    problems = []
+    references = []
+
+    if kind == "manufacturer":
+        _check_names(data, ("manufacturer",), problems)
+        return problems, references, None
+
+    if kind == "dtc":
+        _check_scalars(data, ("code", "definition", "description", "mil"), problems)
+        _check_timestamps(data, problems)
+        for field in ("detection_condition", "causes", "repairs"):
+            value = data.get(field)
+            if value is None or isinstance(value, list) and all(isinstance(item, str) for item in value):
+                continue
+            try:
+                json.dumps(value)
+            except (TypeError, ValueError):
+                problems.append(f"{field}: not JSON serializable")
+        _check_evidence(data, problems, nested=True)
+        _check_texts("related_code", data.get("related_code"), problems)
+        for key, *_ in ConverterToSqlite.DTC_TAXONOMIES:
+            _check_texts(key, data.get(key), problems)
+        return problems, references, data.get("code")
+
+    _check_timestamps(data, problems)
+    _check_conflicts(data, problems)
+    _check_evidence(data, problems, nested=kind in ("ecu", "engine", "vehicle"))
+
+    if kind == "mcu":
+        _check_names(data, ("model",), problems)
+    elif kind == "ecu":
+        _check_names(data, ("model",), problems)
+        _check_scalars(data, ("type",), problems)
+        if data.get("mcu"):
+            references.append(("mcu", data["mcu"], "mcu"))
+    elif kind == "engine":
+        _check_names(data, ("code",), problems)
+        _check_scalars(data, ("fuel",), problems)
+        for name in ConverterToSqlite._ensure_list(data.get("name")):
+            if not isinstance(name, str):
+                problems.append(f"name: expected texts, got {name!r}")
+    elif kind == "vehicle":
+        _check_names(data, ("model",), problems)
+        _check_scalars(data, ("type",), problems)
+    elif kind == "version":
+        _check_scalars(data, ("version", "year"), problems)
+        _check_configs(data, problems, references)
+
+    return problems, references, None
+
+def check_source_files(files, cache_entries=False):
+    results = []
+    for kind, path in files:
+        entry = None
+        try:
+            if cache_entries:
+                entry = yaml_cache.parse_entry(path)
+                data = pickle.loads(entry[3])
+            else:
+                data = read_yaml_file(path)
+        except (OSError, UnicodeDecodeError, yaml_io.YAMLError) as e:
+            mark = getattr(e, "problem_mark", None)
+            problem = f"invalid YAML, {e.problem} at line {mark.line + 1}" if mark else f"unreadable, {e}"
+            results.append((([problem], [], None), None))
+            continue
+        results.append((check_source_data(kind, data), entry))
+    return results
 
 class ConverterToSqlite():
 
-    def __init__(self, plain_text_db: Path = None, sqlite_db: Path = None, logger = None):
+    # number of DTC files handed to a worker process at once
+    CODES_CHUNK_SIZE = 256
+    # DTC files of a shard of a sharded build, whole codes directories are kept together
+    SHARD_SIZE = 2048
+    # DTC and DTC link rows gathered before they are written with executemany
+    BATCH_SIZE = 2000
+
+    DTC_INSERT = """
+        insert into ad_dtc(
+            id,
+            ecu_id,
+            code,
+            definition,
+            description,
+            mil,
+            created,
+            updated,
+            detection_condition,
+            causes,
+            repairs
+        ) values(?,?,?,?,?,?,?,?,?,?,?)
+    """
+
+    # engine/ecu/mcu references (relative paths) kept resolved while loading
+    REFERENCE_CACHE_SIZE = 16384
+
+    # created once the data is in, their uniqueness is checked by the identity map meanwhile
+    DEFERRED_INDEXES = {
+        "ad_dtc_ecu_code_uq": """
+            create unique index if not exists ad_dtc_ecu_code_uq
+            on ad_dtc(ecu_id, code)
+        """,
+        "ad_vehicle_version_config_ecu_protocol_uq": """
+            create unique index if not exists ad_vehicle_version_config_ecu_protocol_uq
+            on ad_vehicle_version_config_ecu_protocol(
+                vehicle_version_config_ecu_id,
+                protocol
+            )
+        """,
+    }
+
+    # (table, matched column, index) of the <column>_key lookup columns
+    KEY_COLUMNS = (
+        ("ad_manufacturer", "name", "name_key"),
+        ("ad_mcu", "model", "manufacturer_id, model_key"),
+        ("ad_ecu", "model", "manufacturer_id, model_key"),
+        ("ad_engine", "code", "manufacturer_id, code_key"),
+        ("ad_engine_name", "name", "engine_id, name_key"),
+        ("ad_vehicle", "model", "manufacturer_id, model_key"),
+    )
+
+    DTC_TAXONOMIES = (
+        ("system", "ad_dtc_system", "ad_dtc_system_link", "system_id"),
+        ("subsystem", "ad_dtc_subsystem", "ad_dtc_subsystem_link", "subsystem_id"),
+        ("category", "ad_dtc_category", "ad_dtc_category_link", "category_id"),
+        ("severity", "ad_dtc_severity", "ad_dtc_severity_link", "severity_id"),
+        ("protocol", "ad_diag_protocol", "ad_dtc_protocol_link", "protocol_id"),
+        ("standard", "ad_dtc_standard", "ad_dtc_standard_link", "standard_id"),
+    )
+
+    # only used by readers, see doc/read_indexes.md
+    READ_INDEXES = {
+        **{
+            f"{link}_dtc": f"create index if not exists {link}_dtc on {link}(dtc_id, {field})"
+            for _, _, link, field in DTC_TAXONOMIES
+        },
+        "ad_dtc_related_dtc": "create index if not exists ad_dtc_related_dtc on ad_dtc_related(dtc_id, related_dtc_id)",
+        "ad_vehicle_version_config_ecu_ecu": """
+            create index if not exists ad_vehicle_version_config_ecu_ecu
+            on ad_vehicle_version_config_ecu(ecu_id, config_id)
+        """,
+    }
+
+    def __init__(
+        self,
+        plain_text_db: Path = None,
+        sqlite_db: Path = None,
+        logger = None,
+        jobs: int = 1,
+        incremental: bool = False,
+        batch_size: int = BATCH_SIZE,
+        atomic: bool = False,
+        profile: str = "bulk",
+        defer_indexes: bool = True,
+        cache_dir: Path = None,
+        profile_stages: bool = False,
+        profile_json: Path = None,
+        sharded: bool = False,
+        read_indexes: bool = True,
+        lite_db: Path = None,
+        validate: bool = False,
+    ):
         self.plain_text_db = Path(plain_text_db) if plain_text_db else None
         self.sqlite_db = Path(sqlite_db) if sqlite_db else None
-        if logger:
-            self.logger = logger
-
-    def _connect(self):
-        conn = sqlite3.connect(self.sqlite_db)
+        self.logger = logger
+        self.jobs = max(1, int(jobs or 1))
+        self.incremental = incremental
+        self.batch_size = batch_size
+        self.atomic = atomic
+        self.profile = profile
+        self.defer_indexes = defer_indexes
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._yaml_cache = None
+        self.profile_stages = profile_stages or profile_json is not None
+        self.profile_json = Path(profile_json) if profile_json else None
+        self._profiler = None
+        self._progress = None
+        self.sharded = sharded
+        self.read_indexes = read_indexes
+        self.lite_db = Path(lite_db) if lite_db else None
+        self.validate = validate
+        self._shard_ecus = None
+        self._shard_codes = None
+        self._source_tree = None
+        self._manifest = None
+        self._codes_futures = {}
+        self._sources = {}
+        self._ids = IdentityMap()
+        self._reset_reference_cache()
+
+    def _connect(self, path=None, profile=None):
+        conn = sqlite3.connect(path or self.sqlite_db)
         conn.execute("pragma foreign_keys = on")
+        if self._profiler is not None:
+            self._profiler.trace(conn)
+        if profile:
+            sqlite_profile.apply(conn, profile)
         return conn
 
-    def _create_schema(self, conn):
+    def _build_path(self):
+        return self.sqlite_db.with_name(self.sqlite_db.name + ".build")
+
+    def _open_build(self):
+        build_path = self._build_path()
+        build_path.unlink(missing_ok=True)
+        build_path.with_name(build_path.name + "-journal").unlink(missing_ok=True)
+
+        # the file is thrown away if the build fails
+        conn = self._connect(build_path, "scratch" if self.profile == "bulk" else self.profile)
+        self._create_schema(conn, self.defer_indexes)
+        return conn
+
+    def _carry_over_tables(self, conn):
+        # tables the converter does not own (vpic_*, ...)
+        if not self.sqlite_db.exists():
+            return
+
+        conn.commit()
+        conn.execute("pragma foreign_keys = off")
+        conn.execute("attach database ? as previous", (str(self.sqlite_db),))
+
+        rows = conn.execute("""
+            select type, name, sql
+            from previous.sqlite_master
+            where sql is not null
+            and tbl_name not like 'ad\\_%' escape '\\'
+            and tbl_name not like 'sqlite\\_%' escape '\\'
+            order by type != 'table', rowid
+        """).fetchall()
+
+        for entity_type, name, sql in rows:
+            conn.execute(sql)
+            if entity_type == "table":
+                conn.execute(f'insert into main."{name}" select * from previous."{name}"')
+
+        conn.commit()
+        conn.execute("detach database previous")
+        conn.execute("pragma foreign_keys = on")
+
+    def _finalize_build(self, conn):
+        self.log("Compacting ...")
+        conn.execute("vacuum")
+        conn.close()
+        os.replace(self._build_path(), self.sqlite_db)
+        self.log(f"Database swapped into {self.sqlite_db}")
+
+    def _create_schema(self, conn, defer_indexes=False):
+        self._create_tables(conn)
+        self._create_key_columns(conn)
+        if defer_indexes:
+            for name in list(self.DEFERRED_INDEXES) + list(self.READ_INDEXES):
+                conn.execute(f"drop index if exists {name}")
+        else:
+            self._create_indexes(conn)
+
+    def _create_key_columns(self, conn):
+        # also added to databases built before they existed
+        for table, column, key_index in self.KEY_COLUMNS:
+            columns = [row[1] for row in conn.execute(f"pragma table_info({table})")]
+            if f"{column}_key" not in columns:
+                conn.execute(f"alter table {table} add column {column}_key text")
+                conn.execute(f"update {table} set {column}_key=lower({column})")
+            conn.execute(f"create index if not exists {table}_key on {table}({key_index})")
+        conn.commit()
+
+    def _create_indexes(self, conn):
+        for sql in self.DEFERRED_INDEXES.values():
+            conn.execute(sql)
+        for name, sql in self.READ_INDEXES.items():
+            conn.execute(sql if self.read_indexes else f"drop index if exists {name}")
+
+    def _optimize(self, conn):
+        self.log("Creating indexes ...")
+        self._create_indexes(conn)
+        self._build_dtc_flat(conn)
+        self._build_dtc_fts(conn)
+        self.log("Analyzing ...")
+        conn.execute("analyze")
+        conn.execute("pragma optimize")
+
+    def _build_dtc_flat(self, conn):
+        # one row per DTC with every linked value aggregated, code_key holds upper(code)
+        self.log("Materializing ad_dtc_flat ...")
+        conn.executescript("""
+            drop table if exists ad_dtc_fts;
+            drop table if exists ad_dtc_flat;
+
+            create table ad_dtc_flat(
+                dtc_id integer primary key,
+                code text,
+                code_key text,
+                ecu_id integer,
+                manufacturer text,
+                ecu_model text,
+                ecu_type text,
+                definition text,
+                description text,
+                mil boolean,
+                created integer,
+                updated integer,
+                detection_condition text,
+                causes text,
+                repairs text,
+                standards text,
+                protocols text,
+                systems text,
+                subsystems text,
+                categories text,
+                severities text,
+                related_codes text,
+                evidence text
+            );
+        """)
+
+        conn.execute("insert into ad_dtc_flat " + DTC_FLAT_SELECT.format(links="", dtcs=""))
+
+        conn.execute("create index ad_dtc_flat_code_key on ad_dtc_flat(code_key)")
+
+    def _build_dtc_fts(self, conn):
+        # external content table, the texts are only stored in ad_dtc_flat
+        self.log("Indexing DTC texts ...")
+        conn.executescript("""
+            drop table if exists ad_dtc_fts;
+
+            create virtual table ad_dtc_fts using fts5(
+                definition,
+                description,
+                causes,
+                repairs,
+                manufacturer unindexed,
+                ecu_model unindexed,
+                content='ad_dtc_flat',
+                content_rowid='dtc_id',
+                tokenize='porter unicode61 remove_diacritics 2'
+            );
+
+            insert into ad_dtc_fts(ad_dtc_fts) values('rebuild');
+            insert into ad_dtc_fts(ad_dtc_fts) values('optimize');
+        """)
+
+    def _create_tables(self, conn):
         conn.executescript("""
             create table if not exists ad_manufacturer(
                 id integer primary key autoincrement,
-                name text unique not null
+                name text unique not null,
+                name_key text
             );
 
             create table if not exists ad_mcu(
                 id integer primary key autoincrement,
                 manufacturer_id integer not null,
                 model text not null,
+                model_key text,
                 created integer,
                 updated integer,
                 foreign key(manufacturer_id) references ad_manufacturer(id)
@@ -100,6 +773,7 @@ class ConverterToSqlite():
                 id integer primary key autoincrement,
                 manufacturer_id integer not null,
                 code text,
+                code_key text,
                 fuel text,
                 created integer,
                 updated integer,
@@ -112,6 +786,7 @@ class ConverterToSqlite():
             create table if not exists ad_engine_name(
                 engine_id integer not null,
                 name text not null,
+                name_key text,
                 primary key(engine_id, name),
                 foreign key(engine_id) references ad_engine(id)
             );
@@ -121,6 +796,7 @@ class ConverterToSqlite():
                 manufacturer_id integer not null,
                 mcu_id integer,
                 model text not null,
+                model_key text,
                 type text default 'ECM',
                 created integer,
                 updated integer,
@@ -135,6 +811,7 @@ class ConverterToSqlite():
                 id integer primary key autoincrement,
                 manufacturer_id integer not null,
                 model text not null,
+                model_key text,
                 type text,
                 created integer,
                 updated integer,
@@ -192,12 +869,6 @@ class ConverterToSqlite():
                     references ad_vehicle_version_config_ecu(id)
             );
 
-            create unique index if not exists ad_vehicle_version_config_ecu_protocol_uq
-            on ad_vehicle_version_config_ecu_protocol(
-                vehicle_version_config_ecu_id,
-                protocol
-            );
-
             create table if not exists ad_vehicle_version_config_ecu_protocol_param(
                 protocol_id integer not null,
                 name text not null,
@@ -348,10 +1019,7 @@ class ConverterToSqlite():
                 repairs text,
                 foreign key(ecu_id) references ad_ecu(id)
             );
-                           
-            create unique index if not exists ad_dtc_ecu_code_uq
-            on ad_dtc(ecu_id, code);
-                           
+
             create table if not exists ad_dtc_evidence(
                 dtc_id integer not null,
                 evidence_id integer not null,
@@ -408,6 +1076,15 @@ class ConverterToSqlite():
                 foreign key(dtc_id) references ad_dtc(id),
                 foreign key(severity_id) references ad_dtc_severity(id)
             );
+
+            -- id of the build, matched by the manifest kept next to the database
+            create table if not exists ad_build(
+                id text not null
+            );
+
+            drop table if exists ad_build_manifest;
+            -- code searches read ad_dtc_flat_code_key
+            drop index if exists ad_dtc_code_upper;
         """)
 
     def _clear_tables(self, conn):
@@ -458,13 +1135,180 @@ class ConverterToSqlite():
 
             delete from ad_manufacturer;
             delete from ad_evidence;
+
+            delete from ad_build;
         """)
 
     def _read_yaml(self, path: Path):
-        if not path.exists():
+        key = self._tree_key(path)
+        if not self._tree().is_file(key):
             raise FileNotFoundError(f"path not found {path}")
-        with open(path, "r", encoding="utf-8") as f:
-            return yaml.safe_load(f) or {}
+        path = self.plain_text_db / key
+        if self._yaml_cache is None:
+            self._count_yaml([key], True)
+            return read_yaml_file(path)
+
+        misses = self._yaml_cache.misses
+        data = self._yaml_cache.read(path)
+        self._count_yaml([key], misses != self._yaml_cache.misses)
+        return data
+
+    def _count_yaml(self, keys, parsed):
+        # yaml bytes only count the files parsed, not the ones taken from the YAML cache
+        if self._profiler is None:
+            return
+        self._profiler.count("files read", len(keys))
+        if parsed:
+            files = self._tree().files
+            self._profiler.count("yaml bytes", sum(files[key][0] for key in keys if key in files))
+
+    def _iter_codes_paths(self):
+        for manufacturer_dir in self._subdirs(self.plain_text_db / "ecu"):
+            for ecu_dir in self._subdirs(manufacturer_dir):
+                codes_path = ecu_dir / "codes"
+                if self._is_source_file(ecu_dir / "def.yml") and self._is_source_dir(codes_path):
+                    yield codes_path
+
+    @contextmanager
+    def _codes_reader(self):
+        # results are consumed in the serial order so the output does not depend on jobs
+        if self.jobs <= 1:
+            yield
+            return
+
+        cache = self._yaml_cache
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            for codes_path in self._iter_codes_paths():
+                files = self._yml_files(codes_path)
+                misses = files if cache is None else [f for f in files if not cache.contains(f)]
+                pending = {}
+                for i in range(0, len(misses), self.CODES_CHUNK_SIZE):
+                    chunk = misses[i:i + self.CODES_CHUNK_SIZE]
+                    future = executor.submit(read_yaml_files if cache is None else yaml_cache.parse_entries, chunk)
+                    pending.update((f, (future, n)) for n, f in enumerate(chunk))
+                self._codes_futures[codes_path] = (files, pending)
+            try:
+                yield
+            finally:
+                for _, pending in self._codes_futures.values():
+                    for future, _ in pending.values():
+                        future.cancel()
+                self._codes_futures = {}
+
+    def _source_files(self):
+        tree = self._tree()
+        for kind in ("mcu", "ecu", "engine", "vehicle"):
+            for manufacturer in tree.subdirs(kind):
+                manufacturer_dir = f"{kind}/{manufacturer}"
+                yield "manufacturer", f"{manufacturer_dir}/def.yml"
+
+                for name in tree.subdirs(manufacturer_dir):
+                    entity_dir = f"{manufacturer_dir}/{name}"
+                    if not tree.is_file(f"{entity_dir}/def.yml"):
+                        continue
+                    yield kind, f"{entity_dir}/def.yml"
+
+                    if kind == "ecu":
+                        for file_name in tree.yml_files(f"{entity_dir}/codes"):
+                            yield "dtc", f"{entity_dir}/codes/{file_name}"
+                    elif kind == "vehicle":
+                        for version in tree.subdirs(f"{entity_dir}/versions"):
+                            version_dir = f"{entity_dir}/versions/{version}"
+                            for file_name in tree.yml_files(version_dir):
+                                yield "version", f"{version_dir}/{file_name}"
+
+    def _validate_source(self):
+        tree = self._tree()
+        cache = self._yaml_cache
+        root = os.path.abspath(self.plain_text_db)
+        files = []
+        results = {}
+        problems = []
+        # directories linked under other names hold the same files, their problems are reported once
+        reported = set()
+
+        def report(kind, relative, path, file_problems):
+            identity = (kind, os.path.realpath(path))
+            if identity not in reported:
+                reported.add(identity)
+                problems.extend(f"{relative}: {problem}" for problem in file_problems)
+
+        for kind, relative in self._source_files():
+            path = os.path.join(root, relative)
+            if kind == "manufacturer" and not tree.is_file(relative):
+                report(kind, relative, path, ["missing, the manufacturer name is read from it"])
+                continue
+            data = cache.peek(path) if cache is not None else None
+            if data is not None:
+                results[relative] = check_source_data(kind, data)
+            files.append((kind, relative, path))
+
+        misses = [file for file in files if file[1] not in results]
+        self._count_yaml([relative for _, relative, _ in files if relative in results], False)
+        chunks = [
+            [(kind, path) for kind, _, path in misses[i:i + self.CODES_CHUNK_SIZE]]
+            for i in range(0, len(misses), self.CODES_CHUNK_SIZE)
+        ]
+        if self.jobs > 1 and 1 < len(chunks):
+            with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+                checked = executor.map(check_source_files, chunks, [cache is not None] * len(chunks))
+                checked = [result for chunk_results in checked for result in chunk_results]
+        else:
+            checked = [result for chunk in chunks for result in check_source_files(chunk, cache is not None)]
+
+        for (_, relative, path), (result, entry) in zip(misses, checked):
+            results[relative] = result
+            if entry is not None:
+                cache.store(path, entry)
+        self._count_yaml([relative for _, relative, _ in misses], True)
+
+        codes = {}
+        for kind, relative, path in files:
+            file_problems, references, code = results[relative]
+            file_problems = list(file_problems)
+
+            for ref_kind, reference, field in references:
+                if not isinstance(reference, str) or "/" not in reference:
+                    file_problems.append(f"{field}: expected Manufacturer/name, got {reference!r}")
+                    continue
+                for def_path in (
+                    f"{ref_kind}/{reference.split('/', 1)[0]}/def.yml",
+                    posixpath.normpath(f"{ref_kind}/{reference}/def.yml"),
+                ):
+                    if not tree.is_file(tree.resolve(def_path, fold=True)):
+                        file_problems.append(f"{field}: {reference} not found, no {def_path}")
+                        break
+
+            if kind == "dtc" and code is not None:
+                first = codes.setdefault((posixpath.dirname(relative), str(code)), relative)
+                if first != relative:
+                    file_problems.append(f"code {code} already defined by {first}")
+
+            if file_problems:
+                report(kind, relative, path, file_problems)
+
+        return problems
+
+    def _iter_codes(self, codes_path: Path):
+        futures = self._codes_futures.pop(codes_path, None)
+
+        if futures is None:
+            for y in self._yml_files(codes_path):
+                yield y, self._read_yaml(y)
+            return
+
+        files, pending = futures
+        for y in files:
+            if y not in pending:
+                yield y, self._read_yaml(y)
+                continue
+
+            future, n = pending[y]
+            data = future.result()[n]
+            self._count_yaml([self._tree_key(y)], True)
+            if self._yaml_cache is not None:
+                data = self._yaml_cache.store(y, data)
+            yield y, data
 
     def _get_or_insert(
         self,
@@ -478,29 +1322,31 @@ class ConverterToSqlite():
         if value is None or value == "":
             return None
 
+        if slug_search:
+            key = like_key(slug(value))
+        elif ignore_case:
+            key = ("lower", value)
+        else:
+            key = value
+
+        row_id = self._ids.get(table, key)
+        if row_id is not None:
+            return row_id
+
         cur = conn.cursor()
 
         if slug_search:
-            pattern = slug(value)
-
-            if ignore_case:
-                cur.execute(
-                    f"""
-                    select id
-                    from {table}
-                    where lower({field}) LIKE lower(?)
-                    """,
-                    (pattern,),
-                )
-            else:
-                cur.execute(
-                    f"""
-                    select id
-                    from {table}
-                    where {field} LIKE ?
-                    """,
-                    (pattern,),
-                )
+            # LIKE ignores ascii case either way, {field}_key holds lower({field})
+            where, params = key_filter(f"{field}_key", value)
+            cur.execute(
+                f"""
+                select id
+                from {table} indexed by {table}_key
+                where {where}
+                order by id
+                """,
+                params,
+            )
 
         elif ignore_case:
             cur.execute(
@@ -523,16 +1369,24 @@ class ConverterToSqlite():
 
         r = cur.fetchone()
         if r:
-            return r[0]
+            return self._ids.add(table, key, r[0])
 
-        cur.execute(
-            f"insert into {table}({field}) values(?)",
-            (value,),
-        )
+        if slug_search:
+            cur.execute(
+                f"insert into {table}({field}, {field}_key) values(?, lower(?))",
+                (value, value),
+            )
+        else:
+            cur.execute(
+                f"insert into {table}({field}) values(?)",
+                (value,),
+            )
 
-        return cur.lastrowid
+        self._ids.inserted(table, value)
+        return self._ids.add(table, key, cur.lastrowid)
 
-    def _ensure_list(self, v):
+    @staticmethod
+    def _ensure_list(v):
         if v is None or v == "":
             return []
         if isinstance(v, list):
@@ -543,6 +1397,10 @@ class ConverterToSqlite():
         if not text:
             return None
 
+        evidence_id = self._ids.get("ad_evidence", text)
+        if evidence_id is not None:
+            return evidence_id
+
         cur = conn.cursor()
 
         cur.execute(
@@ -552,30 +1410,32 @@ class ConverterToSqlite():
 
         row = cur.fetchone()
         if row:
-            return row[0]
+            return self._ids.add("ad_evidence", text, row[0])
 
         cur.execute(
             "insert into ad_evidence(text) values(?)",
             (text,)
         )
 
-        return cur.lastrowid
+        return self._ids.add("ad_evidence", text, cur.lastrowid)
     
-    def _link_evidence(self, conn, table, entity_field, entity_id, evidence):
+    def _link_evidence(self, conn, table, entity_field, entity_id, evidence, writer=None):
         if entity_id is None:
             return
 
+        sql = f"""
+            insert or ignore into {table}
+            ({entity_field}, evidence_id)
+            values(?, ?)
+        """
+
         for text in self._ensure_list(evidence):
             evidence_id = self._get_or_insert_evidence(conn, text)
 
-            conn.execute(
-                f"""
-                insert or ignore into {table}
-                ({entity_field}, evidence_id)
-                values(?, ?)
-                """,
-                (entity_id, evidence_id,)
-            )
+            if writer is None:
+                conn.execute(sql, (entity_id, evidence_id,))
+            else:
+                writer.add(sql, (entity_id, evidence_id,))
 
     def _get_or_insert_mcu(
         self,
@@ -598,55 +1458,57 @@ class ConverterToSqlite():
         )
 
         cur = conn.cursor()
+        scope = ("ad_mcu", manufacturer_id)
+        key = like_key(slug(model))
 
-        cur.execute("""
-            select id, created, updated
-            from ad_mcu
-            where manufacturer_id=?
-            and model LIKE ?
-        """, (
-            manufacturer_id,
-            slug(model),
-        ))
-
-        row = cur.fetchone()
+        mcu_id = self._ids.get(scope, key)
 
-        if row:
-            mcu_id = row[0]
+        if mcu_id is None:
+            where, params = key_filter("model_key", model)
+            cur.execute(f"""
+                select id
+                from ad_mcu indexed by ad_mcu_key
+                where manufacturer_id=?
+                and {where}
+                order by model
+            """, (manufacturer_id,) + params)
 
-            if not created:
-                created = row[1]
-            if not updated:
-                updated = row[2]
+            row = cur.fetchone()
+            mcu_id = self._ids.add(scope, key, row[0] if row else None)
 
-            cur.execute("""
-                update ad_mcu
-                set created=coalesce(created, ?),
-                    updated=coalesce(updated, ?)
-                where id=?
-            """, (
-                created,
-                updated,
-                mcu_id,
-            ))
+        if mcu_id is not None:
+            if created or updated:
+                cur.execute("""
+                    update ad_mcu
+                    set created=coalesce(created, ?),
+                        updated=coalesce(updated, ?)
+                    where id=?
+                """, (
+                    created,
+                    updated,
+                    mcu_id,
+                ))
 
         else:
             cur.execute("""
                 insert into ad_mcu(
                     manufacturer_id,
                     model,
+                    model_key,
                     created,
                     updated
                 )
-                values(?,?,?,?)
+                values(?,?,lower(?),?,?)
             """, (
                 manufacturer_id,
                 model,
+                model,
                 created,
                 updated,
             ))
 
-            mcu_id = cur.lastrowid
+            self._ids.inserted(scope, model)
+            mcu_id = self._ids.add(scope, key, cur.lastrowid)
 
         self._link_evidence(
             conn,
@@ -671,6 +1533,13 @@ class ConverterToSqlite():
             if not isinstance(params, dict):
                 continue
 
+            self._ids.claim(
+                "ad_vehicle_version_config_ecu_protocol",
+                (config_ecu_id, protocol_name),
+                "ad_vehicle_version_config_ecu_protocol.vehicle_version_config_ecu_id, "
+                "ad_vehicle_version_config_ecu_protocol.protocol",
+            )
+
             cur = conn.execute(
                 """
                 insert into ad_vehicle_version_config_ecu_protocol(
@@ -745,57 +1614,64 @@ class ConverterToSqlite():
         )
 
         cur = conn.cursor()
+        scope = ("ad_ecu", manufacturer_id)
+        key = like_key(slug(model))
 
-        cur.execute("""
-            select id
-            from ad_ecu
-            where manufacturer_id=?
-            and model LIKE ?
-        """, (
-            manufacturer_id,
-            slug(model),
-        ))
+        ecu_id = self._ids.get(scope, key)
 
-        row = cur.fetchone()
+        if ecu_id is None:
+            where, params = key_filter("model_key", model)
+            cur.execute(f"""
+                select id
+                from ad_ecu indexed by ad_ecu_key
+                where manufacturer_id=?
+                and {where}
+                order by model
+            """, (manufacturer_id,) + params)
 
-        if row:
-            ecu_id = row[0]
+            row = cur.fetchone()
+            ecu_id = self._ids.add(scope, key, row[0] if row else None)
 
-            cur.execute("""
-                update ad_ecu
-                set type=coalesce(?, type),
-                    mcu_id=coalesce(?, mcu_id),
-                    created=coalesce(?, created),
-                    updated=coalesce(?, updated)
-                where id=?
-            """, (
-                ecu_type,
-                mcu_ref,
-                created,
-                updated,
-                ecu_id,
-            ))
+        if ecu_id is not None:
+            if any(v is not None for v in (ecu_type, mcu_ref, created, updated)):
+                cur.execute("""
+                    update ad_ecu
+                    set type=coalesce(?, type),
+                        mcu_id=coalesce(?, mcu_id),
+                        created=coalesce(?, created),
+                        updated=coalesce(?, updated)
+                    where id=?
+                """, (
+                    ecu_type,
+                    mcu_ref,
+                    created,
+                    updated,
+                    ecu_id,
+                ))
         else:
             cur.execute("""
                 insert into ad_ecu(
                     manufacturer_id,
                     mcu_id,
                     model,
+                    model_key,
                     type,
                     created,
                     updated
                 )
-                values(?,?,?,?,?,?)
+                values(?,?,?,lower(?),?,?,?)
             """, (
                 manufacturer_id,
                 mcu_ref,
                 model,
+                model,
                 ecu_type,
                 created,
                 updated,
             ))
 
-            ecu_id = cur.lastrowid
+            self._ids.inserted(scope, model)
+            ecu_id = self._ids.add(scope, key, cur.lastrowid)
 
         if evidence:
             if isinstance(evidence, str):
@@ -810,48 +1686,121 @@ class ConverterToSqlite():
                     ev,
                 )
 
-        if codes_path and codes_path.exists():
-            for y in sorted(codes_path.glob("*.yml")):
-                file = self._read_yaml(y)
+        if codes_path and self._is_source_dir(codes_path) and self._shard_ecus is not None:
+            self._shard_ecus[codes_path] = ecu_id
+        elif codes_path and self._is_source_dir(codes_path):
+            for y, file in self._iter_codes(codes_path):
+                dtc_id = self._insert_dtc(conn, ecu_id, file)
+                self._record_source(y, "dtc", dtc_id)
 
-                created = timestamp(file.get("created"))
-                updated = timestamp(file.get("created")) if file.get("updated") else timestamp(created)
+        return ecu_id
 
-                cur.execute("""
-                    insert into ad_dtc(
-                        ecu_id,
-                        code,
-                        definition,
-                        description,
-                        mil,
-                        created,
-                        updated,
-                        detection_condition,
-                        causes,
-                        repairs
-                    ) values(?,?,?,?,?,?,?,?,?,?)
-                """, (
-                    ecu_id,
-                    file.get("code"),
-                    file.get("definition"),
-                    file.get("description"),
-                    file.get("mil"),
-                    created,
-                    updated,
-                    self._json_dump(file.get("detection_condition"), []),
-                    self._json_dump(file.get("causes"), []),
-                    self._json_dump(file.get("repairs"), [])
-                ))
+    def _dtc_values(self, file):
+        created = timestamp(file.get("created"))
+        updated = timestamp(file.get("created")) if file.get("updated") else timestamp(created)
+
+        return (
+            file.get("code"),
+            file.get("definition"),
+            file.get("description"),
+            file.get("mil"),
+            created,
+            updated,
+            self._json_dump(file.get("detection_condition"), []),
+            self._json_dump(file.get("causes"), []),
+            self._json_dump(file.get("repairs"), [])
+        )
+
+    def _insert_dtc(self, conn, ecu_id, file):
+        # the id is allocated here so the link rows can be queued along with the DTC
+        if self._next_dtc_id is None:
+            self._next_dtc_id = conn.execute("""
+                select max(
+                    ifnull((select seq from sqlite_sequence where name='ad_dtc'), 0),
+                    ifnull((select max(id) from ad_dtc), 0)
+                ) + 1
+            """).fetchone()[0]
+
+        dtc_id = self._next_dtc_id
+        self._next_dtc_id += 1
+
+        values = self._dtc_values(file)
+
+        if values[0] is not None:
+            codes = self._dtc_codes(conn, ecu_id)
+            if str(values[0]) in codes:
+                raise sqlite3.IntegrityError("UNIQUE constraint failed: ad_dtc.ecu_id, ad_dtc.code")
+            codes[str(values[0])] = dtc_id
+
+        self._dtc_writer.add(self.DTC_INSERT, (dtc_id, ecu_id) + values)
+
+        self._link_dtc(conn, dtc_id, ecu_id, file)
+
+        return dtc_id
+
+    def _dtc_codes(self, conn, ecu_id):
+        # code -> id of the DTCs of an ECU, queued ones included
+        codes = self._dtc_code_ids.get(ecu_id)
+        if codes is None and not self._dtc_codes_in_db:
+            codes = self._dtc_code_ids[ecu_id] = {}
+        elif codes is None:
+            codes = {
+                str(code): dtc_id
+                for dtc_id, code in conn.execute(
+                    "select id, code from ad_dtc where ecu_id=? and code is not null order by id",
+                    (ecu_id,),
+                )
+            }
+            self._dtc_code_ids[ecu_id] = codes
+        return codes
+
+    def _reset_dtc_writer(self, conn, empty=False):
+        self._dtc_writer = BatchWriter(conn, self.batch_size, (self.DTC_INSERT,))
+        self._next_dtc_id = None
+        self._dtc_code_ids = {}
+        self._dtc_codes_in_db = not empty
 
-                dtc_id = cur.lastrowid
+        conn.execute("""
+            create temp table if not exists ad_dtc_related_stage(
+                dtc_id integer not null,
+                ecu_id integer not null,
+                code text
+            )
+        """)
+        conn.execute("delete from temp.ad_dtc_related_stage")
 
-                for evidence in (file.get("evidence", []) or []):
-                    self._link_evidence(conn, "ad_dtc_evidence", "dtc_id", dtc_id, evidence)
+    def _flush_dtcs(self):
+        self._dtc_writer.flush()
+        self._dtc_code_ids = {}
+        self._dtc_codes_in_db = True
 
-                self._insert_related_codes(conn, dtc_id, file.get("related_code"), ecu_id)
-                self._insert_taxonomy_links(conn, dtc_id, file)
+    def _resolve_related(self, conn):
+        # once every DTC is loaded, so codes sorting after the referencing one are found too
+        self._flush_dtcs()
 
-        return ecu_id
+        staged = conn.execute("select count(*) from temp.ad_dtc_related_stage").fetchone()[0]
+        if not staged:
+            return
+
+        cur = conn.execute("""
+            insert into ad_dtc_related(dtc_id, related_dtc_id)
+            select s.dtc_id, d.id
+            from temp.ad_dtc_related_stage s
+            join ad_dtc d
+            on d.ecu_id = s.ecu_id
+            and d.code = s.code
+            order by s.rowid
+        """)
+        conn.execute("delete from temp.ad_dtc_related_stage")
+
+        self.log(f"Related codes: {cur.rowcount} of {staged} resolved")
+
+    def _link_dtc(self, conn, dtc_id, ecu_id, file):
+        for evidence in (file.get("evidence", []) or []):
+            self._link_evidence(conn, "ad_dtc_evidence", "dtc_id", dtc_id, evidence, self._dtc_writer)
+
+        self._insert_related_codes(conn, dtc_id, file.get("related_code"), ecu_id)
+        self._insert_taxonomy_links(conn, dtc_id, file)
     
     def _get_or_insert_engine_name(
         self,
@@ -864,15 +1813,14 @@ class ConverterToSqlite():
 
         cur = conn.cursor()
 
-        cur.execute("""
+        where, params = key_filter("name_key", name)
+        cur.execute(f"""
             select engine_id
-            from ad_engine_name
+            from ad_engine_name indexed by ad_engine_name_key
             where engine_id=?
-            and lower(name) LIKE lower(?)
-        """, (
-            engine_id,
-            slug(name),
-        ))
+            and {where}
+            order by name
+        """, (engine_id,) + params)
 
         row = cur.fetchone()
 
@@ -882,12 +1830,14 @@ class ConverterToSqlite():
         cur.execute("""
             insert into ad_engine_name(
                 engine_id,
-                name
+                name,
+                name_key
             )
-            values(?,?)
+            values(?,?,lower(?))
         """, (
             engine_id,
             name,
+            name,
         ))
 
         return cur.lastrowid
@@ -915,52 +1865,60 @@ class ConverterToSqlite():
         )
 
         cur = conn.cursor()
+        scope = ("ad_engine", manufacturer_id)
+        key = like_key(slug(code))
 
-        cur.execute("""
-            select id
-            from ad_engine
-            where manufacturer_id=?
-            and lower(code) LIKE lower(?)
-        """, (
-            manufacturer_id,
-            slug(code),
-        ))
+        engine_id = self._ids.get(scope, key)
 
-        row = cur.fetchone()
-        if row:
-            engine_id = row[0]
+        if engine_id is None:
+            where, params = key_filter("code_key", code)
+            cur.execute(f"""
+                select id
+                from ad_engine indexed by ad_engine_key
+                where manufacturer_id=?
+                and {where}
+                order by code
+            """, (manufacturer_id,) + params)
+
+            row = cur.fetchone()
+            engine_id = self._ids.add(scope, key, row[0] if row else None)
 
-            cur.execute("""
-                update ad_engine
-                set fuel=coalesce(fuel, ?),
-                    created=coalesce(created, ?),
-                    updated=coalesce(updated, ?)
-                where id=?
-            """, (
-                fuel,
-                created,
-                updated,
-                engine_id,
-            ))
-        else:
+        if engine_id is not None:
+            if any(v is not None for v in (fuel, created, updated)):
+                cur.execute("""
+                    update ad_engine
+                    set fuel=coalesce(fuel, ?),
+                        created=coalesce(created, ?),
+                        updated=coalesce(updated, ?)
+                    where id=?
+                """, (
+                    fuel,
+                    created,
+                    updated,
+                    engine_id,
+                ))
+        else:
             cur.execute("""
                 insert into ad_engine(
                     manufacturer_id,
                     code,
+                    code_key,
                     fuel,
                     created,
                     updated
                 )
-                values(?,?,?,?,?)
+                values(?,?,lower(?),?,?,?)
             """, (
                 manufacturer_id,
                 code,
+                code,
                 fuel,
                 created,
                 updated,
             ))
 
-            engine_id = cur.lastrowid
+            self._ids.inserted(scope, code)
+            engine_id = self._ids.add(scope, key, cur.lastrowid)
 
         if names:
             if isinstance(names, str):
@@ -992,35 +1950,40 @@ class ConverterToSqlite():
 
         return engine_id
 
+    def _manufacturer_name(self, manufacturer_dir):
+        manufacturer_def = self._read_yaml(manufacturer_dir / "def.yml")
+        return (
+            manufacturer_def.get("manufacturer")
+            or manufacturer_dir.name
+        )
+
     def _iter_mcu_entries(self):
-        mcu_root = self.plain_text_db / "mcu"
-        if not mcu_root.exists():
-            return
+        for manufacturer_dir in self._subdirs(self.plain_text_db / "mcu"):
 
-        for manufacturer_dir in sorted(p for p in mcu_root.iterdir() if p.is_dir()):
+            manufacturer = self._manufacturer_name(manufacturer_dir)
 
-            manufacturer_def = self._read_yaml(manufacturer_dir / "def.yml")
-            manufacturer = (
-                manufacturer_def.get("manufacturer")
-                or manufacturer_dir.name
-            )
+            for mcu_dir in self._subdirs(manufacturer_dir):
 
-            for mcu_dir in sorted(p for p in manufacturer_dir.iterdir() if p.is_dir()):
+                entry = self._mcu_entry(manufacturer, mcu_dir)
+                if entry is not None:
+                    yield entry
 
-                def_path = mcu_dir / "def.yml"
-                if not def_path.exists():
-                    continue
+    def _mcu_entry(self, manufacturer, mcu_dir):
+        def_path = mcu_dir / "def.yml"
+        if not self._is_source_file(def_path):
+            return None
 
-                data = self._read_yaml(def_path)
+        data = self._read_yaml(def_path)
 
-                yield {
-                    "manufacturer": manufacturer,
-                    "model": data.get("model"),
-                    "created": timestamp(data.get("created")) if data.get("created") else None,
-                    "updated": timestamp(data.get("updated")) if data.get("updated") else None,
-                    "evidence": data.get("evidence", []),
-                    "conflicts": data.get("conflicts", {}),
-                }
+        return {
+            "path": def_path,
+            "manufacturer": manufacturer,
+            "model": data.get("model"),
+            "created": timestamp(data.get("created")) if data.get("created") else None,
+            "updated": timestamp(data.get("updated")) if data.get("updated") else None,
+            "evidence": data.get("evidence", []),
+            "conflicts": data.get("conflicts", {}),
+        }
 
     def _load_mcus(self, conn):
         seen = set()
@@ -1038,263 +2001,243 @@ class ConverterToSqlite():
                 continue
             seen.add(key)
 
-            mcu_id = self._get_or_insert_mcu(
+            mcu_id = self._load_mcu(conn, entry)
+            self._record_source(entry["path"], "mcu", mcu_id)
+
+    def _load_mcu(self, conn, entry):
+        mcu_id = self._get_or_insert_mcu(
+            conn,
+            manufacturer=entry["manufacturer"],
+            model=entry["model"],
+            created=timestamp(entry["created"]) if entry["created"] else None,
+            updated=timestamp(entry["updated"]) if entry["updated"] else None,
+            evidence=entry["evidence"],
+        )
+
+        self._insert_conflicts(
+            conn,
+            "mcu",
+            mcu_id,
+            entry["conflicts"],
+            entry["updated"] or entry["created"],
+        )
+
+        return mcu_id
+
+    def _insert_conflicts(self, conn, entity_type, entity_id, conflicts, created):
+        for field, values in conflicts.items():
+
+            conflict_id = self._insert_conflict(
                 conn,
-                manufacturer=manufacturer,
-                model=model,
-                created=timestamp(entry["created"]) if entry["created"] else None,
-                updated=timestamp(entry["updated"]) if entry["updated"] else None,
-                evidence=entry["evidence"],
+                entity_type=entity_type,
+                entity_id=entity_id,
+                field=field,
+                created=timestamp(created),
             )
 
-            for field, values in entry["conflicts"].items():
+            for value in self._ensure_list(values):
 
-                conflict_id = self._insert_conflict(
+                conflict_value_id = self._insert_conflict_value(
                     conn,
-                    entity_type="mcu",
-                    entity_id=mcu_id,
-                    field=field,
-                    created=timestamp(entry["updated"] or entry["created"]),
+                    conflict_id,
+                    field,
+                    value,
                 )
 
-                for value in self._ensure_list(values):
-
-                    conflict_value_id = self._insert_conflict_value(
-                        conn,
-                        conflict_id,
-                        field,
-                        value,
-                    )
-
-                    self._link_conflict_value_evidence(
-                        conn,
-                        conflict_value_id,
-                        value.get("evidence"),
-                    )
+                self._link_conflict_value_evidence(
+                    conn,
+                    conflict_value_id,
+                    value.get("evidence"),
+                )
     
     def _load_vehicles(self, conn):
         seen = set()
 
         for entry in self._iter_vehicle_entries(conn):
+            self._load_vehicle_entry(conn, entry, seen)
 
-            manufacturer = entry["manufacturer"]
-            model = entry["model"]
+    def _load_vehicle_entry(self, conn, entry, seen):
+        manufacturer = entry["manufacturer"]
+        model = entry["model"]
 
-            if not manufacturer or not model:
-                continue
+        if not manufacturer or not model:
+            return
 
-            key = (manufacturer, model)
+        key = (manufacturer, model)
 
-            if key not in seen:
+        if key not in seen:
 
-                vehicle_id = self._get_or_insert_vehicle(
-                    conn,
-                    manufacturer=manufacturer,
-                    model=model,
-                    vehicle_type=entry["vehicle_type"],
-                    created=timestamp(entry["vehicle_created"]),
-                    updated=timestamp(entry["vehicle_updated"]),
-                    evidence=entry["vehicle_evidence"],
-                )
+            vehicle_id = self._get_or_insert_vehicle(
+                conn,
+                manufacturer=manufacturer,
+                model=model,
+                vehicle_type=entry["vehicle_type"],
+                created=timestamp(entry["vehicle_created"]),
+                updated=timestamp(entry["vehicle_updated"]),
+                evidence=entry["vehicle_evidence"],
+            )
 
-                seen.add(key)
-            else:
-                vehicle_id = self._get_or_insert_vehicle(
-                    conn,
-                    manufacturer,
-                    model,
-                )
+            seen.add(key)
+        else:
+            vehicle_id = self._get_or_insert_vehicle(
+                conn,
+                manufacturer,
+                model,
+            )
 
-            version_id = self._get_or_insert_vehicle_version(
+        version_id = self._get_or_insert_vehicle_version(
+            conn,
+            vehicle_id=vehicle_id,
+            version=entry["version"],
+            year=entry["year"],
+            created=entry["version_created"],
+            updated=entry["version_updated"],
+            evidence=entry["version_evidence"],
+        )
+
+        for config in entry["configs"]:
+            self._get_or_insert_vehicle_version_config(
                 conn,
-                vehicle_id=vehicle_id,
-                version=entry["version"],
-                year=entry["year"],
-                created=entry["version_created"],
-                updated=entry["version_updated"],
-                evidence=entry["version_evidence"],
+                vehicle_version_id=version_id,
+                engine_ref=config["engine_ref"],
+                power_kw=config["power_kw"],
+                ecus=config["ecus"],
             )
 
-            for config in entry["configs"]:
-                self._get_or_insert_vehicle_version_config(
-                    conn,
-                    vehicle_version_id=version_id,
-                    engine_ref=config["engine_ref"],
-                    power_kw=config["power_kw"],
-                    ecus=config["ecus"],
-                )
+        self._insert_conflicts(
+            conn,
+            "vehicle_version",
+            version_id,
+            entry["version_conflicts"],
+            entry["version_updated"] or entry["version_created"],
+        )
 
-            for field, values in entry["version_conflicts"].items():
+        self._record_source(entry["vehicle_path"], "vehicle", vehicle_id)
+        self._record_source(entry["path"], "vehicle_version", version_id)
 
-                conflict_id = self._insert_conflict(
-                    conn,
-                    entity_type="vehicle_version",
-                    entity_id=version_id,
-                    field=field,
-                    created=timestamp(entry["version_updated"] or entry["version_created"]),
-                )
+    def _reset_reference_cache(self):
+        self._reference = lru_cache(maxsize=self.REFERENCE_CACHE_SIZE)(self._read_reference)
+        self._reference_id = lru_cache(maxsize=self.REFERENCE_CACHE_SIZE)(self._get_reference_id)
 
-                for value in self._ensure_list(values):
+    def _read_reference(self, kind, relative_path):
+        assert relative_path
+        manufacturer_path, _ = relative_path.split("/", 1)
+        manufacturer_data = self._read_yaml(self._reference_path(f"{kind}/{manufacturer_path}/def.yml"))
+        data = self._read_yaml(self._reference_path(f"{kind}/{relative_path}/def.yml"))
+        return manufacturer_data.get("manufacturer"), data.get("code" if kind == "engine" else "model")
 
-                    conflict_value_id = self._insert_conflict_value(
-                        conn,
-                        conflict_id,
-                        field,
-                        value,
-                    )
+    def _reference_path(self, relative):
+        # references match the directories whatever their case, as names match their _key column
+        relative = posixpath.normpath(relative)
+        return self.plain_text_db / (self._tree().resolve(relative, fold=True) or relative)
 
-                    self._link_conflict_value_evidence(
-                        conn,
-                        conflict_value_id,
-                        value.get("evidence"),
-                    )
+    def _get_reference_id(self, conn, kind, relative_path):
+        manufacturer, identity = self._reference(kind, relative_path)
 
-    def _engine_get_m_code(self, engine_relative_path):
-        assert engine_relative_path
-        manufacturer_path, _ = engine_relative_path.split("/", 1)
-        manufacturer_data = self._read_yaml(self.plain_text_db / "engine" / manufacturer_path / "def.yml")
-        engine_data = self._read_yaml(self.plain_text_db / "engine" / engine_relative_path / "def.yml")
-        return manufacturer_data.get("manufacturer"), engine_data.get("code")
-    
-    def _ecu_get_m_model(self, ecu_relative_path):
-        assert ecu_relative_path
-        manufacturer_path, _ = ecu_relative_path.split("/", 1)
-        manufacturer_data = self._read_yaml(self.plain_text_db / "ecu" / manufacturer_path / "def.yml")
-        ecu_data = self._read_yaml(self.plain_text_db / "ecu" / ecu_relative_path / "def.yml")
-        return manufacturer_data.get("manufacturer"), ecu_data.get("model")
-    
-    def _mcu_get_m_model(self, mcu_relative_path):
-        assert mcu_relative_path
-        manufacturer_path, _ = mcu_relative_path.split("/", 1)
-        manufacturer_data = self._read_yaml(self.plain_text_db / "mcu" / manufacturer_path / "def.yml")
-        mcu_data = self._read_yaml(self.plain_text_db / "mcu" / mcu_relative_path / "def.yml")
-        return manufacturer_data.get("manufacturer"), mcu_data.get("model")
+        if kind == "engine":
+            return self._get_or_insert_engine(conn, manufacturer, identity)
+        if kind == "ecu":
+            return self._get_or_insert_ecu(conn, manufacturer, identity)
+        return self._get_or_insert_mcu(conn, manufacturer, identity)
 
     def _iter_vehicle_entries(self, conn):
-        vehicle_root = self.plain_text_db / "vehicle"
-        if not vehicle_root.exists():
-            return
+        for manufacturer_dir in self._subdirs(self.plain_text_db / "vehicle"):
+            manufacturer = self._manufacturer_name(manufacturer_dir)
 
-        for manufacturer_dir in sorted(
-            p for p in vehicle_root.iterdir()
-            if p.is_dir()
-        ):
-            manufacturer_def = self._read_yaml(manufacturer_dir / "def.yml")
-            manufacturer = (
-                manufacturer_def.get("manufacturer")
-                or manufacturer_dir.name
-            )
+            for vehicle_dir in self._subdirs(manufacturer_dir):
+                yield from self._iter_vehicle_dir_entries(
+                    conn,
+                    manufacturer,
+                    vehicle_dir,
+                )
 
-            for vehicle_dir in sorted(
-                p for p in manufacturer_dir.iterdir()
-                if p.is_dir()
-            ):
-                vehicle_def = vehicle_dir / "def.yml"
-                if not vehicle_def.exists():
-                    continue
+    def _iter_vehicle_dir_entries(self, conn, manufacturer, vehicle_dir):
+        vehicle_def = vehicle_dir / "def.yml"
+        if not self._is_source_file(vehicle_def):
+            return
 
-                vehicle = self._read_yaml(vehicle_def)
+        vehicle = self._read_yaml(vehicle_def)
 
-                versions_dir = vehicle_dir / "versions"
-                if not versions_dir.exists():
-                    continue
+        for version_dir in self._subdirs(vehicle_dir / "versions"):
+            for version_file in self._yml_files(version_dir):
+                version = self._read_yaml(version_file)
+
+                configs = []
 
-                for version_dir in sorted(
-                    p for p in versions_dir.iterdir()
-                    if p.is_dir()
+                for config_entry in self._ensure_list(
+                    version.get("config")
                 ):
-                    for version_file in sorted(version_dir.glob("*.yml")):
-                        version = self._read_yaml(version_file)
+                    if not isinstance(config_entry, dict):
+                        continue
+
+                    for config_name, config in config_entry.items():
+                        if not isinstance(config, dict):
+                            continue
+
+                        engine_ref = None
+                        engine = config.get("engine")
+
+                        if engine:
+                            engine_ref = self._reference_id(conn, "engine", engine)
+
+                        ecus = []
+
+                        for ecu_type, ecu in (
+                            config.get("ecu", {}) or {}
+                        ).items():
+                            if not isinstance(ecu, dict):
+                                continue
+
+                            model = ecu.get("model")
+                            if not model:
+                                continue
 
-                        configs = []
+                            ecu_id = self._reference_id(conn, "ecu", model)
 
-                        for config_entry in self._ensure_list(
-                            version.get("config")
-                        ):
-                            if not isinstance(config_entry, dict):
+                            if ecu_id is None:
                                 continue
 
-                            for config_name, config in config_entry.items():
-                                if not isinstance(config, dict):
-                                    continue
-
-                                engine_ref = None
-                                engine = config.get("engine")
-
-                                if engine:
-                                    engine_manufacturer, engine_code = \
-                                        self._engine_get_m_code(engine)
-
-                                    engine_ref = self._get_or_insert_engine(
-                                        conn,
-                                        engine_manufacturer,
-                                        engine_code,
-                                    )
-
-                                ecus = []
-
-                                for ecu_type, ecu in (
-                                    config.get("ecu", {}) or {}
-                                ).items():
-                                    if not isinstance(ecu, dict):
-                                        continue
-
-                                    model = ecu.get("model")
-                                    if not model:
-                                        continue
-
-                                    ecu_manufacturer, ecu_model = \
-                                        self._ecu_get_m_model(model)
-
-                                    ecu_id = self._get_or_insert_ecu(
-                                        conn,
-                                        ecu_manufacturer,
-                                        ecu_model,
-                                    )
-
-                                    if ecu_id is None:
-                                        continue
-
-                                    ecus.append({
-                                        "ecu_id": ecu_id,
-                                        "type": ecu_type,
-                                        "protocol": ecu.get("protocol", {}),
-                                    })
-
-                                configs.append({
-                                    "name": config_name,
-                                    "engine_ref": engine_ref,
-                                    "power_kw": config.get("power_kw"),
-                                    "ecus": ecus,
-                                })
-
-                        yield {
-                            "manufacturer": manufacturer,
-                            "model": vehicle.get("model"),
-                            "vehicle_type": vehicle.get("type", "car"),
-                            "vehicle_created": timestamp(
-                                vehicle.get("created")
-                            ),
-                            "vehicle_updated": timestamp(
-                                vehicle.get("updated")
-                            ),
-                            "vehicle_evidence": vehicle.get("evidence", []),
-                            "path": version_file,
-                            "version": version.get("version"),
-                            "year": version.get("year"),
-                            "configs": configs,
-                            "version_created": timestamp(
-                                version.get("created")
-                            ),
-                            "version_updated": timestamp(
-                                version.get("updated")
-                            ),
-                            "version_evidence": version.get("evidence", []),
-                            "version_conflicts": version.get(
-                                "conflicts", {}
-                            ),
-                        }
-                        
+                            ecus.append({
+                                "ecu_id": ecu_id,
+                                "type": ecu_type,
+                                "protocol": ecu.get("protocol", {}),
+                            })
+
+                        configs.append({
+                            "name": config_name,
+                            "engine_ref": engine_ref,
+                            "power_kw": config.get("power_kw"),
+                            "ecus": ecus,
+                        })
+
+                yield {
+                    "manufacturer": manufacturer,
+                    "model": vehicle.get("model"),
+                    "vehicle_type": vehicle.get("type", "car"),
+                    "vehicle_created": timestamp(
+                        vehicle.get("created")
+                    ),
+                    "vehicle_updated": timestamp(
+                        vehicle.get("updated")
+                    ),
+                    "vehicle_evidence": vehicle.get("evidence", []),
+                    "path": version_file,
+                    "vehicle_path": vehicle_def,
+                    "version": version.get("version"),
+                    "year": version.get("year"),
+                    "configs": configs,
+                    "version_created": timestamp(
+                        version.get("created")
+                    ),
+                    "version_updated": timestamp(
+                        version.get("updated")
+                    ),
+                    "version_evidence": version.get("evidence", []),
+                    "version_conflicts": version.get(
+                        "conflicts", {}
+                    ),
+                }
+
     def _get_or_insert_vehicle(
         self,
         conn,
@@ -1317,21 +2260,25 @@ class ConverterToSqlite():
         )
 
         cur = conn.cursor()
+        scope = ("ad_vehicle", manufacturer_id)
+        key = like_key(slug(model))
 
-        cur.execute("""
-            select id
-            from ad_vehicle
-            where manufacturer_id=?
-            and lower(model) LIKE lower(?)
-        """, (
-            manufacturer_id,
-            slug(model),
-        ))
+        vehicle_id = self._ids.get(scope, key)
 
-        row = cur.fetchone()
+        if vehicle_id is None:
+            where, params = key_filter("model_key", model)
+            cur.execute(f"""
+                select id
+                from ad_vehicle indexed by ad_vehicle_key
+                where manufacturer_id=?
+                and {where}
+                order by model
+            """, (manufacturer_id,) + params)
 
-        if row:
-            vehicle_id = row[0]
+            row = cur.fetchone()
+            vehicle_id = self._ids.add(scope, key, row[0] if row else None)
+
+        if vehicle_id is not None:
 
             cur.execute("""
                 update ad_vehicle
@@ -1350,20 +2297,23 @@ class ConverterToSqlite():
                 insert into ad_vehicle(
                     manufacturer_id,
                     model,
+                    model_key,
                     type,
                     created,
                     updated
                 )
-                values(?,?,?,?,?)
+                values(?,?,lower(?),?,?,?)
             """, (
                 manufacturer_id,
                 model,
+                model,
                 vehicle_type,
                 created,
                 updated,
             ))
 
-            vehicle_id = cur.lastrowid
+            self._ids.inserted(scope, model)
+            vehicle_id = self._ids.add(scope, key, cur.lastrowid)
 
         if evidence:
             if isinstance(evidence, str):
@@ -1546,52 +2496,40 @@ class ConverterToSqlite():
         return json.dumps(value, ensure_ascii=False)
 
     def _iter_ecu_entries(self, conn):
-        ecu_root = self.plain_text_db / "ecu"
-        if not ecu_root.exists():
-            return
+        for manufacturer_dir in self._subdirs(self.plain_text_db / "ecu"):
 
-        for manufacturer_dir in sorted(p for p in ecu_root.iterdir() if p.is_dir()):
+            manufacturer = self._manufacturer_name(manufacturer_dir)
 
-            manufacturer_def = self._read_yaml(manufacturer_dir / "def.yml")
-            manufacturer = (
-                manufacturer_def.get("manufacturer")
-                or manufacturer_dir.name
-            )
+            for ecu_dir in self._subdirs(manufacturer_dir):
+                entry = self._ecu_entry(conn, manufacturer, ecu_dir)
+                if entry is not None:
+                    yield entry
 
-            for ecu_dir in sorted(
-                p for p in manufacturer_dir.iterdir()
-                if p.is_dir()
-            ):
-
-                def_path = ecu_dir / "def.yml"
-                if not def_path.exists():
-                    continue
-                codes_path = ecu_dir / "codes"
-
-                data = self._read_yaml(def_path)
-
-                mcu_ref = None
-                mcu = data.get("mcu")
-                if mcu:
-                    mcu_manufacturer, mcu_model = self._mcu_get_m_model(mcu)
-                    mcu_ref = self._get_or_insert_mcu(
-                        conn,
-                        mcu_manufacturer,
-                        mcu_model,
-                    )
-
-                yield {
-                    "path": def_path,
-                    "codes_path": codes_path,
-                    "manufacturer": manufacturer,
-                    "ecu_model": data.get("model"),
-                    "created": timestamp(data.get("created")),
-                    "updated": timestamp(data.get("updated")),
-                    "ecu_type": data.get("type", "ECM"),
-                    "mcu_ref": mcu_ref,
-                    "evidence": data.get("evidence", []),
-                    "conflicts": data.get("conflicts", {}),
-                }
+    def _ecu_entry(self, conn, manufacturer, ecu_dir):
+        def_path = ecu_dir / "def.yml"
+        if not self._is_source_file(def_path):
+            return None
+        codes_path = ecu_dir / "codes"
+
+        data = self._read_yaml(def_path)
+
+        mcu_ref = None
+        mcu = data.get("mcu")
+        if mcu:
+            mcu_ref = self._reference_id(conn, "mcu", mcu)
+
+        return {
+            "path": def_path,
+            "codes_path": codes_path,
+            "manufacturer": manufacturer,
+            "ecu_model": data.get("model"),
+            "created": timestamp(data.get("created")),
+            "updated": timestamp(data.get("updated")),
+            "ecu_type": data.get("type", "ECM"),
+            "mcu_ref": mcu_ref,
+            "evidence": data.get("evidence", []),
+            "conflicts": data.get("conflicts", {}),
+        }
 
     def _insert_conflict(
         self,
@@ -1701,6 +2639,180 @@ class ConverterToSqlite():
             )
             
     def _load_ecus(self, conn):
+        with self._dtc_shards(conn) if self.sharded else self._codes_reader():
+            self._load_ecus_entries(conn)
+        self._resolve_related(conn)
+
+    @contextmanager
+    def _dtc_shards(self, conn):
+        shards = [([], [])]
+        for codes_path in self._iter_codes_paths():
+            codes_paths, files = shards[-1]
+            if self.SHARD_SIZE <= sum(map(len, files)):
+                codes_paths, files = ([], [])
+                shards.append((codes_paths, files))
+            codes_paths.append(codes_path)
+            files.append(self._yml_files(codes_path))
+
+        shard_dir = Path(tempfile.mkdtemp(prefix="shards-", dir=self.sqlite_db.parent))
+        try:
+            with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+                futures = []
+                for i, (codes_paths, files) in enumerate(shards):
+                    shard_path = shard_dir / f"{i}.sqlite"
+                    future = executor.submit(build_dtc_shard, shard_path, [[str(f) for f in part] for part in files])
+                    futures.append((shard_path, codes_paths, files, future))
+                self._shard_ecus = {}
+                self._shard_codes = {}
+                try:
+                    yield
+                    self._flush_dtcs()
+                    # shards are merged in order, each one as soon as it and the ones before are done
+                    index = {future: i for i, (_, _, _, future) in enumerate(futures)}
+                    done = set()
+                    merged = 0
+                    for future in as_completed(index):
+                        future.result()
+                        done.add(index[future])
+                        files = [f for part in futures[index[future]][2] for f in part]
+                        # the worker parsed every file of its codes directories
+                        self._count_yaml([self._tree_key(f) for f in files], True)
+                        if self._progress is not None:
+                            self._progress.advance(len(files))
+                        while merged in done:
+                            shard_path, codes_paths, _, _ = futures[merged]
+                            self._merge_dtc_shard(conn, shard_path, codes_paths)
+                            merged += 1
+                finally:
+                    self._shard_ecus = None
+                    self._shard_codes = None
+                    for _, _, _, future in futures:
+                        future.cancel()
+        finally:
+            shutil.rmtree(shard_dir, ignore_errors=True)
+
+    def _merge_dtc_shard(self, conn, shard_path, codes_paths):
+        conn.commit()
+        conn.execute("attach database ? as shard", (str(shard_path),))
+
+        conn.executescript("""
+            drop table if exists temp.ad_dtc_shard_part;
+            drop table if exists temp.ad_dtc_shard_id;
+            create temp table ad_dtc_shard_part(part integer primary key, ecu_id integer not null);
+        """)
+        conn.executemany(
+            "insert into temp.ad_dtc_shard_part(part, ecu_id) values(?,?)",
+            [
+                (part, self._shard_ecus[codes_path])
+                for part, codes_path in enumerate(codes_paths)
+                if self._shard_ecus.get(codes_path) is not None
+            ],
+        )
+
+        next_id = conn.execute("""
+            select max(
+                ifnull((select seq from sqlite_sequence where name='ad_dtc'), 0),
+                ifnull((select max(id) from ad_dtc), 0)
+            ) + 1
+        """).fetchone()[0]
+        conn.execute("""
+            create temp table ad_dtc_shard_id as
+            select d.seq as seq, p.ecu_id as ecu_id, ? - 1 + row_number() over (order by d.seq) as id
+            from shard.dtc d
+            join temp.ad_dtc_shard_part p on p.part = d.part
+        """, (next_id,))
+        conn.execute("create unique index temp.ad_dtc_shard_id_seq on ad_dtc_shard_id(seq)")
+
+        for ecu_id, code, part, name in conn.execute("""
+            select m.ecu_id, d.code, d.part, d.name
+            from shard.dtc d
+            join temp.ad_dtc_shard_id m on m.seq = d.seq
+            where d.code is not null
+            order by d.seq
+        """).fetchall():
+            path = codes_paths[part] / name
+            first = self._shard_codes.setdefault(ecu_id, {}).setdefault(str(code), path)
+            if first != path:
+                raise sqlite3.IntegrityError(
+                    f"UNIQUE constraint failed: ad_dtc.ecu_id, ad_dtc.code, {code} of {path} already loaded from {first}"
+                )
+
+        conn.execute("""
+            insert into ad_dtc(
+                id, ecu_id, code, definition, description, mil, created, updated,
+                detection_condition, causes, repairs
+            )
+            select
+                m.id, m.ecu_id, d.code, d.definition, d.description, d.mil, d.created, d.updated,
+                d.detection_condition, d.causes, d.repairs
+            from shard.dtc d
+            join temp.ad_dtc_shard_id m on m.seq = d.seq
+            order by m.id
+        """)
+
+        conn.execute("""
+            insert into ad_evidence(text)
+            select x.text
+            from shard.dtc_evidence x
+            join temp.ad_dtc_shard_id m on m.seq = x.seq
+            where not exists (select 1 from ad_evidence e where e.text = x.text)
+            group by x.text
+            order by min(x.rowid)
+        """)
+        conn.execute("""
+            insert or ignore into ad_dtc_evidence(dtc_id, evidence_id)
+            select m.id, e.id
+            from shard.dtc_evidence x
+            join temp.ad_dtc_shard_id m on m.seq = x.seq
+            join ad_evidence e on e.text = x.text
+            order by x.rowid
+        """)
+
+        for key, table, link, field in self.DTC_TAXONOMIES:
+            conn.execute(f"""
+                insert into {table}(name)
+                select t.name
+                from shard.dtc_taxonomy t
+                join temp.ad_dtc_shard_id m on m.seq = t.seq
+                where t.kind = ?
+                and not exists (select 1 from {table} x where x.name = t.name)
+                group by t.name
+                order by min(t.rowid)
+            """, (key,))
+            conn.execute(f"""
+                insert into {link}(dtc_id, {field})
+                select m.id, x.id
+                from shard.dtc_taxonomy t
+                join temp.ad_dtc_shard_id m on m.seq = t.seq
+                join {table} x on x.name = t.name
+                where t.kind = ?
+                order by t.rowid
+            """, (key,))
+
+        conn.execute("""
+            insert into temp.ad_dtc_related_stage(dtc_id, ecu_id, code)
+            select m.id, m.ecu_id, r.code
+            from shard.dtc_related r
+            join temp.ad_dtc_shard_id m on m.seq = r.seq
+            order by r.rowid
+        """)
+
+        for part, name, dtc_id in conn.execute("""
+            select d.part, d.name, m.id
+            from shard.dtc d
+            join temp.ad_dtc_shard_id m on m.seq = d.seq
+            order by m.id
+        """).fetchall():
+            # counted in the progress when the worker finished
+            self._record_source(codes_paths[part] / name, "dtc", dtc_id, advance=False)
+
+        conn.commit()
+        conn.execute("detach database shard")
+        self._next_dtc_id = None
+        self._dtc_code_ids = {}
+        self._dtc_codes_in_db = True
+
+    def _load_ecus_entries(self, conn):
         seen = set()
 
         for entry in self._iter_ecu_entries(conn):
@@ -1715,82 +2827,61 @@ class ConverterToSqlite():
             if key in seen:
                 continue
             seen.add(key)
-                
-            ecu_id = self._get_or_insert_ecu(
-                conn,
-                manufacturer=manufacturer,
-                model=model,
-                created=timestamp(entry["created"]),
-                updated=timestamp(entry["updated"]),
-                ecu_type=entry["ecu_type"],
-                mcu_ref=entry["mcu_ref"],
-                evidence=entry["evidence"],
-                codes_path=entry["codes_path"]
-            )
 
-            for field, values in entry["conflicts"].items():
+            ecu_id = self._load_ecu(conn, entry, entry["codes_path"])
+            self._record_source(entry["path"], "ecu", ecu_id)
 
-                conflict_id = self._insert_conflict(
-                    conn,
-                    entity_type="ecu",
-                    entity_id=ecu_id,
-                    field=field,
-                    created=timestamp(entry["updated"] or entry["created"]),
-                )
-
-                for value in self._ensure_list(values):
+    def _load_ecu(self, conn, entry, codes_path=None):
+        ecu_id = self._get_or_insert_ecu(
+            conn,
+            manufacturer=entry["manufacturer"],
+            model=entry["ecu_model"],
+            created=timestamp(entry["created"]),
+            updated=timestamp(entry["updated"]),
+            ecu_type=entry["ecu_type"],
+            mcu_ref=entry["mcu_ref"],
+            evidence=entry["evidence"],
+            codes_path=codes_path
+        )
 
-                    conflict_value_id = self._insert_conflict_value(
-                        conn,
-                        conflict_id,
-                        field,
-                        value,
-                    )
+        self._insert_conflicts(
+            conn,
+            "ecu",
+            ecu_id,
+            entry["conflicts"],
+            entry["updated"] or entry["created"],
+        )
 
-                    self._link_conflict_value_evidence(
-                        conn,
-                        conflict_value_id,
-                        value.get("evidence"),
-                    )
+        return ecu_id
 
     def _iter_engine_entries(self):
-        engine_root = self.plain_text_db / "engine"
-        if not engine_root.exists():
-            return
+        for manufacturer_dir in self._subdirs(self.plain_text_db / "engine"):
 
-        for manufacturer_dir in sorted(
-            p for p in engine_root.iterdir()
-            if p.is_dir()
-        ):
-
-            manufacturer_def = self._read_yaml(manufacturer_dir / "def.yml")
-            manufacturer = (
-                manufacturer_def.get("manufacturer")
-                or manufacturer_dir.name
-            )
+            manufacturer = self._manufacturer_name(manufacturer_dir)
 
-            for engine_dir in sorted(
-                p for p in manufacturer_dir.iterdir()
-                if p.is_dir()
-            ):
+            for engine_dir in self._subdirs(manufacturer_dir):
+                entry = self._engine_entry(manufacturer, engine_dir)
+                if entry is not None:
+                    yield entry
 
-                def_path = engine_dir / "def.yml"
-                if not def_path.exists():
-                    continue
+    def _engine_entry(self, manufacturer, engine_dir):
+        def_path = engine_dir / "def.yml"
+        if not self._is_source_file(def_path):
+            return None
 
-                data = self._read_yaml(def_path)
+        data = self._read_yaml(def_path)
 
-                yield {
-                    "path": def_path,
-                    "manufacturer": manufacturer,
-                    "code": data.get("code"),
-                    "names": self._ensure_list(data.get("name")),
-                    "fuel": data.get("fuel"),
-                    "created": timestamp(data.get("created")),
-                    "updated": timestamp(data.get("updated")),
-                    "evidence": data.get("evidence", []),
-                    "conflicts": data.get("conflicts", {}),
-                }
+        return {
+            "path": def_path,
+            "manufacturer": manufacturer,
+            "code": data.get("code"),
+            "names": self._ensure_list(data.get("name")),
+            "fuel": data.get("fuel"),
+            "created": timestamp(data.get("created")),
+            "updated": timestamp(data.get("updated")),
+            "evidence": data.get("evidence", []),
+            "conflicts": data.get("conflicts", {}),
+        }
 
     def _load_engines(self, conn):
         seen = set()
@@ -1808,100 +2899,532 @@ class ConverterToSqlite():
                 continue
             seen.add(key)
 
-            engine_id = self._get_or_insert_engine(
-                conn,
-                manufacturer=manufacturer,
-                code=code,
-                names=entry["names"],
-                fuel=entry["fuel"],
-                created=timestamp(entry["created"]),
-                updated=timestamp(entry["updated"]),
-                evidence=entry["evidence"],
-            )
+            engine_id = self._load_engine(conn, entry)
+            self._record_source(entry["path"], "engine", engine_id)
 
-            for field, values in entry["conflicts"].items():
+    def _load_engine(self, conn, entry):
+        engine_id = self._get_or_insert_engine(
+            conn,
+            manufacturer=entry["manufacturer"],
+            code=entry["code"],
+            names=entry["names"],
+            fuel=entry["fuel"],
+            created=timestamp(entry["created"]),
+            updated=timestamp(entry["updated"]),
+            evidence=entry["evidence"],
+        )
 
-                conflict_id = self._insert_conflict(
-                    conn,
-                    entity_type="engine",
-                    entity_id=engine_id,
-                    field=field,
-                    created=timestamp(entry["updated"] or entry["created"]),
-                )
+        self._insert_conflicts(
+            conn,
+            "engine",
+            engine_id,
+            entry["conflicts"],
+            entry["updated"] or entry["created"],
+        )
 
-                for value in self._ensure_list(values):
+        return engine_id
 
-                    conflict_value_id = self._insert_conflict_value(
-                        conn,
-                        conflict_id,
-                        field,
-                        value,
+    def _insert_taxonomy_links(self, conn, dtc_id, d):
+        for key, table, link, field in self.DTC_TAXONOMIES:
+            for name in self._ensure_list(d.get(key)):
+                taxonomy_id = self._get_or_insert(conn, table, "name", name)
+                if taxonomy_id is not None:
+                    self._dtc_writer.add(
+                        f"insert into {link}(dtc_id, {field}) values(?,?)",
+                        (dtc_id, taxonomy_id)
                     )
 
-                    self._link_conflict_value_evidence(
-                        conn,
-                        conflict_value_id,
-                        value.get("evidence"),
-                    )
+    def _insert_related_codes(self, conn, dtc_id, related_codes, ecu_id):
+        for code in self._ensure_list(related_codes):
+            self._dtc_writer.add(
+                "insert into temp.ad_dtc_related_stage(dtc_id, ecu_id, code) values(?,?,?)",
+                (dtc_id, ecu_id, code)
+            )
 
-    def _insert_taxonomy_links(self, conn, dtc_id, d):
-        for sys_name in self._ensure_list(d.get("system")):
-            sid = self._get_or_insert(conn, "ad_dtc_system", "name", sys_name)
-            if sid is not None:
-                conn.execute(
-                    "insert into ad_dtc_system_link(dtc_id, system_id) values(?,?)",
-                    (dtc_id, sid)
-                )
+    def _read_manifest(self, conn):
+        row = conn.execute("select id from ad_build").fetchone()
+        return manifest.read_sidecar(self.sqlite_db, row[0] if row else None)
 
-        for sub_name in self._ensure_list(d.get("subsystem")):
-            sid = self._get_or_insert(conn, "ad_dtc_subsystem", "name", sub_name)
-            if sid is not None:
-                conn.execute(
-                    "insert into ad_dtc_subsystem_link(dtc_id, subsystem_id) values(?,?)",
-                    (dtc_id, sid)
-                )
+    def _write_manifest(self, conn, current, hashes, stored):
+        # the manifest is saved under the new build id once the database is committed
+        rows = []
 
-        for cat_name in self._ensure_list(d.get("category")):
-            cid = self._get_or_insert(conn, "ad_dtc_category", "name", cat_name)
-            if cid is not None:
-                conn.execute(
-                    "insert into ad_dtc_category_link(dtc_id, category_id) values(?,?)",
-                    (dtc_id, cid)
-                )
+        for path, (size, mtime_ns) in current.items():
+            old = stored.get(path)
 
-        for sev_name in self._ensure_list(d.get("severity")):
-            sid = self._get_or_insert(conn, "ad_dtc_severity", "name", sev_name)
-            if sid is not None:
-                conn.execute(
-                    "insert into ad_dtc_severity_link(dtc_id, severity_id) values(?,?)",
-                    (dtc_id, sid)
-                )
+            digest = hashes.get(path)
+            if digest is None:
+                digest = old[2] if old else manifest.file_hash(self.plain_text_db / path)
 
-        for proto_name in self._ensure_list(d.get("protocol")):
-            pid = self._get_or_insert(conn, "ad_diag_protocol", "name", proto_name)
-            if pid is not None:
-                conn.execute(
-                    "insert into ad_dtc_protocol_link(dtc_id, protocol_id) values(?,?)",
-                    (dtc_id, pid)
-                )
+            entity_type, entity_id = self._sources.get(
+                path,
+                (old[3], old[4]) if old else (None, None),
+            )
 
-        for std_name in self._ensure_list(d.get("standard")):
-            sid = self._get_or_insert(conn, "ad_dtc_standard", "name", std_name)
-            if sid is not None:
-                conn.execute(
-                    "insert into ad_dtc_standard_link(dtc_id, standard_id) values(?,?)",
-                    (dtc_id, sid)
+            rows.append((path, size, mtime_ns, digest, entity_type, entity_id))
+
+        build_id = uuid.uuid4().hex
+        conn.execute("delete from ad_build")
+        conn.execute("insert into ad_build(id) values(?)", (build_id,))
+        self._manifest = (build_id, rows)
+
+    def _save_manifest(self):
+        build_id, rows = self._manifest
+        self._manifest = None
+        manifest.write_sidecar(self.sqlite_db, build_id, rows)
+
+    def _update_incremental(self, conn, current):
+        stored = self._read_manifest(conn)
+        if not stored:
+            self.log("No manifest found in the sqlite database")
+            return False
+
+        changes = manifest.diff(stored, current, self.plain_text_db)
+        self.log(
+            f"{len(changes['added'])} added, "
+            f"{len(changes['modified'])} modified, "
+            f"{len(changes['deleted'])} deleted files"
+        )
+
+        try:
+            self._track_dtcs(conn)
+            self._apply_changes(conn, changes, stored)
+        except FullRebuildRequired as e:
+            conn.rollback()
+            self._sources = {}
+            self._ids.clear(counters=True)
+            self._reset_reference_cache()
+            self._reset_dtc_writer(conn)
+            self.log(f"Incremental update not possible: {e}")
+            return False
+
+        self._delete_orphans(conn)
+        dtc_ids = self._touched_dtcs(conn)
+        flat = conn.execute("select count(*) from sqlite_master where name in ('ad_dtc_flat', 'ad_dtc_fts')").fetchone()[0]
+        if flat == 2:
+            self.log(f"Refreshing {len(dtc_ids)} rows of ad_dtc_flat ...")
+            refresh_dtc_flat(conn, dtc_ids)
+        else:
+            self._build_dtc_flat(conn)
+            self._build_dtc_fts(conn)
+        self._write_manifest(conn, current, changes["hashes"], stored)
+        return True
+
+    # tables whose rows show in ad_dtc_flat, by the column naming the DTC
+    DTC_FLAT_SOURCES = {
+        "ad_dtc": "id",
+        "ad_dtc_evidence": "dtc_id",
+        "ad_dtc_standard_link": "dtc_id",
+        "ad_dtc_protocol_link": "dtc_id",
+        "ad_dtc_related": "dtc_id",
+        "ad_dtc_system_link": "dtc_id",
+        "ad_dtc_subsystem_link": "dtc_id",
+        "ad_dtc_category_link": "dtc_id",
+        "ad_dtc_severity_link": "dtc_id",
+    }
+
+    def _dtc_triggers(self):
+        for table, column in self.DTC_FLAT_SOURCES.items():
+            for event, row in (("insert", "new"), ("update", "old"), ("update", "new"), ("delete", "old")):
+                yield (
+                    f"{table}_{event}_{row}_touched",
+                    f"after {event} on main.{table} begin "
+                    f"insert or ignore into dtc_touched(id) values({row}.{column}); end",
                 )
+        yield (
+            "ad_ecu_update_touched",
+            "after update on main.ad_ecu begin "
+            "insert or ignore into dtc_touched(id) select id from main.ad_dtc where ecu_id = new.id; end",
+        )
 
-    def _insert_related_codes(self, conn, dtc_id, related_codes, ecu_id):
-        for code in self._ensure_list(related_codes):
+    def _track_dtcs(self, conn):
+        # ids of the DTCs whose ad_dtc_flat row may change, whatever path the change takes
+        conn.execute("create temp table if not exists dtc_touched(id integer primary key)")
+        conn.execute("delete from temp.dtc_touched")
+        for name, body in self._dtc_triggers():
+            conn.execute(f"create temp trigger if not exists {name} {body}")
+
+    def _touched_dtcs(self, conn):
+        for name, _ in self._dtc_triggers():
+            conn.execute(f"drop trigger if exists temp.{name}")
+        return [row[0] for row in conn.execute("select id from temp.dtc_touched")]
+
+    def _apply_changes(self, conn, changes, stored):
+        changed = changes["added"] | changes["modified"] | changes["deleted"]
+
+        definitions = {"mcu": set(), "ecu": set(), "engine": set()}
+        vehicles = set()
+        dtcs = []
+
+        for path in sorted(changed):
+            parts = path.split("/")
+            kind = parts[0]
+
+            if kind in ("mcu", "ecu", "engine", "vehicle") and parts[2:] == ["def.yml"]:
+                raise FullRebuildRequired(f"manufacturer definition changed: {path}")
+
+            if kind in definitions and parts[3:] == ["def.yml"]:
+                definitions[kind].add("/".join(parts[:3]))
+            elif kind == "ecu" and len(parts) == 5 and parts[3] == "codes":
+                dtcs.append(path)
+            elif kind == "vehicle" and 4 <= len(parts):
+                vehicles.add("/".join(parts[:3]))
+
+        owners = {}
+        for path, (_, _, _, entity_type, entity_id) in stored.items():
+            if entity_id is not None:
+                owners.setdefault((entity_type, entity_id), []).append(path)
+
+        for rel_dir in sorted(definitions["mcu"]):
+            self._reingest_definition(conn, "mcu", rel_dir, changes, stored, owners)
+
+        loaded_ecus = set()
+        for rel_dir in sorted(definitions["ecu"]):
+            if self._reingest_definition(conn, "ecu", rel_dir, changes, stored, owners):
+                loaded_ecus.add(rel_dir)
+
+        self._resolve_related(conn)
+
+        relink = set()
+        for path in dtcs:
+            if path.rsplit("/", 2)[0] not in loaded_ecus:
+                relink.add(self._reingest_dtc(conn, path, changes, stored))
+                self._flush_dtcs()
+
+        relink.discard(None)
+        self._relink_related(conn, relink, stored)
+
+        for rel_dir in sorted(definitions["engine"]):
+            self._reingest_definition(conn, "engine", rel_dir, changes, stored, owners)
+
+        for rel_dir in sorted(vehicles):
+            self._reingest_vehicle(conn, rel_dir, stored, owners)
+
+    def _reingest_definition(self, conn, kind, rel_dir, changes, stored, owners):
+        # True when the entity was new and its codes were loaded along with it
+        def_rel = f"{rel_dir}/def.yml"
+
+        if def_rel in changes["deleted"]:
+            raise FullRebuildRequired(f"{def_rel} was deleted")
+
+        old = stored.get(def_rel)
+        old_id = old[4] if old else None
+
+        if old is not None and old_id is None:
+            raise FullRebuildRequired(f"{def_rel} was not loaded by the previous build")
+
+        directory = self.plain_text_db / rel_dir
+        manufacturer = self._manufacturer_name(directory.parent)
+
+        if kind == "mcu":
+            entry = self._mcu_entry(manufacturer, directory)
+            identity = entry["model"]
+        elif kind == "ecu":
+            entry = self._ecu_entry(conn, manufacturer, directory)
+            identity = entry["ecu_model"]
+        else:
+            entry = self._engine_entry(manufacturer, directory)
+            identity = entry["code"]
+
+        if not manufacturer or not identity:
+            raise FullRebuildRequired(f"{def_rel} has no identity")
+
+        if old_id is not None:
+            self._reset_entity(conn, kind, old_id)
+
+        if kind == "mcu":
+            entity_id = self._load_mcu(conn, entry)
+        elif kind == "ecu":
+            entity_id = self._load_ecu(
+                conn,
+                entry,
+                entry["codes_path"] if old_id is None else None,
+            )
+        else:
+            entity_id = self._load_engine(conn, entry)
+
+        if old_id is not None and entity_id != old_id:
+            raise FullRebuildRequired(f"{def_rel} now describes another {kind}")
+
+        if old_id is None and (kind, entity_id) in owners:
+            raise FullRebuildRequired(f"{def_rel} duplicates {owners[(kind, entity_id)][0]}")
+
+        self._record_source(entry["path"], kind, entity_id)
+        return old_id is None
+
+    def _reset_entity(self, conn, kind, entity_id):
+        if kind == "mcu":
+            conn.execute("update ad_mcu set created=null, updated=null where id=?", (entity_id,))
+            conn.execute("delete from ad_mcu_evidence where mcu_id=?", (entity_id,))
+        elif kind == "ecu":
+            conn.execute("""
+                update ad_ecu
+                set mcu_id=null, type=null, created=null, updated=null
+                where id=?
+            """, (entity_id,))
+            conn.execute("delete from ad_ecu_evidence where ecu_id=?", (entity_id,))
+        elif kind == "engine":
+            conn.execute("""
+                update ad_engine
+                set fuel=null, created=null, updated=null
+                where id=?
+            """, (entity_id,))
+            conn.execute("delete from ad_engine_evidence where engine_id=?", (entity_id,))
+            conn.execute("delete from ad_engine_name where engine_id=?", (entity_id,))
+        elif kind == "vehicle":
+            conn.execute("update ad_vehicle set created=null, updated=null where id=?", (entity_id,))
+            conn.execute("delete from ad_vehicle_evidence where vehicle_id=?", (entity_id,))
+
+        self._delete_conflicts(conn, kind, "select ?", (entity_id,))
+
+    def _delete_conflicts(self, conn, entity_type, entity_ids, params):
+        conflicts = f"""
+            select id from ad_conflict
+            where entity_type=?
+            and entity_id in ({entity_ids})
+        """
+        values = f"select id from ad_conflict_value where conflict_id in ({conflicts})"
+        params = (entity_type,) + tuple(params)
+
+        conn.execute(f"delete from ad_conflict_value_evidence where conflict_value_id in ({values})", params)
+        conn.execute(f"delete from ad_conflict_value where conflict_id in ({conflicts})", params)
+        conn.execute(f"delete from ad_conflict where id in ({conflicts})", params)
+
+    def _reingest_dtc(self, conn, path, changes, stored):
+        old = stored.get(path)
+        dtc_id = old[4] if old else None
+
+        if path in changes["deleted"]:
+            if dtc_id is not None:
+                self._delete_dtc(conn, dtc_id)
+            return None
+
+        ecu_def = f"{path.rsplit('/', 2)[0]}/def.yml"
+        ecu = self._sources.get(ecu_def) or (stored[ecu_def][3:] if ecu_def in stored else None)
+        ecu_id = ecu[1] if ecu else None
+
+        if ecu_id is None:
+            return None
+
+        file = self._read_yaml(self.plain_text_db / path)
+
+        if dtc_id is None:
+            dtc_id = self._insert_dtc(conn, ecu_id, file)
+        else:
+            self._delete_dtc_links(conn, dtc_id)
             conn.execute("""
-                insert into ad_dtc_related(dtc_id, related_dtc_id)
-                select ?, id
-                from ad_dtc
-                where code=?
-                  and ecu_id=?
-            """, (dtc_id, code, ecu_id))
+                update ad_dtc
+                set code=?,
+                    definition=?,
+                    description=?,
+                    mil=?,
+                    created=?,
+                    updated=?,
+                    detection_condition=?,
+                    causes=?,
+                    repairs=?
+                where id=?
+            """, self._dtc_values(file) + (dtc_id,))
+            self._link_dtc(conn, dtc_id, ecu_id, file)
+
+        self._record_source(self.plain_text_db / path, "dtc", dtc_id)
+        return ecu_id
+
+    def _relink_related(self, conn, ecu_ids, stored):
+        # the unchanged files may reference (or have referenced) a changed code
+        if not ecu_ids:
+            return
+
+        sources = {path: (entry[3], entry[4]) for path, entry in stored.items()}
+        sources.update(self._sources)
+
+        for ecu_id in sorted(ecu_ids):
+            conn.execute("delete from temp.ad_dtc_related_stage where ecu_id=?", (ecu_id,))
+            conn.execute("""
+                delete from ad_dtc_related
+                where dtc_id in (select id from ad_dtc where ecu_id=?)
+            """, (ecu_id,))
+
+            for ecu_def in sorted(p for p, source in sources.items() if source == ("ecu", ecu_id)):
+                codes_path = (self.plain_text_db / ecu_def).parent / "codes"
+                if not self._is_source_dir(codes_path):
+                    continue
+
+                for y, file in self._iter_codes(codes_path):
+                    source = sources.get(self._relative_source(y))
+                    if source and source[0] == "dtc":
+                        self._insert_related_codes(conn, source[1], file.get("related_code"), ecu_id)
+
+        self._resolve_related(conn)
+
+    def _delete_dtc_links(self, conn, dtc_id):
+        for table in (
+            "ad_dtc_evidence",
+            "ad_dtc_standard_link",
+            "ad_dtc_protocol_link",
+            "ad_dtc_related",
+            "ad_dtc_system_link",
+            "ad_dtc_subsystem_link",
+            "ad_dtc_category_link",
+            "ad_dtc_severity_link",
+        ):
+            conn.execute(f"delete from {table} where dtc_id=?", (dtc_id,))
+
+    def _delete_dtc(self, conn, dtc_id):
+        self._delete_dtc_links(conn, dtc_id)
+        conn.execute("delete from ad_dtc_related where related_dtc_id=?", (dtc_id,))
+        conn.execute("delete from ad_dtc where id=?", (dtc_id,))
+
+    def _reingest_vehicle(self, conn, rel_dir, stored, owners):
+        def_rel = f"{rel_dir}/def.yml"
+        old = stored.get(def_rel)
+        vehicle_id = old[4] if old else None
+
+        if vehicle_id is not None:
+            if 1 < len(owners[("vehicle", vehicle_id)]):
+                raise FullRebuildRequired(f"{def_rel} shares its vehicle with another directory")
+            self._delete_vehicle_versions(conn, vehicle_id)
+            self._reset_entity(conn, "vehicle", vehicle_id)
+
+        vehicle_dir = self.plain_text_db / rel_dir
+        seen = set()
+
+        if self._is_source_dir(vehicle_dir):
+            manufacturer = self._manufacturer_name(vehicle_dir.parent)
+            for entry in self._iter_vehicle_dir_entries(conn, manufacturer, vehicle_dir):
+                self._load_vehicle_entry(conn, entry, seen)
+
+        source = self._sources.get(def_rel)
+
+        if source is None:
+            if vehicle_id is not None:
+                conn.execute("delete from ad_vehicle where id=?", (vehicle_id,))
+                self._ids.clear()
+            return
+
+        if vehicle_id is not None and source[1] != vehicle_id:
+            raise FullRebuildRequired(f"{def_rel} now describes another vehicle")
+
+        if vehicle_id is None and source in owners:
+            raise FullRebuildRequired(f"{def_rel} duplicates {owners[source][0]}")
+
+    def _delete_vehicle_versions(self, conn, vehicle_id):
+        versions = "select id from ad_vehicle_version where vehicle_id=?"
+        configs = f"select id from ad_vehicle_version_config where vehicle_version_id in ({versions})"
+        config_ecus = f"select id from ad_vehicle_version_config_ecu where config_id in ({configs})"
+        protocols = f"""
+            select id from ad_vehicle_version_config_ecu_protocol
+            where vehicle_version_config_ecu_id in ({config_ecus})
+        """
+        params = (vehicle_id,)
+
+        self._delete_conflicts(conn, "vehicle_version", versions, params)
+        conn.execute(f"delete from ad_vehicle_version_config_ecu_protocol_param where protocol_id in ({protocols})", params)
+        conn.execute(f"delete from ad_vehicle_version_config_ecu_protocol where id in ({protocols})", params)
+        conn.execute(f"delete from ad_vehicle_version_config_ecu where id in ({config_ecus})", params)
+        conn.execute(f"delete from ad_vehicle_version_config_evidence where config_id in ({configs})", params)
+        conn.execute(f"delete from ad_vehicle_version_config where id in ({configs})", params)
+        conn.execute(f"delete from ad_vehicle_version_evidence where vehicle_version_id in ({versions})", params)
+        conn.execute("delete from ad_vehicle_version where vehicle_id=?", params)
+
+    def _delete_orphans(self, conn):
+        conn.execute("""
+            delete from ad_evidence
+            where id not in (
+                select evidence_id from ad_manufacturer_evidence
+                union select evidence_id from ad_vehicle_version_config_evidence
+                union select evidence_id from ad_vehicle_evidence
+                union select evidence_id from ad_vehicle_version_evidence
+                union select evidence_id from ad_engine_evidence
+                union select evidence_id from ad_ecu_evidence
+                union select evidence_id from ad_mcu_evidence
+                union select evidence_id from ad_conflict_value_evidence
+                union select evidence_id from ad_dtc_evidence
+            )
+        """)
+
+        for table, link, field in (
+            ("ad_dtc_standard", "ad_dtc_standard_link", "standard_id"),
+            ("ad_diag_protocol", "ad_dtc_protocol_link", "protocol_id"),
+            ("ad_dtc_system", "ad_dtc_system_link", "system_id"),
+            ("ad_dtc_subsystem", "ad_dtc_subsystem_link", "subsystem_id"),
+            ("ad_dtc_category", "ad_dtc_category_link", "category_id"),
+            ("ad_dtc_severity", "ad_dtc_severity_link", "severity_id"),
+        ):
+            conn.execute(f"delete from {table} where id not in (select {field} from {link})")
+
+        self._ids.clear()
+
+    def _record_source(self, path, entity_type, entity_id, advance=True):
+        path = self._relative_source(path)
+        if advance and self._progress is not None and path not in self._sources:
+            self._progress.advance()
+        self._sources[path] = (entity_type, entity_id)
+
+    def _relative_source(self, path):
+        return Path(path).relative_to(self.plain_text_db).as_posix()
+
+    def _tree(self):
+        if self._source_tree is None:
+            self._source_tree = manifest.SourceTree(self.plain_text_db)
+        return self._source_tree
+
+    def _tree_key(self, path):
+        # references read from YAML may hold ".."
+        return self._tree().resolve(self._relative_source(os.path.normpath(path)))
+
+    def _subdirs(self, directory):
+        return [directory / name for name in self._tree().subdirs(self._tree_key(directory))]
+
+    def _yml_files(self, directory):
+        return [directory / name for name in self._tree().yml_files(self._tree_key(directory))]
+
+    def _is_source_file(self, path):
+        return self._tree().is_file(self._tree_key(path))
+
+    def _is_source_dir(self, path):
+        return self._tree().is_dir(self._tree_key(path))
+
+    def _save_yaml_cache(self):
+        if self._yaml_cache is not None:
+            self._yaml_cache.save()
+
+    def _log_build_stats(self):
+        if self._yaml_cache is not None:
+            self.log(f"YAML cache: {self._yaml_cache.hits} hits, {self._yaml_cache.misses} parsed")
+        stats = self._ids.stats()
+        self.log(f"Identity map: {stats['hits']} hits, {stats['misses']} misses")
+        self.log(f"DTC writer: {self._dtc_writer.rows} rows in {self._dtc_writer.calls} executemany calls")
+        for name, cache in (
+            ("Reference cache", self._reference),
+            ("Reference id cache", self._reference_id),
+            ("Timestamp cache", _parse_timestamp),
+        ):
+            info = cache.cache_info()
+            self.log(f"{name}: {info.hits} hits, {info.misses} misses, {info.currsize}/{info.maxsize} entries")
+
+    def _stage(self, name):
+        if self._profiler is None:
+            return nullcontext()
+        return self._profiler.stage(name)
+
+    def _write_lite_db(self):
+        if self.lite_db is None:
+            return
+        self.log(f"Writing lite database {self.lite_db} ...")
+        with self._stage("lite"):
+            lite_database.write_lite_database(self.sqlite_db, self.lite_db)
+        self.log(f"Lite database: {self.lite_db.stat().st_size / 1e6:.2f} MB, full database: {self.sqlite_db.stat().st_size / 1e6:.2f} MB")
+
+    def _report_profile(self):
+        if self._profiler is None:
+            return
+
+        for line in self._profiler.summary():
+            self.log(line)
+        if self.profile_json is not None:
+            self._profiler.write_json(self.profile_json)
+            self.log(f"Stage profile written to {self.profile_json}")
 
     def log(self, text):
         if self.logger:
@@ -1909,59 +3432,247 @@ class ConverterToSqlite():
         else:
             print(text)
 
-    def to_sqlite(self, progress_callback) -> bool:
+    def to_sqlite(self, progress_callback, info_callback=None) -> bool:
         if self.plain_text_db is None or self.sqlite_db is None:
             return False
 
         Path("output").mkdir(parents=True, exist_ok=True)
-        conn = self._connect()
-        progress_callback(0, 6)
-        self._create_schema(conn)
-        self._clear_tables(conn)
-        progress_callback(1, 6)
+        self._progress = None
+        self._sources = {}
+        self._ids = IdentityMap()
+        self._reset_reference_cache()
+        self._profiler = StageProfiler() if self.profile_stages else None
+
+        with self._stage("scan"):
+            self._source_tree = manifest.SourceTree(self.plain_text_db)
+            current = self._source_tree.files
+            if self.cache_dir is not None:
+                self._yaml_cache = YamlCache.for_tree(self.cache_dir, self.plain_text_db)
+            elif self.validate:
+                # no cache file, the files parsed by the validation are kept in memory for the load
+                self._yaml_cache = YamlCache(root=self.plain_text_db)
+            else:
+                self._yaml_cache = None
+            if self._yaml_cache is not None:
+                self._yaml_cache.sync(current)
+        total = count_files(current)
+        progress_callback(0, total)
+
+        if self.validate:
+            with self._stage("validate"):
+                self.log("Validating data-src ...")
+                problems = self._validate_source()
+            if problems:
+                for problem in problems:
+                    self.log(problem)
+                self.log(f"{len(problems)} problems found in {self.plain_text_db}, nothing was written")
+                self._save_yaml_cache()
+                return False
+
+        if self.incremental:
+            conn = self._connect()
+            with self._stage("incremental"):
+                self._create_schema(conn)
+                self._reset_dtc_writer(conn)
+                self.log("Looking for changes ...")
+                updated = self._update_incremental(conn, current)
+            if updated:
+                with self._stage("commit"):
+                    self._save_yaml_cache()
+                    self._log_build_stats()
+                    self.log("Commiting changes ...")
+                    conn.commit()
+                    conn.close()
+                    self._save_manifest()
+                self.log("Changes commited !")
+                self._write_lite_db()
+                self._report_profile()
+                progress_callback(total, total)
+                return True
+            conn.close()
+            self.log("Running a full rebuild ...")
+
+        self._progress = BuildProgress(progress_callback, total, info_callback)
+        with self._stage("setup"):
+            if self.atomic:
+                conn = self._open_build()
+            else:
+                conn = self._connect(profile=self.profile)
+                self._create_schema(conn, self.defer_indexes)
+                self._clear_tables(conn)
+            self._reset_dtc_writer(conn, empty=True)
+
         self.log("Loading MCUs ...")
-        self._load_mcus(conn)
-        progress_callback(2, 6)
+        self._progress.stage("MCUs", conn)
+        with self._stage("mcus"):
+            self._load_mcus(conn)
         self.log("Loading ECUs ...")
-        self._load_ecus(conn)
-        progress_callback(3, 6)
+        self._progress.stage("ECUs", conn)
+        with self._stage("ecus"):
+            self._load_ecus(conn)
         self.log("Loading Engines ...")
-        self._load_engines(conn)
-        progress_callback(4, 6)
+        self._progress.stage("Engines", conn)
+        with self._stage("engines"):
+            self._load_engines(conn)
         self.log("Loading Vehicles ...")
-        self._load_vehicles(conn)
-        progress_callback(5, 6)
-        self.log("Commiting changes ...")
-        conn.commit()
-        conn.close()
+        self._progress.stage("Vehicles", conn)
+        with self._stage("vehicles"):
+            self._load_vehicles(conn)
+        self._progress.stage("Finishing", conn)
+        if self.atomic:
+            self.log("Copying other tables ...")
+            with self._stage("carry over"):
+                self._carry_over_tables(conn)
+        with self._stage("optimize"):
+            self._optimize(conn)
+        self._progress.stage("Commit")
+        with self._stage("commit"):
+            sqlite_profile.make_durable(conn)
+            self.log("Writing manifest ...")
+            self._write_manifest(conn, current, {}, {})
+            self._save_yaml_cache()
+            self._log_build_stats()
+            self.log("Commiting changes ...")
+            conn.commit()
+            if self.atomic:
+                self._finalize_build(conn)
+            else:
+                conn.close()
+            self._save_manifest()
         self.log("Changes commited !")
-        progress_callback(6, 6)
+        self._write_lite_db()
+        self._report_profile()
+        self._progress.finish()
+        self._progress = None
         return True
 
 
 def main():
     base = Path(__file__).resolve().parent.parent.parent
 
-    src = base / "data-src"
-    dst = base / "data" / "ad_database.sqlite"
-
-    if 1 < len(sys.argv):
-        src = Path(sys.argv[1])
-    if 2 < len(sys.argv):
-        dst = Path(sys.argv[2])
-
-    converter = ConverterToSqlite(sqlite_db=dst, plain_text_db=src)
-    bar = {"pbar": None, "total": 0}
+    parser = argparse.ArgumentParser(description="Compile the plain text database to sqlite")
+    parser.add_argument("src", nargs="?", type=Path, default=base / "data-src")
+    parser.add_argument("dst", nargs="?", type=Path, default=base / "data" / "ad_database.sqlite")
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        help="worker processes used to parse DTC files (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only reload the entities whose files changed since the previous build",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=ConverterToSqlite.BATCH_SIZE,
+        help="DTC rows written per executemany batch (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--atomic",
+        action="store_true",
+        help="build into a new file and swap it over the destination once finished",
+    )
+    parser.add_argument(
+        "--profile",
+        choices=("bulk", "durable"),
+        default="bulk",
+        help="sqlite settings used while loading, --atomic builds skip the journal with bulk (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--defer-indexes",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="create the indexes not needed while loading once the data is in (default: on)",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="keep the parsed YAML files between builds in --cache-dir",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=yaml_cache.CACHE_DIR,
+        help="where --cache keeps the parsed YAML files (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--read-indexes",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="build the indexes used by the query and stats tabs (default: on)",
+    )
+    parser.add_argument(
+        "--sharded",
+        action="store_true",
+        help="load the DTCs of each ECU manufacturer in its own sqlite file in parallel, then merge them",
+    )
+    parser.add_argument(
+        "--lite",
+        type=Path,
+        nargs="?",
+        const=True,
+        help="also write the minimal database for embedded scantools, DTC definitions per ECU only"
+             " (default file: ad_database_lite.sqlite next to dst)",
+    )
+    parser.add_argument(
+        "--validate",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="check every YAML file of src before writing anything and report all the problems (default: off)",
+    )
+    parser.add_argument(
+        "--profile-stages",
+        action="store_true",
+        help="print the time, files, statements and rows of each build stage",
+    )
+    parser.add_argument(
+        "--profile-json",
+        type=Path,
+        help="also write the stage profile to this JSON file",
+    )
+    args = parser.parse_args()
+
+    src = args.src
+    dst = args.dst
+
+    converter = ConverterToSqlite(
+        sqlite_db=dst,
+        plain_text_db=src,
+        jobs=args.jobs,
+        incremental=args.incremental,
+        batch_size=args.batch_size,
+        atomic=args.atomic,
+        profile=args.profile,
+        defer_indexes=args.defer_indexes,
+        cache_dir=args.cache_dir if args.cache else None,
+        profile_stages=args.profile_stages,
+        profile_json=args.profile_json,
+        sharded=args.sharded,
+        read_indexes=args.read_indexes,
+        lite_db=dst.with_name("ad_database_lite.sqlite") if args.lite is True else args.lite,
+        validate=args.validate,
+    )
+    bar = {"pbar": None, "total": 0, "info": ""}
 
     def progress_hook(current, total):
         if bar["pbar"] is None:
             bar["total"] = total
-            bar["pbar"] = tqdm(total=total, unit="item")
+            bar["pbar"] = tqdm(total=total, unit="file")
+        elif total != bar["pbar"].total:
+            bar["pbar"].total = total
+        if bar["info"]:
+            bar["pbar"].set_postfix_str(bar["info"], refresh=False)
         delta = current - bar["pbar"].n
         if 0 < delta:
             bar["pbar"].update(delta)
 
-    ok = converter.to_sqlite(progress_callback=progress_hook)
+    def info_hook(info):
+        bar["info"] = describe(info)
+
+    ok = converter.to_sqlite(progress_callback=progress_hook, info_callback=info_hook)
 
     if bar["pbar"] is not None:
         bar["pbar"].close()
@@ -1981,7 +3692,7 @@ def main():
         pg_schema="vpic",
     )
 
-    bar = {"pbar": None, "total": 0}
+    bar = {"pbar": None, "total": 0, "info": ""}
 
     ok = loader.load(progress_callback=progress_hook)
 
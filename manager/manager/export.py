@@ -0,0 +1,205 @@
+#!python3
+import argparse
+import csv
+import gzip
+import itertools
+import os
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+FORMATS = ("jsonl", "csv")
+COMPRESS_LEVEL = 6
+
+# every query has an id and a manufacturer_id column, rows are sorted on them
+DATASETS = {
+    "dtcs": """
+        select
+            f.dtc_id as id, f.code, e.manufacturer_id, f.manufacturer, f.ecu_id, f.ecu_model, f.ecu_type,
+            f.definition, f.description, f.mil, f.created, f.updated,
+            f.detection_condition, f.causes, f.repairs,
+            f.standards, f.protocols, f.systems, f.subsystems, f.categories, f.severities,
+            f.related_codes, f.evidence
+        from ad_dtc_flat f
+        left join ad_ecu e on e.id = f.ecu_id
+    """,
+    "ecus": """
+        select
+            e.id, e.manufacturer_id, m.name as manufacturer, e.model, e.type, mcu.model as mcu,
+            (select count(*) from ad_dtc d where d.ecu_id = e.id) as dtc_count,
+            e.created, e.updated
+        from ad_ecu e
+        join ad_manufacturer m on m.id = e.manufacturer_id
+        left join ad_mcu mcu on mcu.id = e.mcu_id
+    """,
+    "vehicles": """
+        select v.id, v.manufacturer_id, m.name as manufacturer, v.model, v.type, v.created, v.updated
+        from ad_vehicle v
+        join ad_manufacturer m on m.id = v.manufacturer_id
+    """,
+    "configs": """
+        with ecus as (
+            select config_id, json_group_array(ecu_id) as ecu_ids
+            from (select config_id, ecu_id from ad_vehicle_version_config_ecu order by config_id, ecu_id)
+            group by config_id
+        )
+        select
+            c.id, v.manufacturer_id, m.name as manufacturer, v.id as vehicle_id, v.model,
+            vv.id as version_id, vv.version, vv.year,
+            c.engine_id, en.code as engine_code, en.fuel, c.power_kw,
+            coalesce(ecus.ecu_ids, '[]') as ecu_ids
+        from ad_vehicle_version_config c
+        join ad_vehicle_version vv on vv.id = c.vehicle_version_id
+        join ad_vehicle v on v.id = vv.vehicle_id
+        join ad_manufacturer m on m.id = v.manufacturer_id
+        left join ad_engine en on en.id = c.engine_id
+        left join ecus on ecus.config_id = c.id
+    """,
+}
+
+# json text in the database, nested values in jsonl and text in csv
+JSON_COLUMNS = {"detection_condition", "causes", "repairs", "ecu_ids"}
+
+def _file_stems(conn):
+    """
+    File name of each manufacturer when splitting, on the first come basis of ids:
+    a name clashing with an earlier one once made file safe (case insensitively) gets its id appended.
+    """
+    stems = {}
+    used = set()
+    for manufacturer_id, name in conn.execute("select id, name from ad_manufacturer order by id"):
+        stem = re.sub(r"[^A-Za-z0-9_.-]", "_", re.sub(r"\s", "_", name.strip())).strip(".") or "_"
+        if stem.lower() in used:
+            stem = f"{stem}-{manufacturer_id}"
+        used.add(stem.lower())
+        stems[manufacturer_id] = stem
+    return stems
+
+def _open(path: Path, compress: bool):
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=COMPRESS_LEVEL)
+    return open(path, "w", encoding="utf-8", newline="")
+
+def _write(path: Path, rows, fmt, columns, compress):
+    """
+    Stream rows to path through a temporary file, return the number of rows.
+    The first value of a row is its manufacturer id and is not written.
+    """
+    count = 0
+    tmp = path.with_name(path.name + ".tmp")
+    with _open(tmp, compress) as f:
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow(row[1:])
+                count += 1
+        else:
+            for _, line in rows:
+                f.write(line)
+                f.write("\n")
+                count += 1
+    os.replace(tmp, path)
+    return count
+
+def _fields(columns, fmt):
+    """
+    Select list of a dataset: its columns for csv, for jsonl the line itself built by sqlite.
+    """
+    if fmt == "csv":
+        return ", ".join(f'"{column}"' for column in columns)
+    pairs = (
+        f"'{column}', json(\"{column}\")" if column in JSON_COLUMNS else f"'{column}', \"{column}\""
+        for column in columns
+    )
+    return f"json_object({', '.join(pairs)})"
+
+def _previous_files(dataset_dir: Path, overwrite: bool):
+    """
+    Files of a previous split export of a dataset, the ones of a manufacturer gone
+    since would be left behind by the new export.
+    """
+    if not dataset_dir.is_dir():
+        return []
+    files = list(dataset_dir.iterdir())
+    if files and not overwrite:
+        raise ValueError(f"{dataset_dir} is not empty, remove it or use --overwrite")
+    for path in files:
+        if path.is_dir():
+            raise ValueError(f"{dataset_dir} holds the directory {path.name}, not an export")
+    return files
+
+def export(db: Path, out_dir: Path, fmt="jsonl", compress=False, split=False, datasets=tuple(DATASETS), overwrite=False):
+    """
+    Write each dataset of db to out_dir/<dataset>.<fmt>[.gz], or with split to
+    out_dir/<dataset>/<manufacturer>.<fmt>[.gz]. Rows are streamed from the cursor to
+    the file, one file open at a time, jsonl lines come encoded from sqlite. Returns [(path, rows)].
+    A split export refuses a non-empty dataset directory, overwrite empties it first.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format {fmt}, expected one of {', '.join(FORMATS)}")
+    unknown = [name for name in datasets if name not in DATASETS]
+    if unknown:
+        raise ValueError(f"unknown dataset {', '.join(unknown)}, expected some of {', '.join(DATASETS)}")
+
+    suffix = f".{fmt}" + (".gz" if compress else "")
+    out_dir = Path(out_dir)
+    if split:
+        previous = [path for name in datasets for path in _previous_files(out_dir / name, overwrite)]
+        for path in previous:
+            path.unlink()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+
+    conn = sqlite3.connect(Path(db).resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        stems = _file_stems(conn) if split else None
+        for name in datasets:
+            sql = DATASETS[name]
+            columns = [d[0] for d in conn.execute(f"select * from ({sql}) limit 0").description]
+            order = "manufacturer_id, id" if split else "id"
+            cursor = conn.execute(f"select manufacturer_id, {_fields(columns, fmt)} from ({sql}) order by {order}")
+            if not split:
+                path = out_dir / f"{name}{suffix}"
+                written.append((path, _write(path, cursor, fmt, columns, compress)))
+                continue
+
+            dataset_dir = out_dir / name
+            dataset_dir.mkdir(exist_ok=True)
+            for manufacturer_id, rows in itertools.groupby(cursor, key=lambda row: row[0]):
+                path = dataset_dir / f"{stems.get(manufacturer_id, '_unknown')}{suffix}"
+                written.append((path, _write(path, rows, fmt, columns, compress)))
+    finally:
+        conn.close()
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Export DTCs, ECUs, vehicles and configs of a sqlite build to JSON Lines or CSV files")
+    parser.add_argument("db", type=Path)
+    parser.add_argument("out_dir", type=Path)
+    parser.add_argument("--format", choices=FORMATS, default="jsonl")
+    parser.add_argument("--gzip", action="store_true", help="compress the files")
+    parser.add_argument("--split", action="store_true", help="one file per manufacturer in a directory per dataset")
+    parser.add_argument("--datasets", default=",".join(DATASETS), help="comma separated (default: %(default)s)")
+    parser.add_argument("--overwrite", action="store_true", help="with --split, empty the dataset directories of a previous export")
+    args = parser.parse_args()
+
+    if not args.db.is_file():
+        print(f"error: {args.db} not found", file=sys.stderr)
+        sys.exit(1)
+
+    start = time.perf_counter()
+    try:
+        written = export(args.db, args.out_dir, args.format, args.gzip, args.split, args.datasets.split(","), args.overwrite)
+    except (ValueError, sqlite3.Error) as e:
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    total_rows = sum(rows for _, rows in written)
+    total_bytes = sum(path.stat().st_size for path, _ in written)
+    print(f"{total_rows} rows in {len(written)} files, {total_bytes} bytes, {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
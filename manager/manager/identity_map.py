@@ -0,0 +1,69 @@
+import re
+import sqlite3
+
+# row ids resolved during a build, by value or by the LIKE pattern used to find them
+class IdentityMap():
+    def __init__(self):
+        self._scopes = {}
+        self._patterns = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, scope, key):
+        row_id = self._scopes.get(scope, {}).get(key)
+        if row_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return row_id
+
+    def add(self, scope, key, row_id):
+        if row_id is not None:
+            self._scopes.setdefault(scope, {})[key] = row_id
+        return row_id
+
+    def claim(self, scope, key, constraint):
+        # checked here, the unique indexes are created after the load
+        entries = self._scopes.setdefault(scope, {})
+        if key in entries:
+            raise sqlite3.IntegrityError(f"UNIQUE constraint failed: {constraint}")
+        entries[key] = True
+
+    def inserted(self, scope, value):
+        # the new row could now be the one a cached LIKE pattern resolves to
+        entries = self._scopes.get(scope)
+        if not entries:
+            return
+
+        value = str(value)
+        for key in [k for k in entries if isinstance(k, tuple) and k[0] == "like"]:
+            if self._pattern(key[1]).fullmatch(value):
+                del entries[key]
+
+    def clear(self, counters=False):
+        # the counters add up across the clears of a build
+        self._scopes = {}
+        if counters:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": sum(len(entries) for entries in self._scopes.values()),
+        }
+
+    def _pattern(self, pattern):
+        regex = self._patterns.get(pattern)
+        if regex is None:
+            # sqlite LIKE: '_' matches any single character, case is ignored for ascii only
+            regex = re.compile(
+                "".join("." if c == "_" else re.escape(c) for c in pattern),
+                re.IGNORECASE | re.ASCII | re.DOTALL,
+            )
+            self._patterns[pattern] = regex
+        return regex
+
+def like_key(value):
+    return ("like", value.lower())
@@ -0,0 +1,93 @@
+import os
+import sqlite3
+from pathlib import Path
+
+# small pages: a lookup reads a few pages from flash and the last page of each b-tree wastes less
+PAGE_SIZE = 1024
+
+LITE_SCHEMA = """
+    create table ad_manufacturer(
+        id integer primary key,
+        name text not null
+    );
+
+    create table ad_ecu(
+        id integer primary key,
+        manufacturer_id integer not null,
+        model text not null,
+        type text
+    );
+
+    create unique index ad_ecu_uq on ad_ecu(manufacturer_id, model);
+
+    create table ad_text(
+        id integer primary key,
+        text text not null
+    );
+
+    create table ad_dtc(
+        ecu_id integer not null,
+        code text not null,
+        definition_id integer,
+        description_id integer,
+        mil integer,
+        primary key(ecu_id, code)
+    ) without rowid;
+"""
+
+def write_lite_database(full_db: Path, lite_db: Path, page_size: int = PAGE_SIZE):
+    """
+    Write the DTC definitions of each ECU of full_db to lite_db, all a scantool needs:
+    manufacturers, ECUs and their codes, definitions and descriptions stored once in ad_text.
+    No evidence, conflicts, timestamps, causes or repairs, nor DTCs without a code. Ids are the ones of full_db.
+    """
+    lite_db = Path(lite_db)
+    build_path = lite_db.with_name(lite_db.name + ".build")
+    build_path.unlink(missing_ok=True)
+
+    conn = sqlite3.connect(build_path)
+    try:
+        conn.execute(f"pragma page_size = {int(page_size)}")
+        conn.execute("pragma journal_mode = off")
+        conn.execute("pragma synchronous = off")
+        conn.executescript(LITE_SCHEMA)
+        conn.execute("attach database ? as full", (str(full_db),))
+
+        conn.executescript("""
+            insert into ad_manufacturer(id, name)
+            select id, name from full.ad_manufacturer
+            where id in (select manufacturer_id from full.ad_ecu where id in (select ecu_id from full.ad_dtc where code is not null))
+            order by id;
+
+            insert into ad_ecu(id, manufacturer_id, model, type)
+            select id, manufacturer_id, model, type from full.ad_ecu
+            where id in (select ecu_id from full.ad_dtc where code is not null)
+            order by id;
+
+            insert into ad_text(text)
+            select definition from full.ad_dtc where code is not null and definition <> ''
+            union
+            select description from full.ad_dtc where code is not null and description <> ''
+            order by 1;
+
+            create index ad_text_text on ad_text(text);
+
+            insert into ad_dtc(ecu_id, code, definition_id, description_id, mil)
+            select d.ecu_id, d.code, def.id, des.id, d.mil
+            from full.ad_dtc d
+            left join ad_text def on def.text = d.definition
+            left join ad_text des on des.text = d.description
+            where d.code is not null;
+
+            drop index ad_text_text;
+        """)
+        conn.commit()
+        conn.execute("detach database full")
+        conn.execute("analyze")
+        conn.commit()
+        conn.execute("vacuum")
+    finally:
+        conn.close()
+
+    os.replace(build_path, lite_db)
+    return lite_db
@@ -0,0 +1,159 @@
+from pathlib import Path
+import hashlib
+import itertools
+import os
+import sqlite3
+import unicodedata
+
+# one os.scandir pass, paths are relative posix paths, "" being root
+class SourceTree():
+    def __init__(self, root):
+        self.root = Path(root)
+        self.files = {}
+        self._dirs = {}
+        self._folded = None
+        self._scan("", str(self.root))
+
+    def _scan(self, relative, path):
+        subdirs, files = [], []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        subdirs.append(entry)
+                    elif entry.name.endswith(".yml"):
+                        files.append(entry)
+        except OSError:
+            return
+
+        subdirs.sort(key=lambda entry: entry.name)
+        files.sort(key=lambda entry: entry.name)
+        self._dirs[relative] = ([entry.name for entry in subdirs], [entry.name for entry in files])
+        prefix = relative + "/" if relative else ""
+
+        for entry in files:
+            st = entry.stat()
+            self.files[prefix + entry.name] = (st.st_size, st.st_mtime_ns)
+        for entry in subdirs:
+            self._scan(prefix + entry.name, entry.path)
+
+    def resolve(self, relative, fold=False):
+        # with fold, or on a case insensitive filesystem, a path matches the entry of the same folded name
+        if relative in self.files or relative in self._dirs:
+            return relative
+        if not fold and not os.path.exists(os.path.join(self.root, relative)):
+            return None
+        if self._folded is None:
+            self._folded = {}
+            for key in itertools.chain(self._dirs, self.files):
+                self._folded.setdefault(_fold(key), key)
+        return self._folded.get(_fold(relative))
+
+    def is_dir(self, relative):
+        return relative in self._dirs
+
+    def is_file(self, relative):
+        return relative in self.files
+
+    def subdirs(self, relative):
+        return self._dirs.get(relative, ((), ()))[0]
+
+    def yml_files(self, relative):
+        return self._dirs.get(relative, ((), ()))[1]
+
+def _fold(relative):
+    return unicodedata.normalize("NFC", relative).casefold()
+
+def scan(root):
+    return SourceTree(root).files
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def diff(stored, current, root):
+    # files whose size or mtime moved are hashed, only a different hash counts as modified
+    root = Path(root)
+    changes = {
+        "added": set(),
+        "modified": set(),
+        "deleted": set(stored) - set(current),
+        "hashes": {},
+    }
+
+    for path, (size, mtime_ns) in current.items():
+        old = stored.get(path)
+
+        if old is None:
+            changes["added"].add(path)
+            changes["hashes"][path] = file_hash(root / path)
+            continue
+
+        if old[0] == size and old[1] == mtime_ns:
+            continue
+
+        digest = file_hash(root / path)
+        changes["hashes"][path] = digest
+        if digest != old[2]:
+            changes["modified"].add(path)
+
+    return changes
+
+def sidecar_path(db):
+    # kept out of the database so it is not shipped with it
+    db = Path(db)
+    return db.with_name(db.name + ".manifest")
+
+def read_sidecar(db, build_id):
+    # empty when there is none or it was written for another build than build_id
+    path = sidecar_path(db)
+    if build_id is None or not path.exists():
+        return {}
+
+    try:
+        conn = sqlite3.connect(path.resolve().as_uri() + "?mode=ro", uri=True)
+        try:
+            row = conn.execute("select id from ad_build").fetchone()
+            if row is None or row[0] != build_id:
+                return {}
+            return {
+                row[0]: (row[1], row[2], row[3].hex(), row[4], row[5])
+                for row in conn.execute("""
+                    select path, size, mtime_ns, hash, entity_type, entity_id
+                    from ad_build_manifest
+                """)
+            }
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return {}
+
+def write_sidecar(db, build_id, rows):
+    path = sidecar_path(db)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.unlink(missing_ok=True)
+
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript("""
+            create table ad_build(id text not null);
+
+            create table ad_build_manifest(
+                path text primary key,
+                size integer not null,
+                mtime_ns integer not null,
+                hash blob not null,
+                entity_type text,
+                entity_id integer
+            ) without rowid;
+        """)
+        conn.execute("insert into ad_build(id) values(?)", (build_id,))
+        conn.executemany(
+            "insert into ad_build_manifest values(?,?,?,?,?,?)",
+            ((p, size, mtime_ns, bytes.fromhex(digest), entity_type, entity_id)
+             for p, size, mtime_ns, digest, entity_type, entity_id in rows),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, path)
@@ -0,0 +1,29 @@
+# "scratch" drops the journal and fsyncs, only for files thrown away when a build fails
+# page_size only applies to a database that has no table yet
+
+BULK = (
+    ("page_size", 8192),
+    ("cache_size", -262144),
+    ("temp_store", "memory"),
+)
+
+PROFILES = {
+    "bulk": BULK,
+    "scratch": BULK + (
+        ("journal_mode", "off"),
+        ("synchronous", "off"),
+    ),
+    "durable": (
+        ("journal_mode", "delete"),
+        ("synchronous", "full"),
+        ("temp_store", "default"),
+    ),
+}
+
+def apply(conn, profile):
+    for name, value in PROFILES[profile]:
+        conn.execute(f"pragma {name} = {value}")
+
+def make_durable(conn):
+    conn.commit()
+    apply(conn, "durable")
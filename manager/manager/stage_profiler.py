@@ -0,0 +1,138 @@
+from contextlib import contextmanager
+from pathlib import Path
+import json
+import re
+import sqlite3
+import time
+
+# table of the main database written by an insert, update or delete statement
+WRITTEN_TABLE = re.compile(
+    r'^\s*(?:insert(?:\s+or\s+\w+)?\s+into|replace\s+into|update(?:\s+or\s+\w+)?|delete\s+from)\s+(?!temp\.)(?:main\.)?"?(\w+)',
+    re.IGNORECASE,
+)
+
+class StageProfiler():
+    """
+    Wall time, CPU time and counters of each stage of a build.
+    Rows are the rows inserted, updated or deleted per table by the statements run
+    on the traced connection, rows written by a trigger count for the table of the
+    statement that fired it. Files and YAML bytes parsed by worker processes are
+    counted by the stage that gets their results, CPU time only covers this process.
+    """
+
+    COUNTERS = ("files read", "yaml bytes", "statements")
+
+    def __init__(self):
+        self.stages = []
+        self._counters = {}
+        self._rows = {}
+        self._flush = None
+
+    def count(self, name, n=1):
+        self._counters[name] = self._counters.get(name, 0) + n
+
+    def trace(self, conn):
+        """
+        Count every SQL statement run on conn and the rows it writes: the change of
+        conn.total_changes up to the next statement goes to the table of the previous one.
+        """
+        last = [None, conn.total_changes]
+
+        def flush():
+            try:
+                total = conn.total_changes
+            except sqlite3.ProgrammingError:
+                # closed connection, its last statement was already flushed by the commit
+                return
+            if last[0] is not None and total != last[1]:
+                self._rows[last[0]] = self._rows.get(last[0], 0) + total - last[1]
+            last[1] = total
+
+        def traced(sql):
+            self.count("statements")
+            flush()
+            match = WRITTEN_TABLE.match(sql)
+            last[0] = match.group(1) if match else None
+
+        self._flush = flush
+        conn.set_trace_callback(traced)
+
+    @contextmanager
+    def stage(self, name):
+        self._flush_rows()
+        rows = dict(self._rows)
+        counters = dict(self._counters)
+        wall = time.perf_counter()
+        cpu = time.process_time()
+
+        try:
+            yield
+        finally:
+            stage = {
+                "stage": name,
+                "wall": time.perf_counter() - wall,
+                "cpu": time.process_time() - cpu,
+            }
+            self._flush_rows()
+            for counter in self.COUNTERS:
+                stage[counter] = self._counters.get(counter, 0) - counters.get(counter, 0)
+            stage["rows"] = {
+                table: count - rows.get(table, 0)
+                for table, count in self._rows.items()
+                if count != rows.get(table, 0)
+            }
+            self.stages.append(stage)
+
+    def _flush_rows(self):
+        if self._flush is not None:
+            self._flush()
+
+    def summary(self):
+        """
+        Lines of a table with one row per stage, then the rows written per table.
+        """
+        header = ("stage", "wall s", "cpu s", "files", "yaml MB", "statements", "rows")
+        lines = [
+            (
+                stage["stage"],
+                f"{stage['wall']:.2f}",
+                f"{stage['cpu']:.2f}",
+                str(stage["files read"]),
+                f"{stage['yaml bytes'] / 1e6:.1f}",
+                str(stage["statements"]),
+                str(sum(stage["rows"].values())),
+            )
+            for stage in self.stages
+        ]
+        lines.append((
+            "total",
+            f"{sum(s['wall'] for s in self.stages):.2f}",
+            f"{sum(s['cpu'] for s in self.stages):.2f}",
+            str(sum(s["files read"] for s in self.stages)),
+            f"{sum(s['yaml bytes'] for s in self.stages) / 1e6:.1f}",
+            str(sum(s["statements"] for s in self.stages)),
+            str(sum(sum(s["rows"].values()) for s in self.stages)),
+        ))
+
+        widths = [max(len(line[i]) for line in [header] + lines) for i in range(len(header))]
+        text = [
+            "  ".join(value.ljust(w) if i == 0 else value.rjust(w) for i, (value, w) in enumerate(zip(line, widths)))
+            for line in [header] + lines
+        ]
+
+        rows = {}
+        for stage in self.stages:
+            for table, count in stage["rows"].items():
+                rows[table] = rows.get(table, 0) + count
+        if rows:
+            width = max(len(table) for table in rows)
+            text.append("")
+            text.extend(f"{table.ljust(width)}  {count:>10}" for table, count in sorted(rows.items()))
+
+        return text
+
+    def write_json(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf-8") as f:
+            json.dump({"stages": self.stages}, f, indent=2)
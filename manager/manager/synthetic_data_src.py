@@ -0,0 +1,244 @@
+#!python3
+import argparse
+import random
+from pathlib import Path
+from manager import yaml_io
+
+# entities written at scale 1, close to the size of the real data-src
+BASE_COUNTS = {
+    "mcu": 100,
+    "ecu": 1000,
+    "engine": 4000,
+    "vehicle": 1500,
+}
+# manufacturers grow with the square root of the scale
+BASE_MANUFACTURERS = {
+    "mcu": 8,
+    "ecu": 20,
+    "engine": 40,
+}
+CODES_PER_ECU = 30
+VERSIONS_PER_VEHICLE = 2
+CONFIGS_PER_VERSION = 4
+# share of the definitions carrying conflicts, and of the codes with related codes or taxonomies
+CONFLICT_RATE = 0.1
+RELATED_RATE = 0.1
+TAXONOMY_RATE = 0.2
+
+EVIDENCE = [f"https://example.com/sources/list-{i}.pdf" for i in range(8)]
+FUELS = ["Petrol", "Diesel", "Hybrid", "Electric", "Petrol/Alcohol"]
+ECU_TYPES = ["ECM", "TCM", "BCM"]
+VEHICLE_TYPES = ["car", "truck", "motorcycle"]
+SYSTEMS = ["Powertrain", "Fuel and air metering", "Ignition", "Transmission"]
+SEVERITIES = ["low", "medium", "high"]
+
+def scaled(base, scale):
+    return max(1, round(base * scale))
+
+def _date(rng):
+    return f"2026-{rng.randint(1, 9):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00 CEST"
+
+def _evidence(rng, n=None):
+    return rng.sample(EVIDENCE, n or rng.randint(1, 3))
+
+def _conflicts(rng, field, values):
+    if CONFLICT_RATE <= rng.random():
+        return None
+    return {field: [{"value": value, "evidence": rng.choice(EVIDENCE)} for value in values]}
+
+def _definition(rng, data, conflicts=None):
+    data = {"created": _date(rng), **data, "evidence": _evidence(rng), "updated": _date(rng)}
+    if conflicts:
+        data["conflicts"] = conflicts
+    return data
+
+def _manufacturers(kind, scale):
+    count = max(1, round(BASE_MANUFACTURERS[kind] * scale ** 0.5))
+    return [f"{kind.upper()}_Maker_{i:03d}" for i in range(count)]
+
+def _codes(rng, n):
+    codes = set()
+    while len(codes) < n:
+        codes.add(f"{rng.choice('PBCU')}{rng.choice('13')}{rng.randrange(0x1000):03X}")
+    return sorted(codes)
+
+class SyntheticDataSrc():
+    """
+    Writes a synthetic data-src tree the converter accepts: MCUs, ECUs with DTC
+    files, engines and vehicles with versions and configs, all cross referenced,
+    with evidence and a share of conflicts. The same seed and scale always give
+    the same tree.
+    """
+
+    def __init__(self, root: Path, scale: float = 1, codes_per_ecu: int = CODES_PER_ECU, seed: int = 0):
+        self.root = Path(root)
+        self.scale = scale
+        self.codes_per_ecu = codes_per_ecu
+        self.rng = random.Random(seed)
+        self.counts = {}
+
+    def _write(self, relative_path, data):
+        yaml_io.write_yaml(self.root / relative_path, data)
+        self.counts["files"] = self.counts.get("files", 0) + 1
+
+    def _add(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def generate(self):
+        mcus = self._generate_mcus()
+        ecus = self._generate_ecus(mcus)
+        engines = self._generate_engines()
+        self._generate_vehicles(ecus, engines)
+        return self.counts
+
+    def _generate_mcus(self):
+        rng = self.rng
+        makers = _manufacturers("mcu", self.scale)
+        refs = []
+
+        for maker in makers:
+            self._write(f"mcu/{maker}/def.yml", {"manufacturer": maker})
+
+        for i in range(scaled(BASE_COUNTS["mcu"], self.scale)):
+            maker = makers[i % len(makers)]
+            model = f"MC{i:05d}"
+            self._write(f"mcu/{maker}/{model}/def.yml", _definition(rng, {"model": model}))
+            refs.append(f"{maker}/{model}")
+            self._add("mcu")
+
+        return refs
+
+    def _generate_ecus(self, mcus):
+        rng = self.rng
+        makers = _manufacturers("ecu", self.scale)
+        refs = []
+
+        for maker in makers:
+            self._write(f"ecu/{maker}/def.yml", {"manufacturer": maker})
+
+        for i in range(scaled(BASE_COUNTS["ecu"], self.scale)):
+            maker = makers[i % len(makers)]
+            model = f"ECU{i:06d}"
+            data = {"model": model, "type": rng.choice(ECU_TYPES), "mcu": rng.choice(mcus)}
+            conflicts = _conflicts(rng, "mcu", rng.sample(mcus, min(2, len(mcus))))
+            self._write(f"ecu/{maker}/{model}/def.yml", _definition(rng, data, conflicts))
+            refs.append(f"{maker}/{model}")
+            self._add("ecu")
+
+            codes = _codes(rng, self.codes_per_ecu)
+            for code in codes:
+                self._write(f"ecu/{maker}/{model}/codes/{code}.yml", self._dtc(code, codes))
+            self._add("dtc", len(codes))
+
+        return refs
+
+    def _dtc(self, code, codes):
+        rng = self.rng
+        taxonomy = TAXONOMY_RATE > rng.random()
+        return {
+            "code": code,
+            "system": rng.choice(SYSTEMS) if taxonomy else "",
+            "subsystem": "",
+            "category": "",
+            "definition": f"Synthetic fault {code} : signal out of range",
+            "description": "",
+            "severity": rng.choice(SEVERITIES) if taxonomy else "",
+            "mil": "",
+            "created": _date(rng),
+            "updated": _date(rng),
+            "related_code": rng.sample(codes, min(2, len(codes))) if RELATED_RATE > rng.random() else [],
+            "detection_condition": [],
+            "causes": [],
+            "repairs": [],
+            "evidence": _evidence(rng, 1),
+            "protocol": ["obd2"],
+            "standard": ["saej2012.2002"],
+        }
+
+    def _generate_engines(self):
+        rng = self.rng
+        self.vehicle_makers = _manufacturers("engine", self.scale)
+        refs = []
+
+        for maker in self.vehicle_makers:
+            self._write(f"engine/{maker}/def.yml", {"manufacturer": maker})
+
+        for i in range(scaled(BASE_COUNTS["engine"], self.scale)):
+            maker = self.vehicle_makers[i % len(self.vehicle_makers)]
+            code = f"E{i:06d} {rng.choice('ABCD')}"
+            directory = code.replace(" ", "_")
+            data = {"name": [code, f"{code} {rng.choice(FUELS)}"], "code": code, "fuel": rng.choice(FUELS)}
+            conflicts = _conflicts(rng, "fuel", rng.sample(FUELS, 1))
+            self._write(f"engine/{maker}/{directory}/def.yml", _definition(rng, data, conflicts))
+            refs.append(f"{maker}/{directory}")
+            self._add("engine")
+
+        return refs
+
+    def _generate_vehicles(self, ecus, engines):
+        rng = self.rng
+        makers = self.vehicle_makers
+
+        for maker in makers:
+            self._write(f"vehicle/{maker}/def.yml", {"manufacturer": maker})
+
+        for i in range(scaled(BASE_COUNTS["vehicle"], self.scale)):
+            maker = makers[i % len(makers)]
+            model = f"Model {i:06d}"
+            directory = f"vehicle/{maker}/{model.replace(' ', '_')}"
+            data = {"model": model, "type": rng.choice(VEHICLE_TYPES)}
+            self._write(f"{directory}/def.yml", _definition(rng, data))
+            self._add("vehicle")
+
+            for v in range(VERSIONS_PER_VEHICLE):
+                version = f"V{v + 1}"
+                engine = rng.choice(engines)
+                ecu = rng.choice(ecus)
+                data = {
+                    "version": version,
+                    "year": str(rng.randint(1995, 2025)),
+                    "config": [
+                        {f"config{c + 1}": self._config(engine, ecu, c)}
+                        for c in range(CONFIGS_PER_VERSION)
+                    ],
+                }
+                conflicts = _conflicts(rng, "year", [str(rng.randint(1995, 2025))])
+                file_name = f"{engine.rsplit('/', 1)[1]}_{ecu.rsplit('/', 1)[1]}.yml"
+                self._write(f"{directory}/versions/{version}/{file_name}", _definition(rng, data, conflicts))
+                self._add("version")
+                self._add("config", CONFIGS_PER_VERSION)
+
+    def _config(self, engine, ecu, index):
+        rng = self.rng
+        config = {
+            "engine": engine,
+            "power_kw": float(rng.randint(40, 300)),
+            "ecu": {"ECM": {"model": ecu}},
+        }
+        if index == 0:
+            config["ecu"]["ECM"]["protocol"] = {
+                "can11bits": {
+                    "request_can_id": f"0x{rng.randrange(0x700, 0x7FF):03X}",
+                    "response_can_id": f"0x{rng.randrange(0x700, 0x7FF):03X}",
+                }
+            }
+        return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic data-src tree")
+    parser.add_argument("dst", type=Path)
+    parser.add_argument("--scale", type=float, default=1, help="size relative to the real data-src (default: %(default)s)")
+    parser.add_argument("--codes-per-ecu", type=int, default=CODES_PER_ECU, help="DTC files per ECU (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.dst.exists() and any(args.dst.iterdir()):
+        parser.error(f"{args.dst} is not empty")
+
+    counts = SyntheticDataSrc(args.dst, args.scale, args.codes_per_ecu, args.seed).generate()
+    for name, count in counts.items():
+        print(f"{name}: {count}")
+
+if __name__ == "__main__":
+    main()
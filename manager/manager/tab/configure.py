@@ -5,6 +5,7 @@ from pathlib import Path
 import threading
 from tkinter import ttk
 from manager.converter_to_sqlite import ConverterToSqlite
+from manager.build_progress import describe
 from manager.vpic_sqlite_loader import VpicToSqliteLoader
 import os
 
@@ -49,6 +50,13 @@ class ConfigureTab(Tab):
         self._sqlite_check_exists()
         self._sqlite_update_status_label()
 
+        self.incremental_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            self.left_pane,
+            text="only reload changed files",
+            variable=self.incremental_var
+        ).pack(anchor="w", padx=10)
+
         write_to_sqlite_button = tk.Button(self.left_pane, text="Write to sqlite", command=self.on_write_sqlite)
         write_to_sqlite_button.pack(anchor="w", pady=5, padx=10)
 
@@ -96,14 +104,15 @@ class ConfigureTab(Tab):
         conv = ConverterToSqlite(
             plain_text_db=Path(self.plain_path_var.get()),
             sqlite_db=Path(self.sqlite_path_var.get()),
-            logger=self
+            logger=self,
+            incremental=self.incremental_var.get(),
+            atomic=True
         )
 
-        def progress_hook(current, total):
-            self.heavy_op_set_steps(total)
-            self.heavy_op_step()
+        def info_hook(info):
+            self.heavy_op_info(describe(info))
 
-        if conv.to_sqlite(progress_callback=progress_hook):
+        if conv.to_sqlite(progress_callback=self.heavy_op_progress, info_callback=info_hook):
             self.progress_label.config(text="Success", fg="green")
         else:
             self.progress_label.config(text="Export failed", fg="red")
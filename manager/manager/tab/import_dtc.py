@@ -6,7 +6,6 @@ from tkinter import messagebox
 from pathlib import Path
 from datetime import datetime
 from zoneinfo import ZoneInfo
-import yaml
 
 def current_timestamp():
     return datetime.now(
@@ -179,14 +178,7 @@ class ImportCodesTab(ImportTab):
 
         obj["updated"] = current_timestamp()
 
-        with open(conflict["filename"], "w", encoding="utf-8") as fp:
-            yaml.safe_dump(
-                obj,
-                fp,
-                allow_unicode=True,
-                sort_keys=False,
-                default_flow_style=False
-            )
+        self.get_yaml_cache().write(conflict["filename"], obj)
 
         self.log(f"[OK] {conflict['code']}: evidence added after manual confirmation.")
 
@@ -296,6 +288,8 @@ class ImportCodesTab(ImportTab):
         self.log(f"Warnings: {warnings}")
         self.log(f"Errors  : {errors}")
 
+        self.close_yaml_cache()
+
     def yaml_object(self, code, definition):
 
         now = current_timestamp()
@@ -338,8 +332,7 @@ class ImportCodesTab(ImportTab):
 
         if filename.exists():
 
-            with open(filename, "r", encoding="utf-8") as fp:
-                obj = yaml.safe_load(fp)
+            obj = self.get_yaml_cache().read(filename)
 
             existing_definition = (
                 str(obj.get("definition", ""))
@@ -387,27 +380,13 @@ class ImportCodesTab(ImportTab):
                     )
 
             obj["updated"] = current_timestamp()
-            with open(filename, "w", encoding="utf-8") as fp:
-                yaml.safe_dump(
-                    obj,
-                    fp,
-                    allow_unicode=True,
-                    sort_keys=False,
-                    default_flow_style=False
-                )
+            self.get_yaml_cache().write(filename, obj)
 
             return True
 
         obj = self.yaml_object(code, definition)
 
-        with open(filename, "w", encoding="utf-8") as fp:
-            yaml.safe_dump(
-                obj,
-                fp,
-                allow_unicode=True,
-                sort_keys=False,
-                default_flow_style=False
-            )
+        self.get_yaml_cache().write(filename, obj)
 
         self.log(f"[OK] Created {filename.name}")
 
@@ -3,12 +3,28 @@ from tkinter import ttk
 from manager.tk.Tab import Tab
 from pathlib import Path
 import threading
+import os
+from manager.yaml_cache import YamlCache
 
 class ImportTab(Tab):
 
     def __init__(self, parent, plain_path_var):
         super().__init__(parent)
         self.plain_path_var = plain_path_var
+        self._yaml_cache = None
 
     def get_data_src(self) -> Path:
-        return Path(self.plain_path_var.get())
\ No newline at end of file
+        return Path(self.plain_path_var.get())
+
+    def get_yaml_cache(self) -> YamlCache:
+        """
+        Parsed YAML files of the current data-src, kept in memory until the end of
+        the import run so files edited between two runs are read again.
+        """
+        data_src = self.get_data_src()
+        if self._yaml_cache is None or self._yaml_cache.root != Path(os.path.abspath(data_src)):
+            self._yaml_cache = YamlCache(root=data_src)
+        return self._yaml_cache
+
+    def close_yaml_cache(self):
+        self._yaml_cache = None
@@ -8,7 +8,6 @@ from zoneinfo import ZoneInfo
 import csv
 import re
 import io
-import yaml
 import unicodedata
 
 def slug(text: str) -> str:
@@ -379,26 +378,14 @@ Car,Abarth,500,2008-2018,312,1400 Fire TJET 695 Biposto,312.A9.000,Petrol,190,13
         if not path.exists():
             return {}
 
-        with path.open("r", encoding="utf-8") as f:
-            data = yaml.safe_load(f)
-
-        return data or {}
+        return self.get_yaml_cache().read(path)
 
 
     def write_yaml(self, path, data):
         """
         Write a YAML file, creating parent directories if needed.
         """
-        path = Path(path)
-        path.parent.mkdir(parents=True, exist_ok=True)
-        with path.open("w", encoding="utf-8") as f:
-            yaml.safe_dump(
-                data,
-                f,
-                allow_unicode=True,
-                sort_keys=False,
-                default_flow_style=False,
-            )
+        self.get_yaml_cache().write(path, data)
 
     def insert_or_conflict(self, yaml_path, data, field, value):
         changed = False
@@ -1004,6 +991,8 @@ Car,Abarth,500,2008-2018,312,1400 Fire TJET 695 Biposto,312.A9.000,Petrol,190,13
             )
             self.heavy_op_step()
 
+        self.close_yaml_cache()
+
     def on_import(self):
         self.clear_log()
 
@@ -2,7 +2,30 @@ import manager.tk.tk as tk
 from manager.tk.Tab import Tab
 from tkinter import messagebox
 from pathlib import Path
+import re
 import sqlite3
+from manager.converter_to_sqlite import DTC_FLAT_SELECT
+
+TEXT_RESULTS_LIMIT = 200
+TEXT_COLUMNS = ("definition", "description", "causes", "repairs")
+
+def text_filter(words, prefix, joiner):
+    """
+    Where clause matching :word0, :word1 ... in the texts of a DTC, joined with
+    joiner, prefix being the alias of its table.
+    """
+    texts = " || ' ' || ".join(f"coalesce({prefix}{column}, '')" for column in TEXT_COLUMNS)
+    return "(" + joiner.join(f"{texts} like :word{i}" for i in range(words)) + ")"
+
+def joined_dtcs(dtc_filter):
+    """
+    Rows shaped like ad_dtc_flat joined from the normalized tables, for databases
+    built without it. dtc_filter is a where clause on ad_dtc as d.
+    """
+    return DTC_FLAT_SELECT.format(
+        links=f"where l.dtc_id in (select d.id from ad_dtc d where {dtc_filter})",
+        dtcs=f"where {dtc_filter}",
+    )
 
 
 class QueryTab(Tab):
@@ -10,6 +33,8 @@ class QueryTab(Tab):
         super().__init__(parent)
         self.sqlite_path_var = sqlite_path_var
         self.rows = []
+        self._tables_of = None
+        self._tables = set()
 
         filter_frame = tk.LabelFrame(self.left_pane, text="Filter Options")
         filter_frame.pack(fill="x", padx=5, pady=5)
@@ -18,25 +43,27 @@ class QueryTab(Tab):
         self.manufacturer_var = tk.StringVar()
         self.manufacturer_entry = tk.Entry(filter_frame, textvariable=self.manufacturer_var)
         self.manufacturer_entry.grid(row=0, column=1, sticky="we", padx=2, pady=2)
-        self.manufacturer_entry.bind("<Return>", lambda e: self.query_dtc())
+        self.manufacturer_entry.bind("<Return>", lambda e: self.search())
 
         tk.Label(filter_frame, text="ECU:").grid(row=1, column=0, sticky="e", padx=2, pady=2)
         self.ecu_var = tk.StringVar()
         self.ecu_entry = tk.Entry(filter_frame, textvariable=self.ecu_var)
         self.ecu_entry.grid(row=1, column=1, sticky="we", padx=2, pady=2)
-        self.ecu_entry.bind("<Return>", lambda e: self.query_dtc())
+        self.ecu_entry.bind("<Return>", lambda e: self.search())
 
         filter_frame.columnconfigure(1, weight=1)
 
         query_frame = tk.Frame(self.left_pane)
         query_frame.pack(fill="x", padx=5, pady=5)
 
-        tk.Label(query_frame, text="Enter DTC code:").pack(side="left")
+        self.search_mode_var = tk.StringVar(value="code")
+        tk.Radiobutton(query_frame, text="DTC code", variable=self.search_mode_var, value="code").pack(side="left")
+        tk.Radiobutton(query_frame, text="Text", variable=self.search_mode_var, value="text").pack(side="left")
         self.dtc_code_var = tk.StringVar()
-        self.dtc_code_entry = tk.Entry(query_frame, textvariable=self.dtc_code_var, width=15)
-        self.dtc_code_entry.pack(side="left", padx=5)
-        tk.Button(query_frame, text="Search", command=self.query_dtc).pack(side="left")
-        self.dtc_code_entry.bind("<Return>", lambda e: self.query_dtc())
+        self.dtc_code_entry = tk.Entry(query_frame, textvariable=self.dtc_code_var, width=30)
+        self.dtc_code_entry.pack(side="left", fill="x", expand=True, padx=5)
+        tk.Button(query_frame, text="Search", command=self.search).pack(side="left")
+        self.dtc_code_entry.bind("<Return>", lambda e: self.search())
 
         self.explanation_label = tk.Label(
             self.left_pane,
@@ -126,94 +153,130 @@ class QueryTab(Tab):
         if not selection:
             return
 
-        dtc_id = self.rows[selection[0]]["dtc_id"]
+        self._display_dtc(self.rows[selection[0]])
 
-        sqlite_file = Path(self.sqlite_path_var.get())
-        conn = sqlite3.connect(sqlite_file)
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-
-        cur.execute("""
-            select
-                d.code,
-                d.definition,
-                d.description,
-                d.detection_condition,
-                d.causes,
-                d.repairs,
-                d.mil,
-
-                e.model as ecu_model,
-                e.type as ecu_type,
-
-                m.name as manufacturer,
-
-                group_concat(distinct s.name) as standards,
-                group_concat(distinct p.name) as protocols,
-                group_concat(distinct sys.name) as systems,
-                group_concat(distinct sub.name) as subsystems,
-                group_concat(distinct cat.name) as categories,
-                group_concat(distinct sev.name) as severities,
-                group_concat(distinct rd.code) as related_codes,
-                group_concat(ev.text, char(10)) as evidence
-
-            from ad_dtc d
-
-            left join ad_ecu e
-                on e.id=d.ecu_id
-
-            left join ad_manufacturer m
-                on m.id=e.manufacturer_id
-
-            left join ad_dtc_standard_link sl
-                on sl.dtc_id=d.id
-            left join ad_dtc_standard s
-                on s.id=sl.standard_id
-
-            left join ad_dtc_protocol_link pl
-                on pl.dtc_id=d.id
-            left join ad_diag_protocol p
-                on p.id=pl.protocol_id
-
-            left join ad_dtc_system_link syl
-                on syl.dtc_id=d.id
-            left join ad_dtc_system sys
-                on sys.id=syl.system_id
-
-            left join ad_dtc_subsystem_link ssl
-                on ssl.dtc_id=d.id
-            left join ad_dtc_subsystem sub
-                on sub.id=ssl.subsystem_id
+    def _read_tables(self, sqlite_file):
+        """
+        Which of ad_dtc_flat and ad_dtc_fts the database has, read from sqlite_master
+        once per database file and build.
+        """
+        key = (sqlite_file.resolve(), sqlite_file.stat().st_mtime_ns)
+        if self._tables_of != key:
+            conn = sqlite3.connect(sqlite_file)
+            try:
+                self._tables = {
+                    row[0] for row in
+                    conn.execute("select name from sqlite_master where name in ('ad_dtc_flat', 'ad_dtc_fts')")
+                }
+            finally:
+                conn.close()
+            self._tables_of = key
+        return self._tables
+
+    def search(self):
+        if self.search_mode_var.get() == "text":
+            self.query_text()
+        else:
+            self.query_dtc()
+
+    def _show_rows(self, rows):
+        self.rows = rows
+        self.results_listbox.delete(0, tk.END)
 
-            left join ad_dtc_category_link cl
-                on cl.dtc_id=d.id
-            left join ad_dtc_category cat
-                on cat.id=cl.category_id
+        for r in rows:
+            manufacturer = r["manufacturer"] or "Unknown"
+            ecu_model = r["ecu_model"] or "Unknown ECU"
+            definition = r["definition"] if r["definition"] else "(No description)"
+            self.results_listbox.insert(
+                tk.END,
+                f"{manufacturer} / {ecu_model}: {r['code']} - {definition}"
+            )
 
-            left join ad_dtc_severity_link sel
-                on sel.dtc_id=d.id
-            left join ad_dtc_severity sev
-                on sev.id=sel.severity_id
+    def query_text(self):
+        words = re.findall(r"\w+", self.dtc_code_var.get())
+        if not words:
+            messagebox.showwarning("Input Needed", "Please enter words to search for.")
+            return
 
-            left join ad_dtc_related rl
-                on rl.dtc_id=d.id
-            left join ad_dtc rd
-                on rd.id=rl.related_dtc_id
+        manufacturer_filter = self.manufacturer_var.get().strip().lower()
+        ecu_filter = self.ecu_var.get().strip().lower()
 
-            left join ad_dtc_evidence de
-                on de.dtc_id=d.id
-            left join ad_evidence ev
-                on ev.id=de.evidence_id
+        sqlite_file = Path(self.sqlite_path_var.get())
+        if not sqlite_file.exists():
+            messagebox.showerror("Database Error", "SQLite database not found.")
+            return
 
-            where d.id=?
+        tables = self._read_tables(sqlite_file)
+        conn = sqlite3.connect(sqlite_file)
+        conn.row_factory = sqlite3.Row
 
-            group by d.id
-        """, (dtc_id,))
+        params = {
+            "manufacturer": f"%{manufacturer_filter}%" if manufacturer_filter else "%",
+            "ecu": f"%{ecu_filter}%" if ecu_filter else "%",
+            "limit": TEXT_RESULTS_LIMIT,
+        }
+        filters = """
+            lower(coalesce(manufacturer, '')) like :manufacturer
+            and lower(coalesce(ecu_model, '')) like :ecu
+        """
+        # all words first, then any
+        queries = []
+
+        ranked = "ad_dtc_fts" in tables
+        if ranked:
+            # ad_dtc_fts indexes the texts of ad_dtc_flat, see ConverterToSqlite._build_dtc_fts
+            query = """
+                select f.*
+                from ad_dtc_fts
+                join ad_dtc_flat f on f.dtc_id = ad_dtc_fts.rowid
+                where ad_dtc_fts match :match
+                  and lower(coalesce(f.manufacturer, '')) like :manufacturer
+                  and lower(coalesce(f.ecu_model, '')) like :ecu
+                order by ad_dtc_fts.rank
+                limit :limit
+            """
+            # every word quoted so punctuation is not read as FTS5 syntax
+            terms = [f'"{word}"' for word in words]
+            for match in (" ".join(terms), " OR ".join(terms)):
+                queries.append((query, {**params, "match": match}))
+        else:
+            # no full text index, the texts are scanned
+            params.update((f"word{i}", f"%{word}%") for i, word in enumerate(words))
+            for joiner in (" and ", " or "):
+                if "ad_dtc_flat" in tables:
+                    source = f"select * from ad_dtc_flat where {text_filter(len(words), '', joiner)}"
+                else:
+                    source = joined_dtcs(text_filter(len(words), "d.", joiner))
+                query = f"""
+                    select *
+                    from ({source})
+                    where {filters}
+                    order by manufacturer, ecu_model, code
+                    limit :limit
+                """
+                queries.append((query, params))
+
+        try:
+            rows = []
+            for tried, (query, query_params) in enumerate(queries):
+                rows = conn.execute(query, query_params).fetchall()
+                if rows or len(words) == 1:
+                    break
+        except sqlite3.OperationalError as e:
+            messagebox.showerror("Database Error", f"{e}, convert the plain text database again.")
+            return
+        finally:
+            conn.close()
 
-        row = cur.fetchone()
-        conn.close()
+        self._show_rows(rows)
 
-        self._display_dtc(row)
+        order = "best matches first" if ranked else "convert the plain text database again to rank them"
+        if not rows:
+            self.explanation_label.config(text="No DTC text matches these words for the selected filters.")
+        elif tried == 0:
+            self.explanation_label.config(text=f"{len(rows)} DTCs matching all the words, {order}.")
+        else:
+            self.explanation_label.config(text=f"No DTC matches all the words, {len(rows)} DTCs matching some of them, {order}.")
 
     def query_dtc(self):
         code_query = self.dtc_code_var.get().strip().upper()
@@ -229,77 +292,41 @@ class QueryTab(Tab):
             messagebox.showerror("Database Error", "SQLite database not found.")
             return
 
+        tables = self._read_tables(sqlite_file)
         conn = sqlite3.connect(sqlite_file)
         conn.row_factory = sqlite3.Row
         cur = conn.cursor()
 
-        query = """
-            select
-                d.id as dtc_id,
-                d.code,
-                d.definition,
-                d.description,
-                m.name as manufacturer,
-                e.model as ecu_model,
-                e.type as ecu_type,
-                group_concat(distinct s.name) as standards,
-                group_concat(distinct p.name) as protocols,
-                group_concat(distinct sys.name) as systems,
-                group_concat(distinct sub.name) as subsystems,
-                group_concat(distinct cat.name) as categories,
-                group_concat(distinct sev.name) as severities,
-                group_concat(distinct rd.code) as related_codes
-            from ad_dtc d
-            left join ad_ecu e on e.id = d.ecu_id
-            left join ad_manufacturer m on m.id = e.manufacturer_id
-
-            left join ad_dtc_standard_link s_link on s_link.dtc_id = d.id
-            left join ad_dtc_standard s on s.id = s_link.standard_id
-
-            left join ad_dtc_protocol_link p_link on p_link.dtc_id = d.id
-            left join ad_diag_protocol p on p.id = p_link.protocol_id
-
-            left join ad_dtc_system_link sys_link on sys_link.dtc_id = d.id
-            left join ad_dtc_system sys on sys.id = sys_link.system_id
-
-            left join ad_dtc_subsystem_link sub_link on sub_link.dtc_id = d.id
-            left join ad_dtc_subsystem sub on sub.id = sub_link.subsystem_id
-
-            left join ad_dtc_category_link cat_link on cat_link.dtc_id = d.id
-            left join ad_dtc_category cat on cat.id = cat_link.category_id
-
-            left join ad_dtc_severity_link sev_link on sev_link.dtc_id = d.id
-            left join ad_dtc_severity sev on sev.id = sev_link.severity_id
-
-            left join ad_dtc_related rd_link on rd_link.dtc_id = d.id
-            left join ad_dtc rd on rd.id = rd_link.related_dtc_id
-
-            where upper(d.code) = ?
-              and lower(coalesce(m.name, '')) like ?
-              and lower(coalesce(e.model, '')) like ?
-            group by
-                d.id,
-                d.code,
-                d.definition,
-                d.description,
-                m.name,
-                e.model,
-                e.type
+        # ad_dtc_flat holds one row per DTC with everything shown, see ConverterToSqlite._build_dtc_flat
+        source = "ad_dtc_flat" if "ad_dtc_flat" in tables else f"({joined_dtcs('upper(d.code) = :code')})"
+        query = f"""
+            select *
+            from {source}
+            where code_key = :code
+              and lower(coalesce(manufacturer, '')) like :manufacturer
+              and lower(coalesce(ecu_model, '')) like :ecu
             order by
-                m.name,
-                e.model,
-                d.code
+                manufacturer,
+                ecu_model,
+                code
         """
 
-        manufacturer_param = f"%{manufacturer_filter}%" if manufacturer_filter else "%"
-        ecu_param = f"%{ecu_filter}%" if ecu_filter else "%"
-
-        cur.execute(query, (code_query, manufacturer_param, ecu_param))
-        rows = cur.fetchall()
-        conn.close()
+        params = {
+            "code": code_query,
+            "manufacturer": f"%{manufacturer_filter}%" if manufacturer_filter else "%",
+            "ecu": f"%{ecu_filter}%" if ecu_filter else "%",
+        }
+
+        try:
+            cur.execute(query, params)
+            rows = cur.fetchall()
+        except sqlite3.OperationalError as e:
+            messagebox.showerror("Database Error", f"{e}, convert the plain text database again.")
+            return
+        finally:
+            conn.close()
 
-        self.rows = rows
-        self.results_listbox.delete(0, tk.END)
+        self._show_rows(rows)
 
         if not rows:
             self.explanation_label.config(
@@ -307,15 +334,6 @@ class QueryTab(Tab):
             )
             return
 
-        for r in rows:
-            manufacturer = r["manufacturer"] or "Unknown"
-            ecu_model = r["ecu_model"] or "Unknown ECU"
-            definition = r["definition"] if r["definition"] else "(No description)"
-            self.results_listbox.insert(
-                tk.END,
-                f"{manufacturer} / {ecu_model}: {r['code']} - {definition}"
-            )
-
         self.explanation_label.config(text=self._explain_code(code_query))
 
     def _explain_code(self, code: str) -> str:
@@ -261,6 +261,7 @@ class Tab(tk.Frame):
 
     def heavy_op_init(self, steps=1):
         self._progress_current = 0
+        self._progress_text = ""
         self.heavy_op_set_steps(steps)
 
         self.progress["value"] = 0
@@ -298,6 +299,34 @@ class Tab(tk.Frame):
             )
 
         self.root.after(0, update)
+
+    def heavy_op_progress(self, current, total):
+        """
+        Move the progress bar to current out of total, safe to call from the worker thread.
+        """
+
+        def update():
+            self._progress_steps = max(total, 1)
+            self._progress_current = min(current, self._progress_steps)
+            label = f"{self._progress_current} / {self._progress_steps}"
+            if self._progress_text:
+                label = f"{label}  {self._progress_text}"
+
+            self.progress.configure(maximum=self._progress_steps)
+            self.progress["value"] = self._progress_current
+            self.progress_label.config(text=label, width=max(16, len(label)))
+
+        self.root.after(0, update)
+
+    def heavy_op_info(self, text):
+        """
+        Text shown after the count by the next heavy_op_progress, safe to call from the worker thread.
+        """
+
+        def update():
+            self._progress_text = text
+
+        self.root.after(0, update)
         
     def update_search_status(self):
         if not self.search_matches:
@@ -1,5 +1,6 @@
 from pathlib import Path
 import sqlite3
+from manager import sqlite_profile
 
 try:
     import psycopg
@@ -24,6 +25,7 @@ class VpicToSqliteLoader:
         pg_password="",
         pg_dbname="vpic_lite",
         pg_schema="vpic",
+        profile="bulk",
     ):
         self.sqlite_path = Path(sqlite_path)
         self.pg_host = str(pg_host).strip()
@@ -32,6 +34,7 @@ class VpicToSqliteLoader:
         self.pg_password = pg_password
         self.pg_dbname = str(pg_dbname).strip()
         self.pg_schema = str(pg_schema).strip() or "vpic"
+        self.profile = profile
 
     def _pg_connect(self):
         if _PG_DRIVER is None:
@@ -52,6 +55,7 @@ class VpicToSqliteLoader:
     def _connect_sqlite(self):
         conn = sqlite3.connect(self.sqlite_path)
         conn.execute("pragma foreign_keys = on")
+        sqlite_profile.apply(conn, self.profile)
         return conn
 
     def _ensure_vpic_sqlite_schema(self, conn):
@@ -192,6 +196,7 @@ class VpicToSqliteLoader:
                 if progress_callback is not None:
                     progress_callback(done, total)
 
+            sqlite_profile.make_durable(sqlite_conn)
             sqlite_conn.commit()
 
             if progress_callback is not None and done < total:
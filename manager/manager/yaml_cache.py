@@ -0,0 +1,180 @@
+from pathlib import Path
+import hashlib
+import os
+import pickle
+
+from manager import yaml_io
+
+CACHE_DIR = Path("output") / "cache"
+
+def parse_entry(path):
+    """
+    Read and parse one file, returning its cache entry (size, mtime_ns, sha256, pickled data).
+    Module level so worker processes can run it.
+    """
+    st = os.stat(path)
+    with open(path, "rb") as f:
+        raw = f.read()
+
+    data = yaml_io.load(raw.decode("utf-8")) or {}
+    return (st.st_size, st.st_mtime_ns, hashlib.sha256(raw).hexdigest(), pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+
+def parse_entries(paths):
+    return [parse_entry(path) for path in paths]
+
+class YamlCache():
+    """
+    Parsed YAML files keyed by path, reused while their size and mtime, or failing
+    that their sha256, are unchanged. Each read unpickles a fresh copy, so callers
+    may modify what they get.
+    Without a cache file the entries only live as long as the object.
+    """
+
+    VERSION = 1
+
+    def __init__(self, cache_file=None, root=None):
+        self.cache_file = Path(cache_file) if cache_file else None
+        self.root = Path(os.path.abspath(root)) if root else None
+        self._prefix = os.path.join(self.root, "") if root else None
+        self._entries = None
+        self._valid = set()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def for_tree(cls, cache_dir, root):
+        """
+        One cache file per source tree inside cache_dir.
+        """
+        root = Path(root).resolve()
+        name = hashlib.sha1(str(root).encode("utf-8")).hexdigest()[:16]
+        return cls(Path(cache_dir) / f"yaml-{name}.pickle", root)
+
+    def _key(self, path):
+        path = os.path.abspath(path)
+        if self._prefix is not None and path.startswith(self._prefix):
+            path = path[len(self._prefix):]
+        return path.replace(os.sep, "/")
+
+    def _load(self):
+        if self._entries is not None:
+            return
+
+        self._entries = {}
+        if self.cache_file is None or not self.cache_file.exists():
+            return
+
+        try:
+            with self.cache_file.open("rb") as f:
+                version, entries = pickle.load(f)
+        except Exception:
+            return
+
+        if version == self.VERSION and isinstance(entries, dict):
+            self._entries = entries
+
+    def sync(self, files):
+        """
+        Check every entry at once against a scan of the root ({relative path: (size, mtime_ns)},
+        as returned by manifest.scan) and evict the files that are gone.
+        Entries whose stat moved are kept, read() compares their hash.
+        """
+        self._load()
+
+        for key in [k for k in self._entries if k not in files]:
+            del self._entries[key]
+            self._dirty = True
+
+        self._valid = {
+            key for key, (size, mtime_ns) in files.items()
+            if key in self._entries and self._entries[key][:2] == (size, mtime_ns)
+        }
+
+    def contains(self, path):
+        """
+        True when path was found unchanged by sync().
+        """
+        return self._key(path) in self._valid
+
+    def peek(self, path):
+        """
+        Data of a file found unchanged by sync(), None for the others. Not counted as a hit.
+        """
+        key = self._key(path)
+        if key not in self._valid:
+            return None
+        return pickle.loads(self._entries[key][3])
+
+    def read(self, path):
+        self._load()
+        key = self._key(path)
+        entry = self._entries.get(key)
+
+        if entry is not None and key in self._valid:
+            self.hits += 1
+            return pickle.loads(entry[3])
+
+        st = os.stat(path)
+        if entry is not None and entry[:2] == (st.st_size, st.st_mtime_ns):
+            self.hits += 1
+            self._valid.add(key)
+            return pickle.loads(entry[3])
+
+        with open(path, "rb") as f:
+            raw = f.read()
+        digest = hashlib.sha256(raw).hexdigest()
+
+        if entry is not None and entry[2] == digest:
+            self.hits += 1
+            self._entries[key] = (st.st_size, st.st_mtime_ns) + entry[2:]
+            self._valid.add(key)
+            self._dirty = True
+            return pickle.loads(entry[3])
+
+        self.misses += 1
+        data = yaml_io.load(raw.decode("utf-8")) or {}
+        self._entries[key] = (st.st_size, st.st_mtime_ns, digest, pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+        self._valid.add(key)
+        self._dirty = True
+        return data
+
+    def store(self, path, entry):
+        """
+        Keep an entry produced by parse_entry() and return its data.
+        """
+        self._load()
+        self.misses += 1
+        key = self._key(path)
+        self._entries[key] = entry
+        self._valid.add(key)
+        self._dirty = True
+        return pickle.loads(entry[3])
+
+    def forget(self, path):
+        """
+        Drop the entry of path, whose file was changed without going through read().
+        """
+        self._load()
+        key = self._key(path)
+        self._valid.discard(key)
+        if self._entries.pop(key, None) is not None:
+            self._dirty = True
+
+    def write(self, path, data):
+        """
+        Write data to path as YAML, the next read() parses the new file.
+        """
+        yaml_io.write_yaml(path, data)
+        self.forget(path)
+
+    def save(self):
+        if self.cache_file is None or not self._dirty:
+            return
+
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.cache_file.with_name(self.cache_file.name + ".tmp")
+        with tmp.open("wb") as f:
+            pickle.dump((self.VERSION, self._entries), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.cache_file)
+        self._dirty = False
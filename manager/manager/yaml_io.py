@@ -0,0 +1,36 @@
+from pathlib import Path
+import yaml
+
+# libyaml bindings are an optional part of PyYAML, fall back to the pure python implementation
+try:
+    from yaml import CSafeLoader as SafeLoader
+    from yaml import CSafeDumper as SafeDumper
+    WITH_LIBYAML = True
+except ImportError:
+    from yaml import SafeLoader
+    from yaml import SafeDumper
+    WITH_LIBYAML = False
+
+YAMLError = yaml.YAMLError
+
+DUMP_OPTIONS = {
+    "allow_unicode": True,
+    "sort_keys": False,
+    "default_flow_style": False,
+}
+
+def load(stream):
+    return yaml.load(stream, Loader=SafeLoader)
+
+def dump(data, stream=None):
+    return yaml.dump(data, stream, Dumper=SafeDumper, **DUMP_OPTIONS)
+
+def read_yaml(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return load(f) or {}
+
+def write_yaml(path, data):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as f:
+        dump(data, f)
@@ -0,0 +1,22 @@
+from manager.build_progress import BuildProgress
+
+
+def test_two_argument_callback():
+    calls = []
+    progress = BuildProgress(lambda current, total: calls.append((current, total)), 10, interval=0)
+    progress.stage("ECUs")
+    progress.advance(3)
+    progress.finish()
+
+    assert calls == [(0, 10), (3, 10), (10, 10)]
+
+
+def test_info_callback():
+    infos = []
+    progress = BuildProgress(lambda current, total: None, 4, infos.append, interval=0)
+    progress.stage("Vehicles")
+    progress.advance(2)
+
+    assert [info["stage"] for info in infos] == ["Vehicles", "Vehicles"]
+    assert 0 < infos[-1]["files_per_s"]
+    assert infos[-1]["eta"] is not None
@@ -0,0 +1,124 @@
+import shutil
+import sqlite3
+
+import pytest
+
+from manager import changeset, yaml_io
+from manager.changeset import ChangesetError
+from manager.converter_to_sqlite import ConverterToSqlite
+from manager.synthetic_data_src import SyntheticDataSrc
+
+
+class Logger():
+    def log(self, text):
+        pass
+
+
+def build(data_src, db):
+    converter = ConverterToSqlite(data_src, db, logger=Logger(), jobs=1, cache_dir=None)
+    assert converter.to_sqlite(lambda current, total: None)
+
+
+def dtcs(db):
+    conn = sqlite3.connect(db)
+    try:
+        return sorted(conn.execute("""
+            select manufacturer, ecu_model, code, definition, related_codes, standards, evidence
+            from ad_dtc_flat
+        """))
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def data_src(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data_src = tmp_path / "data-src"
+    SyntheticDataSrc(data_src, scale=0.005, codes_per_ecu=4).generate()
+    return data_src
+
+
+@pytest.fixture
+def old_db(tmp_path, data_src):
+    db = tmp_path / "old.sqlite"
+    build(data_src, db)
+    return db
+
+
+def test_round_trip(tmp_path, data_src, old_db):
+    codes = sorted(data_src.glob("ecu/*/*/codes/*.yml"))[:3]
+    assert codes[0].parent == codes[2].parent
+    updated, related, deleted = codes
+
+    data = yaml_io.read_yaml(updated)
+    data["definition"] = "Changed definition"
+    yaml_io.write_yaml(updated, data)
+    data["code"] = "P0AAA"
+    data["related_code"] = [yaml_io.read_yaml(related)["code"]]
+    yaml_io.write_yaml(updated.parent / "P0AAA.yml", data)
+
+    data = yaml_io.read_yaml(related)
+    data["related_code"] = ["P0AAA"]
+    yaml_io.write_yaml(related, data)
+    deleted.unlink()
+
+    new_db = tmp_path / "new.sqlite"
+    build(data_src, new_db)
+
+    path = tmp_path / "changes.json.gz"
+    changeset.write(changeset.diff(old_db, new_db), path)
+    changes = changeset.read(path)
+    ops = {(op, table) for op, table, *_ in changes["ops"]}
+    assert {("insert", "ad_dtc"), ("update", "ad_dtc"), ("delete", "ad_dtc"), ("insert", "ad_dtc_related")} <= ops
+
+    patched = tmp_path / "patched.sqlite"
+    shutil.copy(old_db, patched)
+    assert changeset.apply(patched, changes) == len(changes["ops"])
+
+    assert changeset.diff(patched, new_db)["ops"] == []
+    assert dtcs(patched) == dtcs(new_db)
+    assert dtcs(patched) != dtcs(old_db)
+
+
+def test_from_checksum_mismatch(tmp_path, data_src, old_db):
+    updated = sorted(data_src.glob("ecu/*/*/codes/*.yml"))[0]
+    data = yaml_io.read_yaml(updated)
+    data["definition"] = "Changed definition"
+    yaml_io.write_yaml(updated, data)
+    new_db = tmp_path / "new.sqlite"
+    build(data_src, new_db)
+    changes = changeset.diff(old_db, new_db)
+
+    # the row was edited since the changeset was made, the patch is refused as a whole
+    patched = tmp_path / "patched.sqlite"
+    shutil.copy(old_db, patched)
+    conn = sqlite3.connect(patched)
+    conn.execute("update ad_dtc set definition = 'Local edit' where code = ?", (data["code"],))
+    conn.commit()
+    before = conn.execute("select * from ad_dtc order by id").fetchall()
+    conn.close()
+
+    with pytest.raises(ChangesetError, match="does not hold the content"):
+        changeset.apply(patched, changes)
+    conn = sqlite3.connect(patched)
+    assert conn.execute("select * from ad_dtc order by id").fetchall() == before
+    conn.close()
+
+    # a changeset is not applied twice
+    with pytest.raises(ChangesetError, match="does not hold the content"):
+        changeset.apply(new_db, changes)
+
+
+def test_duplicate_natural_key(tmp_path, data_src, old_db):
+    # two DTCs without a code in the same ECU have the same (ecu, code) key
+    first, second = sorted(data_src.glob("ecu/*/*/codes/*.yml"))[:2]
+    assert first.parent == second.parent
+    for path in (first, second):
+        data = yaml_io.read_yaml(path)
+        del data["code"]
+        yaml_io.write_yaml(path, data)
+    new_db = tmp_path / "new.sqlite"
+    build(data_src, new_db)
+
+    with pytest.raises(ChangesetError, match="ad_dtc has several rows with the key"):
+        changeset.diff(old_db, new_db)
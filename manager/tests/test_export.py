@@ -0,0 +1,74 @@
+import csv
+import gzip
+import json
+import sqlite3
+
+import pytest
+
+from manager.converter_to_sqlite import ConverterToSqlite
+from manager.export import export
+from manager.synthetic_data_src import SyntheticDataSrc
+
+
+class Logger():
+    def log(self, text):
+        pass
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data_src = tmp_path / "data-src"
+    SyntheticDataSrc(data_src, scale=0.005, codes_per_ecu=4).generate()
+    db = tmp_path / "db.sqlite"
+    converter = ConverterToSqlite(data_src, db, logger=Logger(), jobs=1, cache_dir=None)
+    assert converter.to_sqlite(lambda current, total: None)
+    return db
+
+
+def flat_dtcs(db):
+    conn = sqlite3.connect(db)
+    try:
+        return conn.execute("select dtc_id, code, manufacturer, causes from ad_dtc_flat order by dtc_id").fetchall()
+    finally:
+        conn.close()
+
+
+def test_jsonl_and_csv(tmp_path, db):
+    expected = flat_dtcs(db)
+    assert expected
+
+    written = dict(export(db, tmp_path / "jsonl"))
+    with (tmp_path / "jsonl" / "dtcs.jsonl").open(encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert written[tmp_path / "jsonl" / "dtcs.jsonl"] == len(expected)
+    # json columns are nested values, not json text
+    assert [(d["id"], d["code"], d["manufacturer"], d["causes"]) for d in lines] == [
+        (dtc_id, code, manufacturer, json.loads(causes)) for dtc_id, code, manufacturer, causes in expected
+    ]
+
+    export(db, tmp_path / "csv", fmt="csv", compress=True, datasets=["dtcs", "configs"])
+    assert sorted(path.name for path in (tmp_path / "csv").iterdir()) == ["configs.csv.gz", "dtcs.csv.gz"]
+    with gzip.open(tmp_path / "csv" / "dtcs.csv.gz", "rt", encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert "manufacturer_id" in rows[0]
+    assert [(int(r["id"]), r["code"], r["manufacturer"], r["causes"]) for r in rows] == expected
+
+
+def test_split_refuses_previous_export(tmp_path, db):
+    out_dir = tmp_path / "export"
+    written = export(db, out_dir, split=True)
+    files = {path for path, _ in written}
+    assert sum(rows for path, rows in written if path.parent.name == "dtcs") == len(flat_dtcs(db))
+
+    # a manufacturer exported before and gone since
+    stale = out_dir / "dtcs" / "Gone.jsonl"
+    stale.write_text("{}\n", encoding="utf-8")
+
+    with pytest.raises(ValueError, match="not empty"):
+        export(db, out_dir, split=True)
+    assert stale.exists()
+
+    written = export(db, out_dir, split=True, overwrite=True)
+    assert {path for path, _ in written} == files
+    assert set(out_dir.glob("*/*")) == files
@@ -0,0 +1,121 @@
+import shutil
+import sqlite3
+
+from manager import yaml_io
+from manager.converter_to_sqlite import ConverterToSqlite
+from manager.synthetic_data_src import SyntheticDataSrc
+
+
+class Logger():
+    def __init__(self):
+        self.lines = []
+
+    def log(self, text):
+        self.lines.append(text)
+
+
+def build(data_src, db, **kwargs):
+    logger = Logger()
+    converter = ConverterToSqlite(data_src, db, logger=logger, jobs=1, cache_dir=None, **kwargs)
+    assert converter.to_sqlite(lambda current, total: None)
+    return logger.lines
+
+
+def content(db):
+    """
+    Rows of db by name, the ids of an incremental build differ from a full one.
+    """
+    conn = sqlite3.connect(db)
+    queries = {
+        "dtcs": """
+            select code, code_key, manufacturer, ecu_model, ecu_type, definition, description, mil,
+            created, updated, detection_condition, causes, repairs, standards, protocols, systems,
+            subsystems, categories, severities, related_codes, evidence
+            from ad_dtc_flat
+        """,
+        "ecus": """
+            select m.name, e.model, e.type, mcu.model, e.created, e.updated
+            from ad_ecu e
+            join ad_manufacturer m on m.id = e.manufacturer_id
+            left join ad_mcu mcu on mcu.id = e.mcu_id
+        """,
+        "configs": """
+            select v.model, vv.version, vv.year, en.code, c.power_kw, e.model
+            from ad_vehicle_version_config c
+            join ad_vehicle_version vv on vv.id = c.vehicle_version_id
+            join ad_vehicle v on v.id = vv.vehicle_id
+            left join ad_engine en on en.id = c.engine_id
+            left join ad_vehicle_version_config_ecu ce on ce.config_id = c.id
+            left join ad_ecu e on e.id = ce.ecu_id
+        """,
+        "fts": "select ecu_model, definition from ad_dtc_fts where ad_dtc_fts match 'modified OR added'",
+    }
+    try:
+        return {name: sorted(map(repr, conn.execute(sql))) for name, sql in queries.items()}
+    finally:
+        conn.close()
+
+
+def test_incremental_matches_full_rebuild(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data_src = tmp_path / "data-src"
+    SyntheticDataSrc(data_src, scale=0.005, codes_per_ecu=4).generate()
+    db = tmp_path / "incremental.sqlite"
+    build(data_src, db, incremental=True)
+
+    codes = sorted(data_src.glob("ecu/*/*/codes/*.yml"))
+    # a code others relate to, their related_codes change with it
+    related = {code for path in codes for code in yaml_io.read_yaml(path).get("related_code") or []}
+    deleted = next(path for path in codes if path.stem in related)
+    modified, template = [path for path in codes if path != deleted][:2]
+
+    data = yaml_io.read_yaml(modified)
+    data["definition"] = "modified definition"
+    yaml_io.write_yaml(modified, data)
+
+    deleted.unlink()
+
+    data = yaml_io.read_yaml(template)
+    data["code"] = "P3FFF"
+    data["definition"] = "added definition"
+    yaml_io.write_yaml(template.with_name("P3FFF.yml"), data)
+
+    ecu_def = sorted(data_src.glob("ecu/*/*/def.yml"))[-1]
+    data = yaml_io.read_yaml(ecu_def)
+    data["type"] = "ABS"
+    yaml_io.write_yaml(ecu_def, data)
+
+    lines = build(data_src, db, incremental=True)
+    assert "1 added, 2 modified, 1 deleted files" in lines
+    assert "Running a full rebuild ..." not in lines
+
+    full = tmp_path / "full.sqlite"
+    build(data_src, full)
+
+    assert content(db) == content(full)
+    assert len(content(full)["fts"]) == 2
+    assert db.with_name(db.name + ".manifest").exists()
+    assert full.with_name(full.name + ".manifest").exists()
+
+
+def test_manifest_not_in_database(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data_src = tmp_path / "data-src"
+    SyntheticDataSrc(data_src, scale=0.005, codes_per_ecu=2).generate()
+    db = tmp_path / "db.sqlite"
+    build(data_src, db)
+
+    conn = sqlite3.connect(db)
+    tables = {row[0] for row in conn.execute("select name from sqlite_master where type = 'table'")}
+    conn.close()
+    assert "ad_build_manifest" not in tables
+
+    # a database changed after the build no longer matches its manifest, it is rebuilt
+    shutil.copy(db, tmp_path / "copy.sqlite")
+    conn = sqlite3.connect(tmp_path / "copy.sqlite")
+    conn.execute("delete from ad_build")
+    conn.commit()
+    conn.close()
+    shutil.copy(db.with_name("db.sqlite.manifest"), tmp_path / "copy.sqlite.manifest")
+    lines = build(data_src, tmp_path / "copy.sqlite", incremental=True)
+    assert "No manifest found in the sqlite database" in lines
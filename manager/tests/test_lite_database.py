@@ -0,0 +1,53 @@
+import sqlite3
+
+from manager import yaml_io
+from manager.converter_to_sqlite import ConverterToSqlite
+from manager.synthetic_data_src import SyntheticDataSrc
+
+
+class Logger():
+    def log(self, text):
+        pass
+
+
+def test_lite_database(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data_src = tmp_path / "data-src"
+    SyntheticDataSrc(data_src, scale=0.005, codes_per_ecu=4).generate()
+
+    # a DTC without a code is loaded in the full database and left out of the lite one
+    codeless = sorted(data_src.glob("ecu/*/*/codes/*.yml"))[0]
+    data = yaml_io.read_yaml(codeless)
+    del data["code"]
+    yaml_io.write_yaml(codeless, data)
+
+    db = tmp_path / "full.sqlite"
+    lite_db = tmp_path / "lite.sqlite"
+    converter = ConverterToSqlite(data_src, db, logger=Logger(), jobs=1, cache_dir=None, lite_db=lite_db)
+    assert converter.to_sqlite(lambda current, total: None)
+
+    conn = sqlite3.connect(lite_db)
+    conn.execute("attach database ? as full", (str(db),))
+    assert conn.execute("select count(*) from full.ad_dtc where code is null").fetchone()[0] == 1
+
+    full = conn.execute("""
+        select m.name, e.model, d.code, nullif(d.definition, ''), nullif(d.description, ''), d.mil
+        from full.ad_dtc d
+        join full.ad_ecu e on e.id = d.ecu_id
+        join full.ad_manufacturer m on m.id = e.manufacturer_id
+        where d.code is not null
+        order by 1, 2, 3
+    """).fetchall()
+    lite = conn.execute("""
+        select m.name, e.model, d.code, def.text, des.text, d.mil
+        from ad_dtc d
+        join ad_ecu e on e.id = d.ecu_id
+        join ad_manufacturer m on m.id = e.manufacturer_id
+        left join ad_text def on def.id = d.definition_id
+        left join ad_text des on des.id = d.description_id
+        order by 1, 2, 3
+    """).fetchall()
+    conn.close()
+
+    assert full
+    assert lite == full
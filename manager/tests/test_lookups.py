@@ -0,0 +1,193 @@
+import sqlite3
+
+import pytest
+
+from manager import yaml_io
+from manager.converter_to_sqlite import (
+    ConverterToSqlite,
+    _fast_timestamp,
+    _parse_timestamp,
+    key_filter,
+    timestamp,
+)
+from manager.benchmark_timestamp import OTHER_SHAPES, legacy_timestamp
+from manager.identity_map import IdentityMap, like_key
+from manager.synthetic_data_src import SyntheticDataSrc
+from manager.tab.import_vehicle import slug
+
+NAMES = [
+    "Bosch", "BOSCH", "bosch", "Bosch Rexroth", "Bosch-Rexroth", "Bosch_Rexroth", "BoschXRexroth",
+    "Bosci", "Bosc", "50% Motors", "50%% Motors", "50__Motors", "5000 Motors",
+    "_Leading", " Leading", "xLeading", "Mercedes-Benz", "Mercedes Benz", "a.b", "a/b",
+]
+
+
+class Logger():
+    def log(self, text):
+        pass
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("create table t(id integer primary key, name text, name_key text)")
+    conn.execute("create index t_key on t(name_key)")
+    conn.executemany("insert into t(name, name_key) values(?, lower(?))", [(name, name) for name in NAMES])
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def converter(tmp_path):
+    converter = ConverterToSqlite(tmp_path, tmp_path / "db.sqlite", logger=Logger(), jobs=1, cache_dir=None)
+    conn = sqlite3.connect(":memory:")
+    converter._create_schema(conn)
+    converter._reset_dtc_writer(conn)
+    yield converter, conn
+    conn.close()
+
+
+@pytest.mark.parametrize("value", NAMES + ["bosch rexroth", "BOSCH?REXROTH", "50% motors", "Bos", "", "Z"])
+def test_key_filter_matches_like(conn, value):
+    where, params = key_filter("name_key", value)
+    found = conn.execute(f"select id from t indexed by t_key where {where} order by id", params).fetchall()
+    expected = conn.execute("select id from t where lower(name) like lower(?) order by id", (slug(value),)).fetchall()
+    assert found == expected
+
+
+def test_key_filter_query(conn):
+    assert key_filter("name_key", "Bosch") == ("name_key = ?", ("bosch",))
+    # '%' is slugged to '_', a wildcard for one character and never one for many
+    assert key_filter("name_key", "50% Motors") == (
+        "name_key >= ? and name_key < ? and name_key LIKE ?", ("50", "51", "50__motors"),
+    )
+    assert key_filter("name_key", "_Leading") == ("name_key LIKE ?", ("_leading",))
+
+    for value in ("Bosch", "Bosch Rexroth"):
+        where, params = key_filter("name_key", value)
+        plan = " ".join(row[3] for row in conn.execute(
+            f"explain query plan select id from t indexed by t_key where {where}", params,
+        ))
+        assert "INDEX t_key (name_key" in plan
+
+
+def test_get_or_insert(converter):
+    converter, conn = converter
+
+    bosch = converter._get_or_insert(conn, "ad_manufacturer", "name", "Bosch Rexroth", True, True)
+    assert converter._get_or_insert(conn, "ad_manufacturer", "name", "BOSCH REXROTH", True, True) == bosch
+    assert converter._get_or_insert(conn, "ad_manufacturer", "name", "bosch_rexroth", True, True) == bosch
+
+    # another row matching the same pattern, the first inserted one keeps winning
+    hyphen = converter._get_or_insert(conn, "ad_manufacturer", "name", "Bosch-Rexroth", True, True)
+    assert hyphen != bosch
+    converter._ids.clear()
+    assert converter._get_or_insert(conn, "ad_manufacturer", "name", "Bosch Rexroth", True, True) == bosch
+
+    motors = converter._get_or_insert(conn, "ad_manufacturer", "name", "50% Motors", True, True)
+    assert converter._get_or_insert(conn, "ad_manufacturer", "name", "50%_motors", True, True) == motors
+    assert converter._get_or_insert(conn, "ad_manufacturer", "name", "50% Motor", True, True) != motors
+
+    assert conn.execute("select name, name_key from ad_manufacturer order by id").fetchall() == [
+        ("Bosch Rexroth", "bosch rexroth"),
+        ("Bosch-Rexroth", "bosch-rexroth"),
+        ("50% Motors", "50% motors"),
+        ("50% Motor", "50% motor"),
+    ]
+
+
+def test_ecu_lookup(converter):
+    converter, conn = converter
+
+    ecu = converter._get_or_insert_ecu(conn, "Bosch", "EDC17 C46")
+    assert converter._get_or_insert_ecu(conn, "BOSCH", "edc17_c46") == ecu
+    assert converter._get_or_insert_ecu(conn, "Bosch", "EDC17C46") != ecu
+    assert conn.execute("select count(*) from ad_manufacturer").fetchone()[0] == 1
+
+
+def test_identity_map_like_keys(conn):
+    ids = IdentityMap()
+    key = like_key(slug("Bosch Rexroth"))
+    ids.add("t", key, 1)
+    ids.add("t", "Bosch", 2)
+    assert ids.get("t", key) == 1
+
+    # an inserted row matched by a cached pattern could be the one the database now returns
+    ids.inserted("t", "Bosch")
+    assert ids.get("t", key) == 1
+    ids.inserted("t", "BOSCH-REXROTH")
+    assert ids.get("t", key) is None
+    assert ids.get("t", "Bosch") == 2
+
+    # the patterns forget exactly the values sqlite LIKE matches
+    ids = IdentityMap()
+    for pattern in NAMES:
+        pattern = slug(pattern).lower()
+        for name in NAMES:
+            matched = conn.execute("select ? like ?", (name, pattern)).fetchone()[0]
+            assert bool(ids._pattern(pattern).fullmatch(name)) == bool(matched), (pattern, name)
+
+
+def test_related_codes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data_src = tmp_path / "data-src"
+    SyntheticDataSrc(data_src, scale=0.005, codes_per_ecu=4).generate()
+
+    first, *others = sorted(data_src.glob("ecu/*/*/codes/*.yml"))
+    same_ecu = [path for path in others if path.parent == first.parent]
+    other_ecu = next(path for path in others if path.parent != first.parent)
+    codes = [yaml_io.read_yaml(path)["code"] for path in same_ecu]
+    other_code = yaml_io.read_yaml(other_ecu)["code"]
+    assert other_code not in codes
+
+    data = yaml_io.read_yaml(first)
+    # codes sorting after this one, a duplicate, a missing one and one of another ECU
+    data["related_code"] = codes + [codes[0], "P9999", other_code]
+    yaml_io.write_yaml(first, data)
+    for path in same_ecu + [other_ecu]:
+        data = yaml_io.read_yaml(path)
+        data["related_code"] = []
+        yaml_io.write_yaml(path, data)
+
+    db = tmp_path / "db.sqlite"
+    converter = ConverterToSqlite(data_src, db, logger=Logger(), jobs=1, cache_dir=None)
+    assert converter.to_sqlite(lambda current, total: None)
+
+    conn = sqlite3.connect(db)
+    related = conn.execute("""
+        select x.code
+        from ad_dtc_related l
+        join ad_dtc d on d.id = l.dtc_id
+        join ad_dtc x on x.id = l.related_dtc_id
+        join ad_ecu e on e.id = d.ecu_id
+        where d.code = ? and e.model = ?
+        order by l.rowid
+    """, (yaml_io.read_yaml(first)["code"], yaml_io.read_yaml(first.parent.parent / "def.yml")["model"])).fetchall()
+    conn.close()
+    assert [code for code, in related] == codes + [codes[0]]
+
+
+def test_timestamp_cache():
+    for ts in OTHER_SHAPES + ["2026-07-17 23:08:21 CEST", "2026-01-05 08:00:00 PST"]:
+        try:
+            expected = legacy_timestamp(ts)
+        except ValueError:
+            with pytest.raises(ValueError):
+                timestamp(ts)
+            continue
+        assert timestamp(ts) == expected
+        assert timestamp(ts) == expected
+        fast = _fast_timestamp(ts.strip())
+        assert fast is None or fast == expected
+
+    _parse_timestamp.cache_clear()
+    timestamp("2026-07-17 23:08:21 CEST")
+    timestamp("2026-07-17 23:08:21 CEST")
+    info = _parse_timestamp.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+    # errors are not cached, the value is parsed again and raises again
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            timestamp("not a date")
+    assert _parse_timestamp.cache_info().misses == 3
+    assert timestamp(123) == 123
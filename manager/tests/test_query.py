@@ -0,0 +1,28 @@
+import sqlite3
+
+from manager.converter_to_sqlite import ConverterToSqlite
+from manager.synthetic_data_src import SyntheticDataSrc
+from manager.tab.query import joined_dtcs, text_filter
+
+
+def test_joined_rows_match_flat(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data_src = tmp_path / "data-src"
+    SyntheticDataSrc(data_src, scale=0.005, codes_per_ecu=4).generate()
+    db = tmp_path / "db.sqlite"
+    assert ConverterToSqlite(data_src, db, jobs=1, cache_dir=None, logger=None).to_sqlite(lambda current, total: None)
+
+    conn = sqlite3.connect(db)
+    conn.row_factory = sqlite3.Row
+    flat = [dict(row) for row in conn.execute("select * from ad_dtc_flat order by dtc_id")]
+    joined = [dict(row) for row in conn.execute(joined_dtcs("1 = 1"))]
+    assert joined == flat
+
+    code = flat[0]["code_key"]
+    rows = conn.execute(f"select * from ({joined_dtcs('upper(d.code) = :code')})", {"code": code}).fetchall()
+    assert [dict(row) for row in rows] == [row for row in flat if row["code_key"] == code]
+
+    word = flat[0]["definition"].split()[0]
+    rows = conn.execute(joined_dtcs(text_filter(1, "d.", " and ")), {"word0": f"%{word}%"}).fetchall()
+    assert flat[0]["dtc_id"] in [row["dtc_id"] for row in rows]
+    conn.close()
@@ -0,0 +1,72 @@
+import sqlite3
+
+import pytest
+
+from manager import yaml_io
+from manager.converter_to_sqlite import ConverterToSqlite
+from manager.synthetic_data_src import SyntheticDataSrc
+
+
+class Logger():
+    def log(self, text):
+        pass
+
+
+def build(data_src, db, **kwargs):
+    converter = ConverterToSqlite(data_src, db, logger=Logger(), cache_dir=None, **kwargs)
+    return converter.to_sqlite(lambda current, total: None)
+
+
+def dump(db):
+    """
+    DTC rows by id, the DTC ids of both builds are the same. Evidence is compared by
+    text, a sharded build inserts the evidence of the ECUs before the one of the DTCs.
+    """
+    conn = sqlite3.connect(db)
+    try:
+        rows = {
+            table: conn.execute(f"select * from {table} order by 1, 2").fetchall()
+            for table in (
+                "ad_dtc", "ad_dtc_flat", "ad_dtc_related",
+                "ad_dtc_standard_link", "ad_dtc_system_link", "ad_dtc_category_link",
+            )
+        }
+        rows["ad_dtc_evidence"] = conn.execute("""
+            select l.dtc_id, e.text
+            from ad_dtc_evidence l
+            join ad_evidence e on e.id = l.evidence_id
+            order by 1, 2
+        """).fetchall()
+        return rows
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def data_src(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data_src = tmp_path / "data-src"
+    SyntheticDataSrc(data_src, scale=0.005, codes_per_ecu=4).generate()
+    return data_src
+
+
+def test_sharded_matches_sequential(tmp_path, data_src):
+    assert build(data_src, tmp_path / "sequential.sqlite", jobs=1)
+    assert build(data_src, tmp_path / "sharded.sqlite", jobs=2, sharded=True)
+
+    sequential = dump(tmp_path / "sequential.sqlite")
+    assert sequential["ad_dtc"]
+    assert dump(tmp_path / "sharded.sqlite") == sequential
+
+
+def test_sharded_duplicate_code(tmp_path, data_src):
+    first, second = sorted(data_src.glob("ecu/*/*/codes/*.yml"))[:2]
+    assert first.parent == second.parent
+    data = yaml_io.read_yaml(second)
+    data["code"] = yaml_io.read_yaml(first)["code"]
+    yaml_io.write_yaml(second, data)
+
+    with pytest.raises(sqlite3.IntegrityError):
+        build(data_src, tmp_path / "sequential.sqlite", jobs=1, validate=False)
+    with pytest.raises(sqlite3.IntegrityError, match=second.name):
+        build(data_src, tmp_path / "sharded.sqlite", jobs=2, sharded=True, validate=False)
@@ -0,0 +1,35 @@
+import sqlite3
+
+from manager.stage_profiler import StageProfiler
+
+
+def test_rows_written_per_stage():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("create table a(x)")
+    conn.execute("create temp table t(x)")
+    profiler = StageProfiler()
+    profiler.trace(conn)
+
+    with profiler.stage("load"):
+        conn.executemany("insert into a values(?)", [(1,), (2,), (3,)])
+        conn.execute("insert into temp.t select x from a")
+    with profiler.stage("rebuild"):
+        # same count(*) before and after, still 6 rows written
+        conn.execute("delete from a")
+        conn.execute('insert into main."a" values(1), (2), (3)')
+        conn.commit()
+    conn.close()
+
+    assert [stage["rows"] for stage in profiler.stages] == [{"a": 3}, {"a": 6}]
+    assert profiler.stages[0]["statements"] == 5
+
+
+def test_counters():
+    profiler = StageProfiler()
+    with profiler.stage("validate"):
+        profiler.count("files read", 2)
+        profiler.count("yaml bytes", 1000)
+
+    assert profiler.stages[0]["files read"] == 2
+    assert profiler.stages[0]["yaml bytes"] == 1000
+    assert profiler.stages[0]["rows"] == {}
@@ -0,0 +1,108 @@
+import sqlite3
+
+import pytest
+
+from manager import yaml_io
+from manager.converter_to_sqlite import ConverterToSqlite, check_source_data
+from manager.synthetic_data_src import SyntheticDataSrc
+
+
+class Logger():
+    def __init__(self):
+        self.lines = []
+
+    def log(self, text):
+        self.lines.append(text)
+
+
+@pytest.fixture
+def data_src(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data_src = tmp_path / "data-src"
+    SyntheticDataSrc(data_src, scale=0.005, codes_per_ecu=4).generate()
+    return data_src
+
+
+def converter(data_src, db, logger=None):
+    return ConverterToSqlite(data_src, db, logger=logger or Logger(), jobs=1, cache_dir=None, validate=True)
+
+
+def edit(path, **fields):
+    data = yaml_io.read_yaml(path)
+    data.update(fields)
+    yaml_io.write_yaml(path, data)
+
+
+def first_version(data_src):
+    return sorted(data_src.glob("vehicle/*/*/versions/*/*.yml"))[0]
+
+
+def test_valid_tree(data_src):
+    assert converter(data_src, "db.sqlite")._validate_source() == []
+
+
+def test_reference_case(tmp_path, data_src):
+    version = first_version(data_src)
+    data = yaml_io.read_yaml(version)
+    config = next(iter(data["config"][0].values()))
+    ecu = config["ecu"]["ECM"]
+    model = ecu["model"]
+    ecu["model"] = model.upper()
+    config["engine"] = config["engine"].lower()
+    yaml_io.write_yaml(version, data)
+
+    db = tmp_path / "db.sqlite"
+    assert converter(data_src, db)._validate_source() == []
+    assert converter(data_src, db).to_sqlite(lambda current, total: None)
+
+    # the configs are linked to the same ECU and engine as before
+    manufacturer, name = model.split("/")
+    conn = sqlite3.connect(db)
+    linked = conn.execute("""
+        select count(*)
+        from ad_vehicle_version_config_ecu ce
+        join ad_ecu e on e.id = ce.ecu_id
+        where e.model = ?
+    """, (name,)).fetchone()[0]
+    engines = conn.execute("select count(*) from ad_engine").fetchone()[0]
+    conn.close()
+    assert linked
+    assert engines == len(list(data_src.glob("engine/*/*/def.yml")))
+
+
+def test_problems(tmp_path, data_src):
+    version = first_version(data_src)
+    data = yaml_io.read_yaml(version)
+    next(iter(data["config"][0].values()))["ecu"]["ECM"]["model"] = "ECU_Maker_000/MISSING"
+    yaml_io.write_yaml(version, data)
+
+    first, second, third = sorted(data_src.glob("ecu/*/*/codes/*.yml"))[:3]
+    edit(first, created="yesterday")
+    edit(second, code=yaml_io.read_yaml(third)["code"])
+    broken = next(data_src.glob("ecu/*/*/def.yml")).parent / "codes" / "broken.yml"
+    broken.write_text("code: [", encoding="utf-8")
+
+    relative = lambda path: path.relative_to(data_src).as_posix()
+    logger = Logger()
+    db = tmp_path / "db.sqlite"
+    assert not converter(data_src, db, logger).to_sqlite(lambda current, total: None)
+    assert not db.exists()
+
+    problems = [line for line in logger.lines if line.split(":")[0].endswith(".yml")]
+    # the wording of a YAML error depends on the parser
+    assert [line for line in problems if line.startswith(f"{relative(broken)}: invalid YAML, ")]
+    assert sorted(line for line in problems if not line.startswith(relative(broken))) == sorted([
+        f"{relative(version)}: config.config1.ecu.ECM.model: ECU_Maker_000/MISSING not found, no ecu/ECU_Maker_000/MISSING/def.yml",
+        f"{relative(first)}: created: not a timestamp: 'yesterday'",
+        f"{relative(third)}: code {yaml_io.read_yaml(third)['code']} already defined by {relative(second)}",
+    ])
+    assert f"{len(problems)} problems found in {data_src}, nothing was written" in logger.lines
+
+
+def test_check_source_data():
+    assert check_source_data("dtc", {"code": "P0001", "causes": ["a"], "mil": True}) == ([], [], "P0001")
+    assert check_source_data("dtc", ["P0001"]) == (["expected a mapping, got list"], [], None)
+    assert check_source_data("ecu", {"model": "X", "mcu": "Maker/M1"}) == ([], [("mcu", "Maker/M1", "mcu")], None)
+
+    problems, _, _ = check_source_data("engine", {"code": ["E1"], "name": [1]})
+    assert problems == ["code: expected a text, got ['E1']", "name: expected texts, got 1"]
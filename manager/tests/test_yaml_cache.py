@@ -0,0 +1,58 @@
+from manager import yaml_io
+from manager.yaml_cache import YamlCache
+
+
+def test_read_after_write(tmp_path):
+    path = tmp_path / "def.yml"
+    yaml_io.write_yaml(path, {"evidence": {"source": ["e1"]}})
+    cache = YamlCache(root=tmp_path)
+
+    # two rows of an import editing the same file
+    for source in ("e2", "e3"):
+        data = cache.read(path)
+        data["evidence"]["source"].append(source)
+        cache.write(path, data)
+
+    assert cache.read(path)["evidence"]["source"] == ["e1", "e2", "e3"]
+    assert yaml_io.read_yaml(path)["evidence"]["source"] == ["e1", "e2", "e3"]
+
+
+def test_write_survives_save(tmp_path):
+    root = tmp_path / "data-src"
+    path = root / "def.yml"
+    yaml_io.write_yaml(path, {"model": "old"})
+
+    cache = YamlCache.for_tree(tmp_path / "cache", root)
+    assert cache.read(path) == {"model": "old"}
+    cache.write(path, {"model": "new"})
+    cache.save()
+
+    cache = YamlCache.for_tree(tmp_path / "cache", root)
+    assert cache.read(path) == {"model": "new"}
+
+
+def test_forget(tmp_path):
+    path = tmp_path / "def.yml"
+    yaml_io.write_yaml(path, {"model": "old"})
+    cache = YamlCache(root=tmp_path)
+    cache.read(path)
+
+    yaml_io.write_yaml(path, {"model": "new"})
+    cache.forget(path)
+
+    assert cache.read(path) == {"model": "new"}
+
+
+def test_edit_between_runs(tmp_path):
+    root = tmp_path / "data-src"
+    path = root / "def.yml"
+    yaml_io.write_yaml(path, {"model": "old"})
+
+    cache = YamlCache.for_tree(tmp_path / "cache", root)
+    cache.read(path)
+    cache.save()
+
+    # edited by hand between two import runs, each run opens the cache again
+    yaml_io.write_yaml(path, {"model": "new"})
+    cache = YamlCache.for_tree(tmp_path / "cache", root)
+    assert cache.read(path) == {"model": "new"}
@@ -0,0 +1,78 @@
+import datetime
+import random
+from pathlib import Path
+
+import pytest
+import yaml
+
+from manager import yaml_io
+
+DATA_SRC = Path(__file__).resolve().parents[2] / "data-src"
+SAMPLE_SIZE = 150
+
+# scalars the two loaders must resolve alike: dates, timestamps and strings looking like numbers
+SCALARS = """
+date: 2024-03-01
+timestamp: 2024-03-01 10:20:30
+timestamp_utc: 2024-03-01T10:20:30Z
+timestamp_offset: 2024-03-01 10:20:30.5 +02:00
+timestamp_zone: 2024-03-01 10:20:30 CEST
+year: 2004
+years: 2004-2008
+version: 1.10
+octal_like: 0123
+hex: 0x1F
+exponent: 1e3
+float_exponent: 1.0e3
+underscored: 1_000
+sexagesimal: 1:20
+code: P0101
+uds: 0x0F4231
+power: 85.5
+booleans: [yes, no, on, off, true, False]
+nulls: [~, null, ""]
+infinity: .inf
+quoted: "0123"
+"""
+
+pytestmark = pytest.mark.skipif(not yaml_io.WITH_LIBYAML, reason="PyYAML built without libyaml")
+
+
+def both(text):
+    return yaml.load(text, Loader=yaml.SafeLoader), yaml.load(text, Loader=yaml.CSafeLoader)
+
+
+def test_scalars():
+    python, libyaml = both(SCALARS)
+    assert repr(python) == repr(libyaml)
+    assert isinstance(libyaml["date"], datetime.date)
+    assert isinstance(libyaml["timestamp_utc"], datetime.datetime)
+    assert libyaml["octal_like"] == 83
+    assert libyaml["sexagesimal"] == 80
+    assert libyaml["timestamp_zone"] == "2024-03-01 10:20:30 CEST"
+    assert yaml_io.load(SCALARS) == libyaml
+
+
+def test_dump():
+    data = yaml.load(SCALARS, Loader=yaml.SafeLoader)
+    python = yaml.dump(data, Dumper=yaml.SafeDumper, **yaml_io.DUMP_OPTIONS)
+    libyaml = yaml.dump(data, Dumper=yaml.CSafeDumper, **yaml_io.DUMP_OPTIONS)
+    assert python == libyaml
+    assert yaml_io.dump(data) == libyaml
+    assert yaml_io.load(libyaml) == data
+
+
+@pytest.mark.skipif(not DATA_SRC.is_dir(), reason="no data-src next to the manager")
+def test_data_src_sample():
+    rng = random.Random(0)
+    sample = []
+    # timestamps are written as "2026-07-09 17:38:11 CEST" strings, powers as numbers, years quoted
+    for kind in ("mcu", "ecu", "engine", "vehicle"):
+        paths = sorted((DATA_SRC / kind).rglob("*.yml"))
+        sample += rng.sample(paths, min(SAMPLE_SIZE, len(paths)))
+    assert sample
+
+    for path in sample:
+        text = path.read_text(encoding="utf-8")
+        python, libyaml = both(text)
+        assert repr(python) == repr(libyaml), path